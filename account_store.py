@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+SQLite 账号库：账号、设置和保活历史存放在一个数据库文件中
+
+与 accounts_config.json 相比，状态变更只更新一行，不再整体重写；
+账号表按 enabled/status/last_keepalive 建索引，历史表每次尝试追加一行，按账号和时间建索引。
+load_config/save_config 使用与 JSON 配置相同的结构，可以互相导入导出。
+
+用法:
+  python account_store.py import accounts_config.json accounts.db
+  python account_store.py export accounts.db accounts_config.json
+"""
+import json
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from config_store import atomic_write_json
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    id             INTEGER PRIMARY KEY,
+    name           TEXT NOT NULL,
+    account        TEXT NOT NULL,
+    password       TEXT NOT NULL,
+    enabled        INTEGER NOT NULL DEFAULT 1,
+    status         TEXT NOT NULL DEFAULT '未运行',
+    last_keepalive TEXT NOT NULL DEFAULT '',
+    extra          TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS idx_accounts_enabled ON accounts(enabled);
+CREATE INDEX IF NOT EXISTS idx_accounts_status ON accounts(status);
+CREATE INDEX IF NOT EXISTS idx_accounts_last_keepalive ON accounts(last_keepalive);
+
+CREATE TABLE IF NOT EXISTS config_sections (
+    section TEXT PRIMARY KEY,
+    value   TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS run_history (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    account_id    INTEGER NOT NULL,
+    attempt       INTEGER NOT NULL,
+    success       INTEGER NOT NULL,
+    failure_class TEXT,
+    message       TEXT,
+    duration      REAL,
+    finished_at   TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_history_account ON run_history(account_id, finished_at);
+CREATE INDEX IF NOT EXISTS idx_history_time ON run_history(finished_at);
+"""
+
+ACCOUNT_FIELDS = ('id', 'name', 'account', 'password', 'enabled', 'status', 'last_keepalive')
+
+
+def is_store_path(path):
+    """按扩展名判断配置文件是否为 SQLite 账号库"""
+    return str(path).lower().endswith(('.db', '.sqlite', '.sqlite3'))
+
+
+class AccountStore:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    def query(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    @staticmethod
+    def row_to_account(row):
+        account = json.loads(row['extra'])
+        account.update({key: row[key] for key in ACCOUNT_FIELDS})
+        account['enabled'] = bool(account['enabled'])
+        return account
+
+    @staticmethod
+    def account_to_row(account):
+        extra = {key: value for key, value in account.items() if key not in ACCOUNT_FIELDS}
+        return (account['id'], account['name'], account['account'], account['password'],
+                1 if account.get('enabled', True) else 0, account.get('status', '未运行'),
+                account.get('last_keepalive', ''), json.dumps(extra, ensure_ascii=False))
+
+    def is_empty(self):
+        return not self.query("SELECT 1 FROM config_sections LIMIT 1")
+
+    # ---- 与 JSON 配置相同结构的整体读写 ----
+
+    def load_config(self):
+        """读出与 accounts_config.json 相同结构的配置"""
+        config = {'accounts': [self.row_to_account(row) for row in self.query("SELECT * FROM accounts ORDER BY id")]}
+        for section, value in self.query("SELECT section, value FROM config_sections"):
+            config[section] = json.loads(value)
+        return config
+
+    def save_config(self, config):
+        """整体写入配置：账号按 id 更新，配置中已不存在的账号删除"""
+        with self.transaction() as cur:
+            for section, value in config.items():
+                if section != 'accounts':
+                    cur.execute("INSERT OR REPLACE INTO config_sections (section, value) VALUES (?, ?)",
+                                (section, json.dumps(value, ensure_ascii=False)))
+            accounts = config.get('accounts', [])
+            cur.executemany("INSERT OR REPLACE INTO accounts (id, name, account, password, enabled, status, "
+                            "last_keepalive, extra) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            [self.account_to_row(account) for account in accounts])
+            ids = [account['id'] for account in accounts]
+            if ids:
+                cur.execute(f"DELETE FROM accounts WHERE id NOT IN ({','.join('?' * len(ids))})", ids)
+            else:
+                cur.execute("DELETE FROM accounts")
+
+    # ---- 单行操作 ----
+
+    def add_account(self, account):
+        with self.transaction() as cur:
+            cur.execute("INSERT INTO accounts (id, name, account, password, enabled, status, last_keepalive, extra) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self.account_to_row(account))
+
+    def remove_account(self, account_id):
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
+            return cur.rowcount == 1
+
+    def update_status(self, account_id, status, last_keepalive=None):
+        with self.transaction() as cur:
+            if last_keepalive:
+                cur.execute("UPDATE accounts SET status = ?, last_keepalive = ? WHERE id = ?",
+                            (status, last_keepalive, account_id))
+            else:
+                cur.execute("UPDATE accounts SET status = ? WHERE id = ?", (status, account_id))
+
+    def get_account(self, account_id):
+        rows = self.query("SELECT * FROM accounts WHERE id = ?", (account_id,))
+        return self.row_to_account(rows[0]) if rows else None
+
+    def get_enabled_accounts(self):
+        return [self.row_to_account(row) for row in self.query("SELECT * FROM accounts WHERE enabled = 1 ORDER BY id")]
+
+    def find_by_status(self, status):
+        return [self.row_to_account(row) for row in self.query("SELECT * FROM accounts WHERE status = ? ORDER BY id", (status,))]
+
+    def stale_accounts(self, before):
+        """last_keepalive 早于 before（"%Y-%m-%d %H:%M:%S"）或从未保活的启用账号"""
+        return [self.row_to_account(row) for row in self.query(
+            "SELECT * FROM accounts WHERE enabled = 1 AND last_keepalive < ? ORDER BY last_keepalive", (before,))]
+
+    # ---- 保活历史 ----
+
+    def append_history(self, record):
+        """追加一条尝试记录（字段同 ImprovedAccountManager.attempt_history）"""
+        with self.transaction() as cur:
+            cur.execute("INSERT INTO run_history (account_id, attempt, success, failure_class, message, duration, "
+                        "finished_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (record['account_id'], record['attempt'], 1 if record['success'] else 0,
+                         record['failure_class'], record['message'], record['duration'], record['finished_at']))
+
+    def get_history(self, account_id=None, since=None, limit=100):
+        """按时间倒序查询历史，可按账号和起始时间过滤"""
+        where, params = [], []
+        if account_id is not None:
+            where.append("account_id = ?")
+            params.append(account_id)
+        if since:
+            where.append("finished_at >= ?")
+            params.append(since)
+        sql = "SELECT * FROM run_history"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY finished_at DESC, id DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self.query(sql, params)]
+
+    def prune_history(self, keep_days):
+        """删除 keep_days 天以前的历史，返回删除的行数"""
+        cutoff = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d %H:%M:%S")
+        with self.transaction() as cur:
+            cur.execute("DELETE FROM run_history WHERE finished_at < ?", (cutoff,))
+            return cur.rowcount
+
+    # ---- JSON 导入导出 ----
+
+    def import_json(self, json_path):
+        with open(json_path, 'r', encoding='utf-8') as f:
+            self.save_config(json.load(f))
+
+    def export_json(self, json_path):
+        atomic_write_json(json_path, self.load_config())
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] not in ('import', 'export'):
+        print('Usage: python account_store.py import <config.json> <accounts.db>\n'
+              '       python account_store.py export <accounts.db> <config.json>')
+        sys.exit(1)
+    if sys.argv[1] == 'import':
+        store = AccountStore(sys.argv[3])
+        store.import_json(sys.argv[2])
+    else:
+        store = AccountStore(sys.argv[2])
+        store.export_json(sys.argv[3])
+    print(f"已{'导入' if sys.argv[1] == 'import' else '导出'} {len(store.load_config()['accounts'])} 个账号")
+    store.close()
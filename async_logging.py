@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+后台日志：调用方只把日志记录放入有界队列，由监听线程写文件、控制台并调用界面回调
+
+保活线程不再等待磁盘和界面回调。队列满时按 overflow 处理：
+drop 直接丢弃并计数；block 最多等待 block_seconds，仍然满时再丢弃。
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+import metrics
+
+
+class BoundedQueueHandler(QueueHandler):
+    """放入有界队列的日志处理器，队列满时丢弃或短暂阻塞"""
+    def __init__(self, log_queue, overflow='drop', block_seconds=1.0):
+        super().__init__(log_queue)
+        self.overflow = overflow
+        self.block_seconds = block_seconds
+        self.dropped = 0
+        self.queued = 0
+
+    def enqueue(self, record):
+        try:
+            if self.overflow == 'block':
+                self.queue.put(record, timeout=self.block_seconds)
+            else:
+                self.queue.put_nowait(record)
+            self.queued += 1
+        except queue.Full:
+            self.dropped += 1
+            metrics.LOG_DROPPED_TOTAL.inc()
+
+
+class TimedQueueListener(QueueListener):
+    """统计每条日志在各处理器中花费的时间"""
+    def __init__(self, log_queue, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.handled = 0
+        self.handle_seconds = 0.0
+
+    def enqueue_sentinel(self):
+        # 队列满时等待监听线程腾出位置，不能像普通日志一样丢弃
+        self.queue.put(self._sentinel)
+
+    def handle(self, record):
+        start = time.perf_counter()
+        super().handle(record)
+        elapsed = time.perf_counter() - start
+        self.handled += 1
+        self.handle_seconds += elapsed
+        metrics.LOG_HANDLER_SECONDS.observe(elapsed)
+
+
+class CallbackHandler(logging.Handler):
+    """
+    在监听线程中调用回调函数 callback(message, account)，只处理带 notify 标记的记录(notify_log 发出的日志)
+    account 取自记录的 account 字段(extra={'account': ...})，没有时为 None
+    """
+    def __init__(self, callbacks):
+        super().__init__()
+        self.callbacks = callbacks
+
+    def emit(self, record):
+        if not getattr(record, 'notify', False):
+            return
+        message = self.format(record)
+        account = getattr(record, 'account', None)
+        for callback in list(self.callbacks):
+            try:
+                callback(message, account)
+            except Exception as e:
+                print(f"Log callback error: {e}")
+                print(f"Message: {message}")
+
+
+class AsyncLogging:
+    """把 logger 上的处理器移到后台监听线程"""
+    def __init__(self, logger, handlers, max_queue=10000, overflow='drop', block_seconds=1.0):
+        self.logger = logger
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.handler = BoundedQueueHandler(self.queue, overflow, block_seconds)
+        self.listener = TimedQueueListener(self.queue, *handlers)
+        self.lock = threading.Lock()
+        self.stopped = False
+        for handler in logger.handlers[:]:
+            logger.removeHandler(handler)
+        logger.addHandler(self.handler)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def get_stats(self):
+        listener = self.listener
+        return {
+            'queued': self.handler.queued,
+            'dropped': self.handler.dropped,
+            'pending': self.queue.qsize(),
+            'handled': listener.handled,
+            'avg_handle_ms': round(listener.handle_seconds / listener.handled * 1000, 3) if listener.handled else 0.0,
+        }
+
+    def stop(self):
+        """写完队列中剩余的日志并停止监听线程"""
+        with self.lock:
+            if self.stopped:
+                return
+            self.stopped = True
+        self.logger.removeHandler(self.handler)
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+
+
+def install(logger, handlers, max_queue=10000, overflow='drop', block_seconds=1.0):
+    """为 logger 启用后台日志；同一 logger 再次调用时先停止之前的监听线程"""
+    previous = getattr(logger, '_async_logging', None)
+    if previous is not None:
+        previous.stop()
+    async_logging = AsyncLogging(logger, handlers, max_queue, overflow, block_seconds)
+    logger._async_logging = async_logging
+    return async_logging
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio 保活编排器：一个事件循环驱动多个账号的浏览器会话
+
+Selenium 调用本身是阻塞的，每次调用都放到一个小线程池中执行；
+保活步骤(ImprovedAccountManager.keepalive_steps)是步骤生成器，两次等待之间的 WebDriver 调用在线程池中执行，
+每次等待(登录跳转、验证码识别和网页输入、云桌面加载和停留)都由 AsyncStepWaiter 在事件循环中
+轮询条件并 await asyncio.sleep，等待期间不占用任何线程，因此少量线程即可同时推进大量账号。
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from selenium.common.exceptions import NoSuchElementException, StaleElementReferenceException, TimeoutException
+import metrics
+from wait_engine import advance_steps
+
+
+class AsyncStepWaiter:
+    """StepWaiter 的异步版本，完成步骤生成器 yield 的 Wait；超时配置、日志和等待记录沿用同步的 StepWaiter"""
+    def __init__(self, waiter, call, poll=0.5):
+        """
+        waiter: wait_engine.StepWaiter
+        call: 在线程池中执行一次阻塞调用的协程函数
+        poll: 条件轮询间隔(秒)
+        """
+        self.waiter = waiter
+        self.call = call
+        self.poll = poll
+
+    async def until(self, condition, step, timeout_key='element', timeout=None, required=True):
+        """异步等待 condition(driver) 返回真值，超时时 required=True 抛出 TimeoutException，否则返回 None"""
+        timeout = self.waiter.get_timeout(timeout_key, timeout)
+        start = time.perf_counter()
+        while True:
+            try:
+                result = await self.call(condition, self.waiter.driver)
+            except (NoSuchElementException, StaleElementReferenceException):
+                result = None
+            if result or time.perf_counter() - start >= timeout:
+                break
+            await asyncio.sleep(self.poll)
+        self.waiter.record(step, time.perf_counter() - start, bool(result), timeout)
+        if not result:
+            if required:
+                raise TimeoutException(f"等待超时: {step} ({timeout}秒)")
+            return None
+        return result
+
+    async def dwell(self, step, seconds):
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+            self.waiter.record(step, seconds, True, seconds)
+
+    async def result(self, future, timeout):
+        """等待 concurrent.futures.Future，超时抛出 TimeoutError；不取消 future，结果仍由提交方处理"""
+        loop = asyncio.get_running_loop()
+        done = asyncio.Event()
+
+        def wake(_):
+            try:
+                loop.call_soon_threadsafe(done.set)
+            except RuntimeError:
+                pass  # 事件循环已结束
+
+        future.add_done_callback(wake)
+        await asyncio.wait_for(done.wait(), timeout)
+        return future.result()
+
+
+class AsyncKeepaliveOrchestrator:
+    def __init__(self, manager, max_sessions=20, io_threads=4, poll=0.5):
+        """
+        manager: ImprovedAccountManager，沿用其状态/日志回调
+        max_sessions: 同时打开的浏览器会话上限
+        io_threads: 执行阻塞 WebDriver 调用的线程数
+        poll: 等待阶段的条件轮询间隔(秒)
+        """
+        self.manager = manager
+        self.max_sessions = max_sessions
+        self.io_threads = io_threads
+        self.poll = poll
+        self.executor = None
+        self.semaphore = None
+        self.policy = None
+
+    def run(self, accounts, policy=None):
+        """同步入口：在新的事件循环中执行一轮保活，返回 {账号名: (是否成功, 耗时)}"""
+        return asyncio.run(self.run_round(accounts, policy))
+
+    async def run_round(self, accounts, policy=None):
+        self.policy = policy
+        self.semaphore = asyncio.Semaphore(self.max_sessions)
+        self.executor = ThreadPoolExecutor(max_workers=self.io_threads, thread_name_prefix="keepalive-io")
+        try:
+            results = await asyncio.gather(*(self.keepalive_account(account) for account in accounts))
+        finally:
+            self.executor.shutdown(wait=False)
+        return {account['name']: result for account, result in zip(accounts, results)}
+
+    async def call(self, fn, *args):
+        """在线程池中执行一次阻塞调用"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+
+    async def run_steps(self, steps, waiter):
+        """wait_engine.run_steps 的异步版本：生成器在线程池中推进，yield 的 Wait 由 AsyncStepWaiter 在事件循环中完成"""
+        send, value = steps.send, None
+        while True:
+            done, wait = await self.call(advance_steps, send, value)
+            if done:
+                return wait
+            try:
+                send, value = steps.send, await getattr(waiter, wait.method)(*wait.args)
+            except Exception as e:
+                send, value = steps.throw, e
+
+    async def keepalive_account(self, account):
+        """单个账号的保活协程（含重试），返回 (是否成功, 各次尝试总耗时)"""
+        total = 0.0
+        attempt = 1
+        while True:
+            start = time.perf_counter()
+            ok, failure_class, message = await self.attempt_account(account)
+            duration = time.perf_counter() - start
+            total += duration
+            self.manager.record_account_result(account, ok, duration)
+            self.manager.record_attempt(account, attempt, ok, failure_class, message, duration)
+            if ok or self.policy is None:
+                return ok, total
+            delay = self.manager.plan_retry(self.policy, account, attempt, failure_class)
+            if delay is None:
+                return False, total
+            # 等待期间不占用会话名额
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def attempt_account(self, account):
+        """一次保活尝试，返回 (是否成功, 失败类别, 失败信息)"""
+        manager = self.manager
+        # HTTP 保活不占用浏览器会话名额，失败时再走浏览器
+        if manager.use_http_keepalive(account) and await self.call(manager.http_keepalive, account):
+            return True, None, ""
+        async with self.semaphore:
+            browser_start = time.perf_counter()
+            manager.begin_keepalive(account)
+            driver = None
+            healthy = False
+            failure_class, message = None, ""
+            state = {'used_cache': False}
+            try:
+                step_start = time.perf_counter()
+                driver = await self.call(manager.acquire_driver)
+                metrics.STEP_SECONDS.observe(time.perf_counter() - step_start, step='browser_launch')
+                waiter = manager.make_waiter(driver, account)
+
+                # 登录、验证码、进入云桌面和等待加载，等待期间不占用线程
+                await self.run_steps(manager.keepalive_steps(driver, account, waiter, state),
+                                     AsyncStepWaiter(waiter, self.call, self.poll))
+                await self.call(manager.finish_keepalive, driver, account, waiter)
+                healthy = True
+            except Exception as e:
+                failure_class, message = await self.call(manager.fail_keepalive, driver, account, e, state['used_cache'])
+            finally:
+                metrics.MODE_SECONDS.observe(time.perf_counter() - browser_start, mode='browser',
+                                             result='success' if healthy else 'failure')
+                if driver:
+                    try:
+                        await self.call(manager.release_driver, driver, healthy)
+                        manager.notify_log(f"[{account['name']}] 浏览器已释放", account=account)
+                    except Exception:
+                        pass
+            return healthy, failure_class, message
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+离线性能基准：在本地模拟门户上运行保活流程，输出吞吐量、耗时分位数和内存峰值
+
+用法:
+  python benchmark.py --accounts 6 --mode concurrent
+  python benchmark.py --target cli --accounts 2
+  python benchmark.py --accounts 20 --keepalive http
+  python benchmark.py --accounts 4 --browser-profile full   # 与默认 lean 比较页面加载时间和内存
+  python benchmark.py --accounts 6 --json result.json --baseline last.json --max-regression 0.2
+
+保活流程在临时工作目录中运行(logs/、static/ 截图和会话缓存都写在那里)，结束后删除；
+--workdir 指定目录时保留，便于查看截图和日志。
+"""
+import argparse
+import importlib.util
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import metrics
+from display_manager import get_display_stats
+from mock_portal import DEFAULT_OPTIONS, HTTP_API, MockPortalServer, add_option_arguments
+
+try:
+    import psutil
+    USE_PSUTIL = True
+except ImportError:
+    USE_PSUTIL = False
+
+
+class RssSampler:
+    """后台采样本进程及所有子进程(浏览器、驱动)的内存占用峰值"""
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def sample(self):
+        if USE_PSUTIL:
+            proc = psutil.Process()
+            total = proc.memory_info().rss
+            for child in proc.children(recursive=True):
+                try:
+                    total += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            return total
+        try:
+            import resource
+            # ru_maxrss 在 Linux 上单位为 KB
+            usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss + \
+                resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+            return usage * 1024
+        except ImportError:
+            return 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            self.peak = max(self.peak, self.sample())
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        self.peak = max(self.peak, self.sample())
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    """在 path 中运行保活流程，避免日志和截图写入仓库目录"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def bench_manager(args, portal_url, workdir):
+    """通过 ImprovedAccountManager 运行一轮保活"""
+    from improved_account_manager import ImprovedAccountManager
+    config = {
+        "accounts": [{"id": i, "name": f"bench{i}", "account": f"1380000{i:04d}", "password": "bench",
+                      "enabled": True, "last_keepalive": "", "status": "未运行"}
+                     for i in range(1, args.accounts + 1)],
+        "settings": {
+            "browser_type": args.browser, "browser_path": args.browser_path, "headless": True,
+            "portal_url": portal_url,
+            "sequential_mode": args.mode == 'sequential',
+            "async_mode": args.mode == 'async',
+            "concurrent_limit": args.concurrency,
+            "http_keepalive": args.keepalive == 'http',
+            "http_api": HTTP_API,
+            "browser_profile": args.browser_profile,
+            "session_cache_dir": os.path.join(workdir, "sessions"),
+        },
+        "schedule": {"enabled": False, "interval_minutes": 30, "start_time": "00:00",
+                     "end_time": "23:59", "weekend_enabled": True},
+    }
+    if args.dwell is not None:
+        config["settings"]["step_overrides"] = {"default": {"desktop_painted": {"dwell": args.dwell}}}
+    config_file = os.path.join(workdir, "bench_config.json")
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(config, f, ensure_ascii=False)
+    manager = ImprovedAccountManager(config_file)
+    durations = []
+    try:
+        for _ in range(args.rounds):
+            result = manager.run_keepalive()
+            if result:
+                durations.extend(result[1].values())
+    finally:
+        manager.shutdown()
+    return durations
+
+
+def bench_cli(args, portal_url):
+    """逐个账号调用 ctyun-alive.py 中的 keepalive_ctyun2"""
+    spec = importlib.util.spec_from_file_location(
+        "ctyun_alive", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ctyun-alive.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    durations = []
+    for _ in range(args.rounds):
+        for i in range(1, args.accounts + 1):
+            parms = {'account': f"1380000{i:04d}", 'password': 'bench', 'browserType': args.browser,
+                     'browserPath': args.browser_path, 'listenport': 0, 'listen_url': 'http://127.0.0.1/',
+                     'push_token': '', 'browser_profile': args.browser_profile}
+            start = time.perf_counter()
+            module.keepalive_ctyun2(parms, url=portal_url + "#/login")
+            durations.append(time.perf_counter() - start)
+    return durations
+
+
+def main(argv=None):
+    """运行基准并返回结果；与 --baseline 相比退化时退出码为 1"""
+    parser = argparse.ArgumentParser(description='天翼云保活离线性能基准')
+    parser.add_argument('--target', choices=['manager', 'cli'], default='manager')
+    parser.add_argument('--mode', choices=['sequential', 'concurrent', 'async'], default='concurrent')
+    parser.add_argument('--accounts', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=3)
+    parser.add_argument('--keepalive', choices=['browser', 'http'], default='browser',
+                        help='http: 重放门户接口，失败时改用浏览器')
+    parser.add_argument('--browser', default='chrome')
+    parser.add_argument('--browser-path', default='')
+    parser.add_argument('--browser-profile', choices=['lean', 'full'], default='lean',
+                        help='浏览器资源配置，full 不拦截任何资源')
+    parser.add_argument('--dwell', type=float, default=None, help='云桌面画面绘制后的停留秒数，默认使用步骤表中的值')
+    parser.add_argument('--workdir', help='工作目录(保留)，默认使用临时目录并在结束后删除')
+    parser.add_argument('--port', type=int, default=0, help='模拟门户端口，0 表示自动分配')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    parser.add_argument('--baseline', help='与之前的 JSON 结果比较')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='允许的性能退化比例')
+    add_option_arguments(parser)
+    args = parser.parse_args(argv)
+
+    options = {key: getattr(args, key) for key in DEFAULT_OPTIONS}
+    if args.target == 'cli' and options['captcha_prob'] > 0:
+        # 命令行版本在 listenport=0 时会等待键盘输入验证码
+        print("命令行版本基准不支持验证码，captcha_prob 置为 0")
+        options['captcha_prob'] = 0.0
+
+    server = MockPortalServer(args.port, options).start()
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        workdir = os.path.abspath(args.workdir)
+    else:
+        workdir = tempfile.mkdtemp(prefix="ctyun_bench_")
+    print(f"模拟门户: {server.url}  {options}")
+    failures_before = metrics.KEEPALIVE_TOTAL.get(result='failure')
+    mode_keys = [(mode, outcome) for mode in ('http', 'browser') for outcome in ('success', 'failure')]
+    modes_before = {key: metrics.MODE_SECONDS.get(mode=key[0], result=key[1]) for key in mode_keys}
+    page_load_before = metrics.STEP_SECONDS.get(step='page_load')
+    try:
+        with working_directory(workdir), RssSampler() as sampler:
+            start = time.perf_counter()
+            if args.target == 'manager':
+                durations = bench_manager(args, server.url, workdir)
+            else:
+                durations = bench_cli(args, server.url)
+            wall = time.perf_counter() - start
+    finally:
+        server.stop()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    # 各保活方式的次数和平均耗时(http 失败后会再走一次 browser)
+    per_mode = {}
+    for key in mode_keys:
+        count_before, sum_before = modes_before[key]
+        count, total = metrics.MODE_SECONDS.get(mode=key[0], result=key[1])
+        if count > count_before:
+            per_mode[f"{key[0]}_{key[1]}"] = {'count': count - count_before,
+                                              'mean_seconds': round((total - sum_before) / (count - count_before), 3)}
+
+    page_load_count, page_load_sum = metrics.STEP_SECONDS.get(step='page_load')
+    page_loads = page_load_count - page_load_before[0]
+
+    result = {
+        'target': args.target,
+        'mode': args.mode if args.target == 'manager' else 'sequential',
+        'keepalive': args.keepalive if args.target == 'manager' else 'browser',
+        'browser_profile': args.browser_profile,
+        'accounts': len(durations),
+        'failures': metrics.KEEPALIVE_TOTAL.get(result='failure') - failures_before,
+        'wall_seconds': round(wall, 3),
+        'accounts_per_minute': round(len(durations) / wall * 60, 2) if wall else 0.0,
+        'p50_seconds': round(percentile(durations, 50), 3),
+        'p95_seconds': round(percentile(durations, 95), 3),
+        'peak_rss_mb': round(sampler.peak / 1024 / 1024, 1),
+        'page_load_mean_seconds': round((page_load_sum - page_load_before[1]) / page_loads, 3) if page_loads else 0.0,
+        'per_mode': per_mode,
+        'display': get_display_stats(),  # 命令行版本在 Linux 上的 Xvfb 启动耗时、会话数和泄漏数
+        'options': options,
+    }
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = []
+        if result['accounts_per_minute'] < baseline['accounts_per_minute'] * (1 - args.max_regression):
+            regressions.append(f"吞吐量 {baseline['accounts_per_minute']} -> {result['accounts_per_minute']} 账号/分钟")
+        if result['p95_seconds'] > baseline['p95_seconds'] * (1 + args.max_regression):
+            regressions.append(f"p95 {baseline['p95_seconds']} -> {result['p95_seconds']} 秒")
+        if baseline.get('peak_rss_mb') and result['peak_rss_mb'] > baseline['peak_rss_mb'] * (1 + args.max_regression):
+            regressions.append(f"内存峰值 {baseline['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+        if regressions:
+            print("性能退化: " + "; ".join(regressions))
+            sys.exit(1)
+        print("与基准相比无明显退化")
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+浏览器资源配置：精简的 Chromium 启动参数，并通过 CDP Network.setBlockedURLs 拦截图片、字体、媒体和统计脚本
+
+保活只需要登录表单、验证码图片和云桌面画面（canvas 由 WebSocket 数据绘制，不受拦截影响），
+其余资源只占用带宽、内存和页面加载时间。验证码等必须加载的地址放在 allow 列表中。
+"""
+
+# 各类资源的扩展名/域名
+RESOURCE_PATTERNS = {
+    'image': ['png', 'jpg', 'jpeg', 'gif', 'webp', 'svg', 'ico', 'bmp'],
+    'font': ['woff', 'woff2', 'ttf', 'otf', 'eot'],
+    'media': ['mp4', 'webm', 'mp3', 'ogg', 'wav', 'm3u8'],
+}
+ANALYTICS_HOSTS = ['google-analytics.com', 'googletagmanager.com', 'hm.baidu.com', 'cnzz.com',
+                   'umeng.com', 'sensorsdata.cn', 'growingio.com', 'zhugeio.com']
+
+LEAN_FLAGS = [
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-component-update',
+    '--disable-default-apps',
+    '--disable-sync',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--mute-audio',
+    '--disable-dev-shm-usage',
+    '--disable-features=Translate,MediaRouter,OptimizationHints,AutofillServerCommunication',
+    '--disk-cache-size=33554432',
+]
+
+# full: 不做任何限制；lean: 精简参数并拦截非必要资源
+PROFILES = {
+    'full': {'flags': [], 'block': [], 'allow': []},
+    'lean': {
+        'flags': LEAN_FLAGS,
+        'block': ['image', 'font', 'media', 'analytics'],
+        # 地址中包含这些关键字的请求不拦截（验证码图片、云桌面相关资源）
+        'allow': ['captcha', 'verifycode', 'checkcode', 'code-img', 'desktop'],
+    },
+}
+
+
+def get_profile(name='lean', overrides=None):
+    """取得资源配置，overrides 中的字段覆盖同名字段"""
+    profile = dict(PROFILES.get(name or 'lean', PROFILES['lean']))
+    if overrides:
+        profile.update(overrides)
+    return profile
+
+
+def apply_options(options, profile):
+    """把启动参数加到 ChromeOptions/EdgeOptions 上"""
+    for flag in profile.get('flags', []):
+        options.add_argument(flag)
+
+
+def block_patterns(profile, url_pattern_syntax=False):
+    """
+    生成拦截地址模式
+    url_pattern_syntax=True 时使用新版 CDP 的 URLPattern 语法，否则使用旧版 * 通配符
+    """
+    patterns = []
+    for category in profile.get('block', []):
+        if category == 'analytics':
+            for host in ANALYTICS_HOSTS:
+                patterns.append(f"*://*{host}/*" if url_pattern_syntax else f"*{host}*")
+            continue
+        for ext in RESOURCE_PATTERNS.get(category, []):
+            if url_pattern_syntax:
+                patterns.append(f"*://*/*.{ext}")
+            else:
+                patterns.extend([f"*.{ext}", f"*.{ext}?*"])
+    return patterns
+
+
+def apply_network_rules(driver, profile, log=None):
+    """
+    通过 CDP 设置拦截规则，返回实际生效的说明
+    新版 Chromium 支持 urlPatterns（按顺序匹配，可放行），allow 列表放在最前面；
+    旧版只支持 urls 拦截列表，无法放行，此时有 allow 列表就不拦截图片，避免验证码无法显示
+    """
+    if not profile.get('block'):
+        return "不拦截资源"
+    if not hasattr(driver, 'execute_cdp_cmd'):
+        return "浏览器不支持 CDP，未拦截资源"
+    driver.execute_cdp_cmd('Network.enable', {})
+    allow = profile.get('allow', [])
+    try:
+        rules = [{'urlPattern': f"*://*/*{keyword}*", 'block': False} for keyword in allow]
+        rules += [{'urlPattern': pattern, 'block': True} for pattern in block_patterns(profile, True)]
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urlPatterns': rules})
+        description = f"拦截 {', '.join(profile['block'])}，放行 {len(allow)} 个关键字"
+    except Exception:
+        legacy = dict(profile)
+        if allow:
+            legacy['block'] = [category for category in profile['block'] if category != 'image']
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': block_patterns(legacy)})
+        description = f"拦截 {', '.join(legacy['block'])}（旧版 CDP，不支持放行列表）"
+    if log:
+        log(f"资源配置: {description}")
+    return description
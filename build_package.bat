@@ -27,6 +27,7 @@ pyinstaller --onedir ^
     --hidden-import=selenium.webdriver.edge ^
     --hidden-import=selenium.webdriver.common ^
     --hidden-import=requests ^
+    --hidden-import=waitress ^
     --hidden-import=muggle_ocr ^
     --hidden-import=PIL ^
     --hidden-import=logging ^
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+验证码结果缓存：按图片内容哈希缓存识别结果，并记录每个答案登录后被接受还是被拒绝
+
+重试时验证码图片常常没有变化，命中缓存即可跳过识别；
+被拒绝的答案记在该图片下，之后识别出同样的答案也不再返回，避免重复提交已知错误的验证码。
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+import metrics
+
+
+class CaptchaCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()    # 哈希 -> {'answer': 当前可用答案, 'rejected': 被拒绝的答案集合}
+        self.stats = {'hits': 0, 'misses': 0, 'known_bad': 0, 'accepted': 0, 'rejected': 0}
+
+    @staticmethod
+    def key(image_bytes):
+        return hashlib.sha1(image_bytes).hexdigest()
+
+    def _entry(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = {'answer': None, 'rejected': set()}
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        self.entries.move_to_end(key)
+        return entry
+
+    def lookup(self, key):
+        """返回缓存的答案，没有或已被拒绝时返回 None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            answer = entry['answer'] if entry else None
+            if answer is not None:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+            else:
+                self.stats['misses'] += 1
+        metrics.CAPTCHA_CACHE_TOTAL.inc(result='hit' if answer is not None else 'miss')
+        return answer
+
+    def store(self, key, answer):
+        """记录识别结果；该答案已被拒绝过时不记录并返回 None"""
+        if not answer:
+            return None
+        with self.lock:
+            entry = self._entry(key)
+            if answer in entry['rejected']:
+                self.stats['known_bad'] += 1
+                return None
+            entry['answer'] = answer
+        return answer
+
+    def report(self, key, answer, accepted):
+        """记录答案提交后的结果，被拒绝的答案从缓存中移除"""
+        if not answer:
+            return
+        with self.lock:
+            entry = self._entry(key)
+            if accepted:
+                entry['answer'] = answer
+                self.stats['accepted'] += 1
+            else:
+                entry['rejected'].add(answer)
+                if entry['answer'] == answer:
+                    entry['answer'] = None
+                self.stats['rejected'] += 1
+            judged = self.stats['accepted'] + self.stats['rejected']
+            accuracy = self.stats['accepted'] / judged
+        metrics.CAPTCHA_ANSWERS_TOTAL.inc(outcome='accepted' if accepted else 'rejected')
+        metrics.OCR_ACCURACY.set(round(accuracy, 4))
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, entries=len(self.entries))
+        lookups = stats['hits'] + stats['misses']
+        judged = stats['accepted'] + stats['rejected']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        stats['accuracy'] = stats['accepted'] / judged if judged else 0.0
+        return stats
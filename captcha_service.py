@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+验证码识别服务：OCR 模型放在独立的工作进程中，保活线程提交图片字节后得到 Future
+
+多个账号同时遇到验证码时，识别不再在各自线程里占用 GIL/CPU；
+分发线程把短时间内到达的请求合并成一批发给同一个工作进程，一次进程间往返识别多张，
+引擎本身不支持批量接口时在工作进程内逐张识别。workers=0 时在本进程的分发线程中识别。
+识别结果按图片内容缓存(captcha_cache.py)，同一张图片重试时不再识别；调用方用 report() 反馈答案是否被接受。
+"""
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+import my_captcha
+from captcha_cache import CaptchaCache
+
+
+def _init_worker(engine):
+    """工作进程启动时加载模型，之后的识别不再付出加载耗时"""
+    recognizer = my_captcha.get_recognizer()
+    if engine:
+        recognizer.engine = engine
+    recognizer.load()
+
+
+def _recognize_batch(images):
+    """在工作进程中识别一批图片，返回 [(识别结果, 耗时)]"""
+    recognizer = my_captcha.get_recognizer()
+    results = []
+    for image_bytes in images:
+        start = time.perf_counter()
+        text = recognizer.recognize(image_bytes)
+        results.append((text, time.perf_counter() - start))
+    return results
+
+
+class CaptchaService:
+    def __init__(self, workers=1, batch_size=4, batch_wait=0.02, engine=None, logger=None, cache_size=256):
+        """
+        workers: OCR 工作进程数，0 表示在本进程中识别
+        batch_size: 一批最多合并的图片数
+        batch_wait: 收到第一张图片后最多再等多久凑批(秒)
+        engine: muggle / ddddocr / tesseract，默认自动选择
+        cache_size: 按图片内容缓存的识别结果数
+        """
+        self.workers = workers
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.engine = engine
+        self.logger = logger
+        self.requests = queue.Queue()   # (图片字节, Future, 提交时间, 内容哈希)
+        self.cache = CaptchaCache(cache_size)
+        self.lock = threading.Lock()
+        self.executor_lock = threading.Lock()
+        self.executor = None
+        self.in_flight = 0
+        self.closed = False
+        self.stats = {'images': 0, 'batches': 0, 'failures': 0, 'restarts': 0,
+                      'inference_seconds': 0.0, 'wait_seconds': 0.0, 'last_seconds': 0.0}
+        self.dispatcher = threading.Thread(target=self._dispatch_loop, name="captcha-service", daemon=True)
+        self.dispatcher.start()
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.info(f"[验证码服务] {message}")
+
+    def _get_executor(self):
+        with self.executor_lock:
+            if self.executor is None:
+                # 固定用 spawn：Linux 默认的 fork 会复制保活线程、浏览器驱动连接和锁的状态，
+                # 与 Windows/打包版本的行为也不一致
+                self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                                    initargs=(self.engine,),
+                                                    mp_context=multiprocessing.get_context('spawn'))
+                self._log(f"启动 {self.workers} 个识别进程")
+            return self.executor
+
+    def warmup(self):
+        """提前启动工作进程并加载模型(进程池按需启动进程，每个空任务拉起一个)；不等待加载完成"""
+        if self.workers > 0:
+            executor = self._get_executor()
+            for _ in range(self.workers):
+                executor.submit(_recognize_batch, [])
+        else:
+            threading.Thread(target=_init_worker, args=(self.engine,), name="captcha-warmup", daemon=True).start()
+
+    def submit(self, image_bytes):
+        """提交一张验证码图片，返回 Future，结果为识别出的文本(失败或只识别出已被拒绝的答案时为 None)"""
+        future = Future()
+        if self.closed:
+            future.set_exception(RuntimeError("验证码服务已关闭"))
+            return future
+        key = self.cache.key(image_bytes)
+        answer = self.cache.lookup(key)
+        if answer is not None:
+            future.set_result(answer)
+            return future
+        self.requests.put((image_bytes, future, time.perf_counter(), key))
+        metrics.OCR_QUEUE_DEPTH.set(self.requests.qsize())
+        return future
+
+    def recognize(self, image_bytes, timeout=30):
+        """提交并等待识别结果"""
+        return self.submit(image_bytes).result(timeout)
+
+    def report(self, image_bytes, answer, accepted):
+        """反馈提交答案后登录是否成功，被拒绝的答案对这张图片不再返回"""
+        self.cache.report(self.cache.key(image_bytes), answer, accepted)
+
+    def _next_batch(self):
+        """阻塞取第一张，再在 batch_wait 内凑满一批"""
+        first = self.requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self.requests.put(None)  # 留给下一次循环退出
+                break
+            batch.append(item)
+        metrics.OCR_QUEUE_DEPTH.set(self.requests.qsize())
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            images = [image for image, _, _, _ in batch]
+            now = time.perf_counter()
+            with self.lock:
+                self.in_flight += len(batch)
+                self.stats['wait_seconds'] += sum(now - submitted for _, _, submitted, _ in batch)
+            job = Future()
+            try:
+                if self.workers > 0:
+                    try:
+                        job = self._get_executor().submit(_recognize_batch, images)
+                    except (BrokenProcessPool, RuntimeError) as e:
+                        self._restart(e)
+                        job = self._get_executor().submit(_recognize_batch, images)
+                else:
+                    job.set_result(_recognize_batch(images))
+            except Exception as e:
+                job.set_exception(e)
+            job.add_done_callback(lambda done, batch=batch: self._finish(batch, done))
+
+    def _restart(self, error):
+        """工作进程崩溃后重建进程池"""
+        self._log(f"识别进程异常，重新启动: {str(error)}")
+        with self.lock:
+            self.stats['restarts'] += 1
+        with self.executor_lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _finish(self, batch, job):
+        """把一批结果分发给各自的 Future"""
+        error = job.exception()
+        results = iter(job.result() if error is None else [])
+        with self.lock:
+            self.in_flight -= len(batch)
+            self.stats['batches'] += 1
+        metrics.OCR_BATCH_SIZE.observe(len(batch))
+        for _, future, _, key in batch:
+            if error is not None:
+                with self.lock:
+                    self.stats['failures'] += 1
+                future.set_exception(error)
+                continue
+            text, seconds = next(results)
+            metrics.OCR_INFERENCE_SECONDS.observe(seconds)
+            with self.lock:
+                self.stats['images'] += 1
+                self.stats['inference_seconds'] += seconds
+                self.stats['last_seconds'] = seconds
+                if not text:
+                    self.stats['failures'] += 1
+            future.set_result(self.cache.store(key, text))
+        if isinstance(error, BrokenProcessPool):
+            self._restart(error)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, in_flight=self.in_flight)
+        stats['queue_depth'] = self.requests.qsize()
+        stats['avg_inference_seconds'] = stats['inference_seconds'] / stats['images'] if stats['images'] else 0.0
+        stats['avg_wait_seconds'] = stats['wait_seconds'] / stats['images'] if stats['images'] else 0.0
+        stats['avg_batch'] = stats['images'] / stats['batches'] if stats['batches'] else 0.0
+        cache = self.cache.get_stats()
+        stats.update(cache_hit_rate=cache['hit_rate'], accuracy=cache['accuracy'], known_bad=cache['known_bad'])
+        return stats
+
+    def close(self):
+        self.closed = True
+        self.requests.put(None)
+        self.dispatcher.join(5)
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_captcha_service(workers=1, batch_size=4, batch_wait=0.02, engine=None, logger=None, cache_size=256):
+    """进程内共享的验证码服务，首次调用时按参数创建并预热"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = CaptchaService(workers, batch_size, batch_wait, engine, logger, cache_size)
+            _service.warmup()
+        return _service
+
+
+def close_captcha_service():
+    """关闭共享验证码服务及其识别进程(程序退出时调用)"""
+    global _service
+    with _service_lock:
+        service, _service = _service, None
+    if service is not None:
+        service.close()
+
+
+def get_service_stats():
+    """共享验证码服务的统计，尚未使用时返回 None"""
+    return _service.get_stats() if _service else None
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""配置持久化：原子写入 JSON，并把频繁的状态更新合并后延迟写盘"""
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def atomic_write_json(path, data):
+    """先写临时文件再改名，保证配置文件不会写到一半"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class WriteBehindWriter:
+    def __init__(self, save_fn, delay=2.0, logger=None):
+        """
+        save_fn: 真正写盘的函数
+        delay: 标记为脏之后最多延迟多少秒写盘，期间的多次更新合并为一次
+        """
+        self.save_fn = save_fn
+        self.delay = delay
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.closed = False
+        self.wakeup = threading.Event()
+        self.thread = None
+        self.stats = {'updates': 0, 'flushes': 0}
+
+    def _ensure_thread(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, name="config-writer", daemon=True)
+            self.thread.start()
+
+    def mark_dirty(self):
+        """记录一次待写入的变更"""
+        with self.lock:
+            self.dirty = True
+            self.stats['updates'] += 1
+            self._ensure_thread()
+        self.wakeup.set()
+
+    def _run(self):
+        while True:
+            self.wakeup.wait()
+            if self.closed:
+                return
+            # 合并窗口：delay 秒内的更新一起写入
+            time.sleep(self.delay)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """立即写入尚未持久化的变更"""
+        with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+        try:
+            self.save_fn()
+            with self.lock:
+                self.stats['flushes'] += 1
+        except Exception as e:
+            with self.lock:
+                self.dirty = True
+            if self.logger:
+                self.logger.error(f"写入配置失败: {str(e)}")
+
+    def close(self):
+        """停止后台线程并写入剩余变更"""
+        self.closed = True
+        self.wakeup.set()
+        self.flush()
@@ -1,11 +1,5 @@
 # -*- coding: utf-8 -*-
 from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
-from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.common.action_chains import ActionChains
-# ActionChains(driver).key_down(Keys.CONTROL).click(lnk).key_up(Keys.CONTROL).perform()
-from pyvirtualdisplay import Display
 import time
 import logger
 import logging
@@ -13,8 +7,15 @@ import sys,os
 import json
 import requests
 import threading
-from queue import Queue
-import my_captcha
+from concurrent.futures import wait as waitFutures, FIRST_COMPLETED
+from captcha_service import get_captcha_service
+import metrics
+import browser_profile
+from display_manager import get_display_manager
+from screenshot_writer import ScreenshotWriter
+from wait_engine import StepWaiter
+from step_plan import StepRunner, get_plan
+from retry_policy import CaptchaExhaustedError, classify_failure
 
 import webthread
 
@@ -50,23 +51,9 @@ def keepalive_ctyun2(parms,url="https://pc.ctyun.cn/#/login"):
         __g_logger.warning("Wrong parameters parms")
         return -1
         
-    ctyun_steps=[{"name":"login Input","elems":[['account',By.CLASS_NAME,'send_keys','%ACCOUNT%'],
-                                               ['password',By.CLASS_NAME,'send_keys','%CTPASSWORD%'],
-                                               ['btn-submit',By.CLASS_NAME,'click','3']]}
-                ,{"name":"Enter YunMachine","elems":[['desktop-main-entry',By.CLASS_NAME,'click','5']]}
-                ,{"name":"Windows login","elems":[[ "close-ai", "class name", "click", "3" ],
-                                                ['screenContainer',By.CLASS_NAME,'click','15'],
-                                                 ['winpassword',"active_element",'send_keys','%WINPASSWORD%']]}
-                ]
-    for step in ctyun_steps:
-        for elem in step['elems']:
-            if(elem[3] =="%ACCOUNT%"):
-                elem[3]=parms['account']
-            elif(elem[3] =="%CTPASSWORD%"):
-                elem[3]=parms['password']
-            elif(elem[3] =="%WINPASSWORD%"):
-                elem[3]='999'+parms['password']
-    #print(ctyun_steps)
+    #步骤表与多账号管理器共用(step_plan.py)，占位符在执行时替换，不再修改步骤表本身
+    plan=get_plan(parms.get('portal_version'),parms.get('step_overrides'))
+    planParams={'account':parms['account'],'password':parms['password'],'winpassword':'999'+parms['password']}
             
     if(parms['browserType'] =='edge'):
         options = webdriver.EdgeOptions() #ChromeOptions()
@@ -75,162 +62,160 @@ def keepalive_ctyun2(parms,url="https://pc.ctyun.cn/#/login"):
         options = webdriver.ChromeOptions()
         
     isDisplay =  isNeedDisplay()
-    if (isDisplay==1):
-        display = Display(visible=False, size=(480, 600))
-        display.start()
-        options.add_argument('excludeSwitches=enable-automation')
-        options.add_argument('blink-settings=imagesEnabled=false')  # 不加载图片, 提升速度
+    if (isDisplay==1):  #虚拟显示在 try 中分配，由 display_manager 在进程内共用
+        options.add_experimental_option("excludeSwitches", ["enable-automation"])
     elif(isDisplay==2): #normal Linux none-interface mode
         options.add_argument('--no-sandbox')  # 解决DevToolsActivePort文件不存在的报错
-        options.add_argument('window-size=800x600')  # 指定浏览器分辨率
+        options.add_argument('--window-size=800,600')  # 指定浏览器分辨率
         options.add_argument('--disable-gpu')  # 谷歌文档提到需要加上这个属性来规避bug
         options.add_argument('--hide-scrollbars')  # 隐藏滚动条, 应对一些特殊页面
-        options.add_argument('blink-settings=imagesEnabled=true')  # 不加载图片, 提升速度
         options.add_argument('--headless')  # 浏览器不提供可视化页面. linux下如果系统不支持可视化不加这条会启动失败
-    else:
-        options.add_argument('blink-settings=imagesEnabled=false')  # 不加载图片, 提升速度
-    options.add_argument('permissions.default.stylesheet=2')    #不用网站提供的css
+    #不加载图片/字体/媒体由资源配置通过 CDP 拦截完成，验证码图片在放行列表中(browser_profile.py)
+    profile=browser_profile.get_profile(parms.get('browser_profile','lean'),parms.get('browser_profile_overrides'))
+    browser_profile.apply_options(options,profile)
     options.add_argument('--enable-chrome-browser-cloud-management')
 
     if(parms['listen_url'] == ''): listen_url=getDefaultUrl(port=parms['listenport'])
     listen_url=f'<a href="{listen_url}">点击输入(click to input)</a>'
 
+    #保活结束时的截图只取字节，由后台线程去重、写入 static/ctyun.png(文件名固定，格式固定为 png)并清理历史
+    screenshots=ScreenshotWriter('static',dict(parms.get('screenshot') or {},format='png'),logger=__g_logger)
+    runStart=time.perf_counter()
+    bSuccess=True
+    driver=None
+    displaySession=None
     try:
+        if (isDisplay==1):
+            displayManager=get_display_manager(size=(480, 600),pool_size=parms.get('display_pool_size',1),logger=__g_logger)
+            displaySession=displayManager.acquire()
         if(parms['listenport']>0):
-            verifyCodeQueue=Queue()
-            webthread.web_run(verifyCodeQueue,port=parms['listenport'])   #拉起一个web监听线程，便于输入验证码
+            webthread.web_run(port=parms['listenport'])   #拉起一个web监听线程，验证码按账号推送到网页输入
 
         __g_logger.info("try start selenium")
+        stepStart=time.perf_counter()
+        serviceArgs={'env':displaySession.env} if displaySession else {}  #驱动和浏览器使用分配到的虚拟显示
         if(parms['browserType'] =='edge'):
             options.binary_location='C:\Program Files (x86)\Microsoft\Edge\Application\msedge.exe' if (parms['browserPath']=='') else parms['browserPath']
             # 检查本地Edge驱动
             local_driver_path = os.path.join(os.getcwd(), "msedgedriver.exe")
+            from selenium.webdriver.edge.service import Service as EdgeService
             if os.path.exists(local_driver_path):
                 __g_logger.info(f"使用本地Edge驱动: {local_driver_path}")
-                from selenium.webdriver.edge.service import Service as EdgeService
-                service = EdgeService(local_driver_path)
-                driver = webdriver.Edge(service=service, options=options)
+                service = EdgeService(local_driver_path, **serviceArgs)
             else:
                 __g_logger.info("使用系统Edge驱动")
-                driver = webdriver.Edge(options=options)
+                service = EdgeService(**serviceArgs)
+            driver = webdriver.Edge(service=service, options=options)
         else:
             options.binary_location='D:\programs\chrome\chrome.exe' if (parms['browserPath']=='') else parms['browserPath']
             # 检查本地Chrome驱动
             local_chrome_driver = os.path.join(os.getcwd(), "chromedriver.exe")
+            from selenium.webdriver.chrome.service import Service as ChromeService
             if os.path.exists(local_chrome_driver):
                 __g_logger.info(f"使用本地Chrome驱动: {local_chrome_driver}")
-                from selenium.webdriver.chrome.service import Service as ChromeService
-                service = ChromeService(local_chrome_driver)
-                driver = webdriver.Chrome(service=service, options=options)
+                service = ChromeService(local_chrome_driver, **serviceArgs)
             else:
                 __g_logger.info("使用系统Chrome驱动")
-                driver = webdriver.Chrome(options=options)
-        driver.get(url)
-        time.sleep(3)
-        
-        i=0
-        bFoundVercode=False
+                service = ChromeService(**serviceArgs)
+            driver = webdriver.Chrome(service=service, options=options)
+        try:
+            browser_profile.apply_network_rules(driver,profile,__g_logger.info)
+        except Exception as e:
+            __g_logger.warn("设置资源拦截失败: "+str(e))
+        metrics.BROWSER_LAUNCHES_TOTAL.inc()
+        metrics.STEP_SECONDS.observe(time.perf_counter()-stepStart, step='browser_launch')
+        waiter = StepWaiter(driver, parms.get('wait_timeouts'), log=__g_logger.info)
+        with metrics.STEP_SECONDS.time(step='page_load'):
+            driver.get(url)
+        runner = StepRunner(driver, waiter, plan, planParams, log=__g_logger.info)
+
+        __g_logger.info("step1: login Input,Now url:" +driver.current_url)
+        runner.run('login')
+
         captcha_retry_count = 0
         max_captcha_retries = 3  # 最大验证码重试次数
-        while i<len(ctyun_steps):
-            step= ctyun_steps[i]
-            __g_logger.info("step" + str(i+1) + ":"+ step['name']+",Now url:" +driver.current_url)
+        captchaService=get_captcha_service(workers=parms.get('ocr_workers',0),logger=__g_logger) if(parms['listenport']>0) else None
+        lastOcr=None    #(验证码图片, 识别结果)：下一轮验证码消失说明答案被接受，仍在则被拒绝
+        while True:     #登录页面出现验证码时，识别/等待输入后重新登录
+            obj = runner.find('captcha_code')
+            objimg = runner.find('captcha_image') if obj else None
+            if(lastOcr is not None):
+                captchaService.report(lastOcr[0],lastOcr[1],obj is None or objimg is None)
+                lastOcr=None
+            if(obj is None or objimg is None or obj.get_attribute('value')!=''):
+                break
+            captcha_retry_count += 1
+            if captcha_retry_count > max_captcha_retries:
+                __g_logger.error(f"验证码重试次数超过限制({max_captcha_retries})，程序退出")
+                raise CaptchaExhaustedError(f"验证码重试次数超过限制({max_captcha_retries})")
 
-            if(driver.current_url == url):  #当前为登录页面，需要额外判断是否需要输入验证码
+            __g_logger.warn(f"登录需要验证码! (第{captcha_retry_count}次尝试) " + objimg.get_attribute('src') )
+            captchaPng=objimg.screenshot_as_png   #验证码图片直接在内存中识别
+            metrics.CAPTCHA_ATTEMPTS_TOTAL.inc()
+            ocrStart=time.perf_counter()
+            #识别在验证码服务中进行，推送消息的同时等待结果
+            #同一张图片重试时直接取缓存结果，已被拒绝过的答案不会再返回
+            ocrFuture=captchaService.submit(captchaPng) if(captchaService is not None) else None
+            #同时把验证码推送到网页(按账号和编号区分)，自动识别和网页输入先到先用
+            challenge=webthread.relay.open(parms['account'],captchaPng) if(captchaService is not None) else None
+            #验证码页面直接显示内存中的验证码图片(/captcha/<编号>.png)，不再为此截取整页
+            pushmsg(parms['push_token'],'天翼云电脑保活需要验证码', listen_url)
+            if(ocrFuture is not None):
                 try:
-                    obj = driver.find_element(By.CLASS_NAME,'code')
-                    objimg = driver.find_element(By.CLASS_NAME,'code-img')
-                    if(obj.get_attribute('value')==''):
-                        captcha_retry_count += 1
-                        if captcha_retry_count > max_captcha_retries:
-                            __g_logger.error(f"验证码重试次数超过限制({max_captcha_retries})，程序退出")
-                            break
-                        
-                        __g_logger.warn(f"登录需要验证码! (第{captcha_retry_count}次尝试) " + objimg.get_attribute('src') )
-                        pushmsg(parms['push_token'],'天翼云电脑保活需要验证码', listen_url)
-                        driver.get_screenshot_as_file('static/ctyun.png')
-                        objimg.screenshot("static/verifyCode.png")
-                        bFoundVercode=True
-                        if(parms['listenport']>0):
-                            try:
-                                verifyCode=my_captcha.captcha_pic('static/verifyCode.png')
-                                if(verifyCode==None or verifyCode.strip()==''):
-                                    verifyCode= verifyCodeQueue.get(block=True,timeout=30)
-                                __g_logger.info('收到/识别验证码:'+str(verifyCode))
-                            except Exception:
-                                __g_logger.warn("获取验证码超时(30s)")
-                                verifyCode = "0000"  # 默认验证码
+                    done,_=waitFutures([ocrFuture,challenge.future],timeout=30,return_when=FIRST_COMPLETED)
+                    verifyCode=None
+                    if(challenge.future in done):
+                        verifyCode=challenge.future.result()
+                    elif(ocrFuture in done):
+                        verifyCode=ocrFuture.result()
+                        metrics.STEP_SECONDS.observe(time.perf_counter()-ocrStart, step='captcha')
+                        metrics.OCR_TOTAL.inc(result='failure' if (verifyCode==None or verifyCode.strip()=='') else 'success')
+                        if(verifyCode==None or verifyCode.strip()==''):
+                            verifyCode=challenge.future.result(timeout=30)  #识别失败，等待网页输入
                         else:
-                            verifyCode=input('请输入验证码:')
-                        obj.clear()
-                        obj.send_keys(verifyCode)
-                        if(i>0):    #如果要出现输入验证码，退回上一步重新登录页面操作
-                            i=i-1
-                            continue
-                except NoSuchElementException as e:
-                    pass
-            
-            for elem in step['elems']:
-                if(elem[1] == 'active_element'):
-                    __g_logger.debug(f"send active_element keys:{elem[3]}")
-                    driver.switch_to.active_element.send_keys(elem[3]);
-                    driver.switch_to.active_element.send_keys(Keys.ENTER);
-                else:
-                    try:
-                        obj = driver.find_element(elem[1],elem[0])
-                        if(obj):
-                            __g_logger.debug(f"find {elem[0]}={elem[3]}")
-                            if (elem[2]=='send_keys'):
-                                obj.clear()
-                                obj.send_keys( elem[3])
-                            elif (elem[2]=='click'):
-                                # 尝试多种点击方式
-                                try:
-                                    # 方法1：直接点击
-                                    obj.click()
-                                except Exception as e1:
-                                    try:
-                                        # 方法2：使用JavaScript点击
-                                        driver.execute_script("arguments[0].click();", obj)
-                                        __g_logger.info(f"使用JavaScript点击成功: {elem[0]}")
-                                    except Exception as e2:
-                                        try:
-                                            # 方法3：使用ActionChains点击
-                                            ActionChains(driver).move_to_element(obj).click().perform()
-                                            __g_logger.info(f"使用ActionChains点击成功: {elem[0]}")
-                                        except Exception as e3:
-                                            __g_logger.warn(f"所有点击方法都失败: {elem[0]}, 错误: {e1}, {e2}, {e3}")
-                                            # 等待一下再重试
-                                            time.sleep(2)
-                                            try:
-                                                obj.click()
-                                            except:
-                                                pass
-                                if(len(elem[3])>0): time.sleep(int(elem[3]))    #最后一步登录唤醒可能等待时间较长
-                    except NoSuchElementException as e:
-                        __g_logger.warn("element not found:" + elem[0] )
-                        try:
-                            tips_obj=driver.find_element(By.CLASS_NAME,'el-message__content')
-                            __g_logger.warn("tips:"+tips_obj.text)
-                        except NoSuchElementException as e:
-                            pass
-                        
-                        #return -2
-            i=i+1
-        #end while step                
+                            lastOcr=(captchaPng,verifyCode)
+                    if(verifyCode is None):
+                        raise TimeoutError()
+                    __g_logger.info('收到/识别验证码:'+str(verifyCode))
+                except Exception:
+                    __g_logger.warn("获取验证码超时(30s)")
+                    verifyCode = "0000"  # 默认验证码
+                finally:
+                    webthread.relay.close(challenge.id)
+            else:
+                verifyCode=input('请输入验证码:')
+            runner.run_step('captcha_code', captcha=verifyCode)
+            runner.run_step('captcha_submit')
 
-        time.sleep(15)
+        __g_logger.info("step2: Enter YunMachine,Now url:" +driver.current_url)
+        runner.run('enter_desktop')
+        runner.run('desktop_ready')
+        __g_logger.info("step3: Windows login,Now url:" +driver.current_url)
+        runner.run('windows_login')
+
+        #Windows 登录后的画面变化不反映在 DOM 上，保留固定停留时间再截图
+        waiter.dwell("desktop ready", 15)
+        __g_logger.info("wait summary: " + waiter.summary())
+        __g_logger.info("step summary: " + runner.summary())
         
     except Exception as e:
         import traceback
         __g_logger.error( traceback.format_exc() )
+        bSuccess=False
+        metrics.FAILURES_TOTAL.inc(reason=classify_failure(e))
     finally:    #即使中间有return代码也会执行
-        driver.get_screenshot_as_file('static/ctyun.png')
-        __g_logger.info("save to static/ctyun.png")
-        driver.quit()
-
-    if (isNeedDisplay()==1):
-        display.stop()
+        if driver is not None:
+            try:
+                screenshots.capture(driver,'ctyun')
+                __g_logger.info("save to static/ctyun.png")
+            finally:
+                driver.quit()
+        screenshots.close()
+        if displaySession is not None:  #归还虚拟显示，Xvfb 在进程退出时统一停止
+            displayManager.release(displaySession)
+            __g_logger.info("display stats: " + str(displayManager.get_stats()))
+    metrics.ACCOUNT_SECONDS.observe(time.perf_counter()-runStart, result='success' if bSuccess else 'failure')
+    metrics.KEEPALIVE_TOTAL.inc(result='success' if bSuccess else 'failure')
     pushmsg(parms['push_token'],'天翼云电脑保活成功',time.asctime())
     return 0
 
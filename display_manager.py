@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Linux 虚拟显示管理：进程内保持一个(或少量) Xvfb 显示，浏览器会话按负载分配到显示上
+
+原来每次保活都启动并停止一个 Xvfb，异常时 display.stop() 执行不到，Xvfb 进程会残留。
+这里的显示在进程退出时(atexit)统一停止；会话通过 session() 取得显示，退出 with 块时一定归还。
+"""
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+
+
+class ManagedDisplay:
+    """池中的一个 Xvfb 显示"""
+    def __init__(self, display):
+        self.display = display
+        self.sessions = 0
+        self.started_at = time.time()
+
+    @property
+    def env(self):
+        """浏览器驱动进程使用的环境变量"""
+        return dict(os.environ, DISPLAY=self.display.new_display_var)
+
+
+class DisplayManager:
+    def __init__(self, size=(480, 600), pool_size=1, logger=None):
+        """
+        size: 虚拟屏幕分辨率
+        pool_size: 最多同时保持的 Xvfb 数量，会话多于显示时共用负载最小的显示
+        """
+        self.size = size
+        self.pool_size = max(1, pool_size)
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.displays = []
+        self.closed = False
+        self.stats = {
+            'started': 0,           # 启动 Xvfb 次数
+            'start_seconds': 0.0,   # 启动 Xvfb 总耗时
+            'sessions': 0,          # 分配的会话数
+            'dead': 0,              # 使用中发现已退出的 Xvfb 数
+            'leaked': 0,            # 退出时仍未归还的会话数
+        }
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.info(f"[虚拟显示] {message}")
+
+    def _start(self):
+        from pyvirtualdisplay import Display
+        start = time.perf_counter()
+        display = Display(visible=False, size=self.size, manage_global_env=False)
+        display.start()
+        elapsed = time.perf_counter() - start
+        self.stats['started'] += 1
+        self.stats['start_seconds'] += elapsed
+        metrics.DISPLAY_START_SECONDS.observe(elapsed)
+        self._log(f"启动 Xvfb {display.new_display_var}，耗时 {elapsed:.2f}秒")
+        return ManagedDisplay(display)
+
+    def acquire(self):
+        """分配一个显示：清理已退出的 Xvfb，优先新建到 pool_size 个，之后共用负载最小的"""
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("虚拟显示管理器已关闭")
+            for managed in [d for d in self.displays if not d.display.is_alive()]:
+                self.displays.remove(managed)
+                self.stats['dead'] += 1
+                self._log(f"Xvfb {managed.display.new_display_var} 已退出，重新启动")
+            idle = [d for d in self.displays if d.sessions == 0]
+            if idle:
+                managed = idle[0]
+            elif len(self.displays) < self.pool_size:
+                managed = self._start()
+                self.displays.append(managed)
+            else:
+                managed = min(self.displays, key=lambda d: d.sessions)
+            managed.sessions += 1
+            self.stats['sessions'] += 1
+            metrics.DISPLAY_SESSIONS.set(sum(d.sessions for d in self.displays))
+            return managed
+
+    def release(self, managed):
+        with self.lock:
+            managed.sessions = max(0, managed.sessions - 1)
+            metrics.DISPLAY_SESSIONS.set(sum(d.sessions for d in self.displays))
+
+    @contextmanager
+    def session(self):
+        """with manager.session() as managed: 使用 managed.env 启动浏览器驱动"""
+        managed = self.acquire()
+        try:
+            yield managed
+        finally:
+            self.release(managed)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, displays=len(self.displays),
+                         active_sessions=sum(d.sessions for d in self.displays))
+        stats['avg_start_seconds'] = round(stats['start_seconds'] / stats['started'], 3) if stats['started'] else 0.0
+        return stats
+
+    def close(self):
+        """停止所有 Xvfb；仍有会话未归还时计为泄漏"""
+        with self.lock:
+            self.closed = True
+            displays, self.displays = self.displays, []
+            leaked = sum(d.sessions for d in displays)
+            self.stats['leaked'] += leaked
+        if leaked:
+            metrics.DISPLAY_LEAKS_TOTAL.inc(leaked)
+            self._log(f"退出时仍有 {leaked} 个会话未归还")
+        for managed in displays:
+            try:
+                managed.display.stop()
+            except Exception:
+                pass
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_display_manager(size=(480, 600), pool_size=1, logger=None):
+    """进程内共享的显示管理器，首次调用时创建，进程退出时停止所有 Xvfb"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = DisplayManager(size, pool_size, logger)
+            atexit.register(_manager.close)
+        return _manager
+
+
+def get_display_stats():
+    """共享显示管理器的统计，未使用虚拟显示时返回 None"""
+    return _manager.get_stats() if _manager else None
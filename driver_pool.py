@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""浏览器会话池：在多轮保活之间复用已启动的浏览器，减少启动开销"""
+import threading
+import time
+import metrics
+
+
+class PooledDriver:
+    """池中的一个浏览器会话"""
+    def __init__(self, driver):
+        self.driver = driver
+        self.uses = 0
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+
+class DriverPool:
+    def __init__(self, create_fn, max_idle=3, max_uses=10, max_idle_seconds=1800, logger=None):
+        """
+        create_fn: 创建新浏览器驱动的函数
+        max_idle: 最多保留的空闲浏览器数
+        max_uses: 每个浏览器最多使用次数，超过后退役
+        max_idle_seconds: 空闲超过该时长的浏览器在下次取用时退役；可以是函数，每次取用时求值(随调度间隔变化)
+        """
+        self.create_fn = create_fn
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self.max_idle_seconds = max_idle_seconds
+        self.reset_origins = ()     # 归还时一定清除存储的来源(门户地址)，页面加载过的来源会自动加入
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.idle = []          # 空闲会话
+        self.in_use = {}        # id(driver) -> PooledDriver
+        self.stats = {
+            'launches': 0,      # 新启动浏览器次数
+            'reuses': 0,        # 复用已有浏览器次数
+            'retired': 0,       # 退役(关闭)的浏览器数
+            'launch_seconds': 0.0,
+        }
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.info(f"[会话池] {message}")
+
+    def acquire(self):
+        """取出一个可用的浏览器，没有则新建"""
+        while True:
+            with self.lock:
+                pooled = self.idle.pop() if self.idle else None
+            if pooled is None:
+                break
+            if time.time() - pooled.last_used > self.get_max_idle_seconds() or not self._is_alive(pooled.driver):
+                self._retire(pooled, "空闲过久或已失效")
+                continue
+            with self.lock:
+                self.in_use[id(pooled.driver)] = pooled
+                self.stats['reuses'] += 1
+            metrics.BROWSER_REUSES_TOTAL.inc()
+            pooled.uses += 1
+            return pooled.driver
+
+        start = time.perf_counter()
+        driver = self.create_fn()
+        elapsed = time.perf_counter() - start
+        pooled = PooledDriver(driver)
+        pooled.uses = 1
+        with self.lock:
+            self.in_use[id(driver)] = pooled
+            self.stats['launches'] += 1
+            self.stats['launch_seconds'] += elapsed
+        self._log(f"启动新浏览器，耗时 {elapsed:.1f}秒")
+        return driver
+
+    def get_max_idle_seconds(self):
+        limit = self.max_idle_seconds
+        return limit() if callable(limit) else limit
+
+    def release(self, driver, healthy=True):
+        """归还浏览器；出错的会话或达到使用上限的会话直接退役"""
+        with self.lock:
+            pooled = self.in_use.pop(id(driver), None)
+        if pooled is None:
+            self._quit(driver)
+            return
+        pooled.last_used = time.time()
+
+        if not healthy:
+            self._retire(pooled, "本次使用出错")
+            return
+        if pooled.uses >= self.max_uses:
+            self._retire(pooled, f"已使用 {pooled.uses} 次")
+            return
+        if not self._reset(driver):
+            self._retire(pooled, "重置状态失败")
+            return
+
+        with self.lock:
+            if len(self.idle) < self.max_idle:
+                self.idle.append(pooled)
+                return
+        self._retire(pooled, "空闲数已满")
+
+    def _reset(self, driver):
+        """
+        清理上一个账号留下的状态，否则下一个账号可能以上一个账号的身份登录
+        delete_all_cookies 只能删除当前页面可见的 cookie，因此用 CDP 清除浏览器中所有域名的 cookie，
+        再按来源清除 localStorage/sessionStorage/IndexedDB/Cache Storage 等；CDP 不可用时不复用该浏览器
+        """
+        try:
+            origins = set(self.reset_origins)
+            origins.update(driver.execute_script(
+                "var o = [location.origin];"
+                "performance.getEntriesByType('resource').forEach(function (e) {"
+                "  try { o.push(new URL(e.name).origin); } catch (x) {} });"
+                "return o;") or [])
+            # 关闭多余窗口，只保留一个
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                origins.add(driver.execute_script("return location.origin;"))
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.get("about:blank")
+            driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+            for origin in origins:
+                if origin and origin.startswith('http'):
+                    driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+            return True
+        except Exception:
+            return False
+
+    def _is_alive(self, driver):
+        try:
+            driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def _retire(self, pooled, reason):
+        self._log(f"浏览器退役: {reason}")
+        with self.lock:
+            self.stats['retired'] += 1
+        self._quit(pooled.driver)
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        """关闭所有空闲浏览器"""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for pooled in idle:
+            self._retire(pooled, "会话池关闭")
+
+    def get_stats(self):
+        """获取启动/复用统计"""
+        with self.lock:
+            stats = dict(self.stats)
+            stats['idle'] = len(self.idle)
+            stats['in_use'] = len(self.in_use)
+        total = stats['launches'] + stats['reuses']
+        stats['reuse_rate'] = stats['reuses'] / total if total else 0.0
+        return stats
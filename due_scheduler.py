@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+按到期时间调度：根据每个账号的 last_keepalive、保活间隔和时间范围计算下次到期时间，
+放入最小堆，调度线程一直睡到最早到期的账号，只派发已到期的账号
+
+账号可单独设置 interval_minutes / start_time / end_time / weekend_enabled，未设置时使用 schedule 中的值。
+"""
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+import metrics
+
+WINDOW_KEYS = ('interval_minutes', 'start_time', 'end_time', 'weekend_enabled')
+
+
+def account_window(account, schedule_config):
+    """账号的保活间隔和时间范围（账号设置优先）"""
+    merged = {key: account.get(key, schedule_config.get(key)) for key in WINDOW_KEYS}
+    start = datetime.strptime(merged['start_time'] or "00:00", "%H:%M").time()
+    end = datetime.strptime(merged['end_time'] or "23:59", "%H:%M").time()
+    return {
+        'interval': timedelta(minutes=float(merged['interval_minutes'] or 30)),
+        'start': start,
+        'end': end,
+        # 与 check_schedule_window 一致：00:00-23:59 为24小时模式，不检查周末
+        'all_day': start.hour == 0 and start.minute == 0 and end.hour == 23 and end.minute == 59,
+        'weekend_enabled': bool(merged['weekend_enabled']),
+    }
+
+
+def align_to_window(moment, window):
+    """不早于 moment 且落在时间范围内的最早时刻"""
+    if window['all_day']:
+        return moment
+    for day_offset in range(8):
+        day = (moment + timedelta(days=day_offset)).date()
+        if not window['weekend_enabled'] and day.weekday() >= 5:
+            continue
+        candidate = max(moment, datetime.combine(day, window['start']))
+        if candidate <= datetime.combine(day, window['end']):
+            return candidate
+    return moment  # 时间范围配置无效时不做限制
+
+
+def parse_keepalive_time(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S") if value else None
+    except ValueError:
+        return None
+
+
+def next_due(account, schedule_config, now, not_before=None):
+    """
+    下次到期时间：上次保活成功时间 + 间隔，从未保活则立即到期；
+    not_before 用于失败后至少等一个间隔，避免没有成功记录的账号被反复派发
+    """
+    window = account_window(account, schedule_config)
+    last = parse_keepalive_time(account.get('last_keepalive'))
+    due = last + window['interval'] if last else now
+    if not_before:
+        due = max(due, not_before + window['interval'])
+    return align_to_window(max(due, now), window)
+
+
+class DueScheduler:
+    def __init__(self, manager, dispatch, batch_seconds=5.0):
+        """
+        manager: ImprovedAccountManager，提供账号和 schedule 配置
+        dispatch: 派发函数，接收到期账号ID列表，阻塞到这批账号处理完
+        batch_seconds: 在这个时间内相继到期的账号合并为一批派发
+        """
+        self.manager = manager
+        self.dispatch = dispatch
+        self.batch_seconds = batch_seconds
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.heap = []          # (到期时间戳, 序号, 账号ID)
+        self.due_at = {}        # 账号ID -> 到期时间戳，与堆中不一致的条目视为过期
+        self.in_flight = set()  # 正在处理的账号，处理完后再重新排期
+        self.sequence = itertools.count()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.refresh()
+        self.thread = threading.Thread(target=self._run, name="due-scheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+    def refresh(self):
+        """账号或调度配置变化后重新计算所有账号的到期时间"""
+        now = datetime.now()
+        schedule_config = self.manager.config['schedule']
+        with self.lock:
+            self.heap = []
+            self.due_at = {}
+            for account in self.manager.get_enabled_accounts():
+                if account['id'] not in self.in_flight:
+                    self._push(account['id'], next_due(account, schedule_config, now))
+        self.wakeup.set()
+
+    def _push(self, account_id, due):
+        timestamp = due.timestamp()
+        self.due_at[account_id] = timestamp
+        heapq.heappush(self.heap, (timestamp, next(self.sequence), account_id))
+
+    def _drop_stale(self):
+        while self.heap and self.due_at.get(self.heap[0][2]) != self.heap[0][0]:
+            heapq.heappop(self.heap)
+
+    def next_due_time(self):
+        """最早到期时间，没有账号时返回 None"""
+        with self.lock:
+            self._drop_stale()
+            return datetime.fromtimestamp(self.heap[0][0]) if self.heap else None
+
+    def _run(self):
+        while self.running:
+            with self.lock:
+                self._drop_stale()
+                delay = self.heap[0][0] - time.time() if self.heap else None
+            if delay is None or delay > 0:
+                # 睡到最早的账号到期；refresh/stop 会提前唤醒
+                self.wakeup.wait(delay)
+                self.wakeup.clear()
+                continue
+
+            batch = []
+            now = time.time()
+            with self.lock:
+                while self.heap and self.heap[0][0] <= now + self.batch_seconds:
+                    timestamp, _, account_id = heapq.heappop(self.heap)
+                    if self.due_at.get(account_id) != timestamp:
+                        continue
+                    del self.due_at[account_id]
+                    self.in_flight.add(account_id)
+                    batch.append(account_id)
+                    metrics.SCHEDULE_LAG_SECONDS.observe(max(0.0, now - timestamp))
+            if batch:
+                threading.Thread(target=self._dispatch, args=(batch,), daemon=True).start()
+
+    def _dispatch(self, account_ids):
+        started = datetime.now()
+        names = [self.manager.get_account(account_id)['name'] for account_id in account_ids
+                 if self.manager.get_account(account_id)]
+        self.manager.notify_log(f"[调度器] 到期账号 {len(account_ids)} 个: {', '.join(names)}")
+        try:
+            self.dispatch(account_ids)
+        except Exception as e:
+            self.manager.notify_log(f"[调度器] 保活任务异常: {str(e)}", "ERROR")
+        finally:
+            now = datetime.now()
+            schedule_config = self.manager.config['schedule']
+            with self.lock:
+                for account_id in account_ids:
+                    self.in_flight.discard(account_id)
+                    account = self.manager.get_account(account_id)
+                    if account and account['enabled'] and self.running:
+                        self._push(account_id, next_due(account, schedule_config, now, not_before=started))
+            self.wakeup.set()
+            upcoming = self.next_due_time()
+            if upcoming:
+                self.manager.notify_log(f"[调度器] 下次到期时间: {upcoming.strftime('%Y-%m-%d %H:%M:%S')}")
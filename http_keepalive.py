@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP 保活：不启动浏览器，直接重放门户前端调用的登录/云桌面列表/连接接口
+
+每个账号一个 requests.Session，cookie 和令牌在多轮之间复用，令牌有效时跳过登录。
+这里不内置任何门户接口：接口路径和字段必须通过 settings.http_api 配置(按浏览器开发者工具中记录的请求填写)，
+mock_portal.HTTP_API 是模拟门户的接口描述；
+登录需要验证码或接口返回失败时抛出 HttpKeepaliveError，由调用方改用浏览器保活。
+"""
+import copy
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from retry_policy import KeepaliveError
+
+# 必须配置的接口：{'method': ..., 'path': 相对门户地址, 'json'/'params': 请求内容}
+# json/params 中的 {account} {password} {desktop_id} 在请求时替换
+REQUIRED_CALLS = ('login', 'list', 'connect')
+
+# 响应字段，未配置的字段不检查
+FIELD_DEFAULTS = {
+    'token_field': None,     # 登录响应中的令牌字段
+    'token_header': None,    # 后续请求携带令牌的请求头
+    'ok_field': None,        # 响应中表示成功的字段，为空时只看 HTTP 状态码
+    'captcha_field': None,   # 登录响应中表示需要验证码的字段
+    'desktops_field': None,  # 云桌面列表响应中的列表字段
+}
+
+
+class HttpKeepaliveError(KeepaliveError):
+    """HTTP 保活失败，需要改用浏览器保活"""
+
+
+def validate_api(api):
+    """检查 settings.http_api，返回缺少的配置说明，完整时返回空列表"""
+    if not isinstance(api, dict):
+        return ["http_api"]
+    return [f"http_api.{name}.path" for name in REQUIRED_CALLS
+            if not isinstance(api.get(name), dict) or not api[name].get('path')]
+
+
+def render(value, params):
+    if isinstance(value, str):
+        return value.format_map(params)
+    if isinstance(value, dict):
+        return {key: render(item, params) for key, item in value.items()}
+    return value
+
+
+class HttpKeepaliveClient:
+    def __init__(self, base_url, api, timeout=10, pool_size=10, user_agent=None):
+        """
+        base_url: 门户地址
+        api: 接口描述(settings.http_api)，缺少 login/list/connect 时抛出 ValueError
+        pool_size: 每个 Session 的连接池大小
+        """
+        missing = validate_api(api)
+        if missing:
+            raise ValueError(f"HTTP 保活缺少接口配置: {', '.join(missing)}")
+        self.base_url = base_url if base_url.endswith('/') else base_url + '/'
+        self.api = dict(FIELD_DEFAULTS, **copy.deepcopy(api))
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.user_agent = user_agent
+        self.lock = threading.Lock()
+        self.sessions = {}  # 账号 -> requests.Session
+        self.tokens = {}    # 账号 -> 登录令牌
+        self.stats = {'logins': 0, 'token_reuses': 0, 'keepalives': 0}
+
+    def get_session(self, account):
+        with self.lock:
+            session = self.sessions.get(account)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                if self.user_agent:
+                    session.headers['User-Agent'] = self.user_agent
+                self.sessions[account] = session
+            return session
+
+    def call(self, session, name, params, token=None):
+        """按接口描述发送请求，返回 (HTTP 状态码, JSON 响应)"""
+        spec = self.api[name]
+        headers = {self.api['token_header']: token} if token and self.api['token_header'] else {}
+        response = session.request(spec.get('method', 'GET'), self.base_url + spec['path'].lstrip('/'),
+                                   json=render(spec.get('json'), params), params=render(spec.get('params'), params),
+                                   headers=headers, timeout=self.timeout)
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        return response.status_code, data if isinstance(data, dict) else {}
+
+    def is_ok(self, status, data):
+        ok_field = self.api['ok_field']
+        return status < 400 and (not ok_field or bool(data.get(ok_field)))
+
+    def login(self, session, account, password):
+        status, data = self.call(session, 'login', {'account': account, 'password': password})
+        if self.api['captcha_field'] and data.get(self.api['captcha_field']):
+            raise HttpKeepaliveError("登录需要验证码")
+        if not self.is_ok(status, data):
+            raise HttpKeepaliveError(f"登录失败: HTTP {status} {data.get('message', '')}")
+        token = data.get(self.api['token_field']) if self.api['token_field'] else None
+        with self.lock:
+            self.stats['logins'] += 1
+            if token:
+                self.tokens[account] = token
+        return token
+
+    def keepalive(self, account, password):
+        """登录(令牌失效时)、获取云桌面列表并连接，返回本次结果说明"""
+        session = self.get_session(account)
+        params = {'account': account, 'password': password}
+        token = self.tokens.get(account)
+        data = None
+        if token or session.cookies:
+            # 先用上一轮的令牌/cookie 访问，失效时再登录
+            status, data = self.call(session, 'list', params, token)
+            if not self.is_ok(status, data):
+                data = None
+        logged_in = data is None
+        if logged_in:
+            token = self.login(session, account, password)
+            status, data = self.call(session, 'list', params, token)
+            if not self.is_ok(status, data):
+                raise HttpKeepaliveError(f"获取云桌面列表失败: HTTP {status}")
+        else:
+            with self.lock:
+                self.stats['token_reuses'] += 1
+
+        desktops = (data.get(self.api['desktops_field']) if self.api['desktops_field'] else None) or []
+        connect_params = dict(params, desktop_id=desktops[0].get('id', '') if desktops else '')
+        status, data = self.call(session, 'connect', connect_params, token)
+        if not self.is_ok(status, data):
+            self.invalidate(account)
+            raise HttpKeepaliveError(f"连接云桌面失败: HTTP {status} {data.get('message', '')}")
+        with self.lock:
+            self.stats['keepalives'] += 1
+        return f"{'重新登录' if logged_in else '复用会话'}，云桌面 {len(desktops)} 个"
+
+    def invalidate(self, account):
+        """丢弃账号的会话和令牌，下次重新登录"""
+        with self.lock:
+            self.tokens.pop(account, None)
+            session = self.sessions.pop(account, None)
+        if session:
+            session.close()
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, sessions=len(self.sessions))
+
+    def close(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+            self.tokens.clear()
+        for session in sessions:
+            session.close()
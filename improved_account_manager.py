@@ -5,38 +5,89 @@ import sys
 import time
 import threading
 import queue
-import schedule
-from datetime import datetime, timedelta
+import heapq
+import itertools
+import sqlite3
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime
+from urllib.parse import urlsplit
 from selenium import webdriver
-from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.options import Options as ChromeOptions
 from selenium.webdriver.edge.options import Options as EdgeOptions
 from webdriver_manager.chrome import ChromeDriverManager
 from webdriver_manager.microsoft import EdgeChromiumDriverManager
 from selenium.webdriver.chrome.service import Service as ChromeService
 from selenium.webdriver.edge.service import Service as EdgeService
+from selenium.webdriver.support import expected_conditions as EC
 import logging
 import os
-import my_captcha
+import async_logging
+from async_logging import CallbackHandler
+from captcha_service import get_captcha_service, get_service_stats, close_captcha_service
+import metrics
+import browser_profile
+from driver_pool import DriverPool
+from config_store import atomic_write_json, WriteBehindWriter
+from account_store import AccountStore, is_store_path
+from session_cache import SessionCache
+from screenshot_writer import ScreenshotWriter
+from wait_engine import StepWaiter
+from step_plan import StepRunner, get_plan
+from wait_engine import Wait, run_steps
+from http_keepalive import validate_api
+from retry_policy import RetryPolicy, CaptchaExhaustedError, classify_failure
+
+PORTAL_BASE_URL = "https://pc.ctyun.cn/"
 
 class ImprovedAccountManager:
     def __init__(self, config_file="accounts_config.json"):
         self.config_file = config_file
+        # 扩展名为 .db/.sqlite 时使用 SQLite 账号库，否则使用 JSON 配置文件
+        self.store = AccountStore(config_file) if is_store_path(config_file) else None
+        self.account_index = {}     # 账号ID -> 账号，随 config['accounts'] 变化重建
+        self.indexed_accounts = None
+        self.config_lock = threading.RLock()  # 并发保活时保护配置读写
         self.config = self.load_config()
         self.is_scheduler_running = False
-        self.logger = self.setup_logger()
+        self.scheduler = None
         self.status_callbacks = []  # 状态回调函数列表
         self.log_callbacks = []     # 日志回调函数列表
+        self.logger = self.setup_logger()
+        settings = self.config['settings']
+        self.driver_pool = DriverPool(self.create_driver,
+                                      max_idle=settings.get('concurrent_limit', 3),
+                                      max_uses=settings.get('browser_max_uses', 10),
+                                      max_idle_seconds=self.browser_max_idle_seconds,
+                                      logger=self.logger)
+        portal = urlsplit(self.portal_url())
+        self.driver_pool.reset_origins = (f"{portal.scheme}://{portal.netloc}",)
+        self.session_cache = SessionCache(settings.get('session_cache_dir', 'sessions'))
+        self.http_client = None     # HTTP 保活客户端，首次使用时创建
+        self.http_api_warned = False
+        self.worker_queue = None    # 工作进程模式下的共享租约队列，保活结果按行写入其中
+        self.web_server = None      # /metrics 和验证码输入页面的服务线程
+        self.screenshot_writer = ScreenshotWriter('static', settings.get('screenshot'), self.logger)
+        self.live_status = {}       # 账号ID -> 过程中的临时状态（只在内存中，不写盘）
+        self.attempt_history = deque(maxlen=1000)  # 最近的保活尝试记录
+        # 单飞：同一时间只进行一轮保活，新的触发合并到进行中或排队的一轮
+        self.round_lock = threading.Lock()
+        self.round_current = None   # {'ids': 账号ID集合(None 表示全部启用账号), 'done': Event}
+        self.round_pending = None
+        self.round_stats = {'started': 0, 'queued': 0, 'merged': 0}
+        self.config_writer = WriteBehindWriter(self.save_config,
+                                               delay=settings.get('status_flush_seconds', 2),
+                                               logger=self.logger)
+        if self.store and settings.get('history_days'):
+            self.store.prune_history(settings['history_days'])
+        # 启动时就拉起识别进程并加载模型，第一张验证码不必在超时时间内等待进程启动
+        self.get_captcha_service()
         
     def setup_logger(self):
-        """设置日志"""
+        """设置日志：文件、控制台和界面回调都在后台线程中处理"""
         logger = logging.getLogger('ImprovedAccountManager')
         logger.setLevel(logging.INFO)
         
-        # 清除已有的处理器
-        for handler in logger.handlers[:]:
-            logger.removeHandler(handler)
-        
         # 创建文件处理器
         if not os.path.exists('logs'):
             os.makedirs('logs')
@@ -52,10 +103,15 @@ class ImprovedAccountManager:
         formatter = logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s')
         file_handler.setFormatter(formatter)
         console_handler.setFormatter(formatter)
-        
-        logger.addHandler(file_handler)
-        logger.addHandler(console_handler)
-        
+
+        # 界面回调收到与之前相同格式的消息
+        callback_handler = CallbackHandler(self.log_callbacks)
+        callback_handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] %(message)s', '%Y-%m-%d %H:%M:%S'))
+
+        settings = self.config['settings']
+        self.async_logging = async_logging.install(logger, [file_handler, console_handler, callback_handler],
+                                                   max_queue=settings.get('log_queue_size', 10000),
+                                                   overflow=settings.get('log_overflow', 'drop'))
         return logger
         
     def add_status_callback(self, callback):
@@ -63,7 +119,7 @@ class ImprovedAccountManager:
         self.status_callbacks.append(callback)
         
     def add_log_callback(self, callback):
-        """添加日志回调"""
+        """添加日志回调 callback(message, account)，account 为日志所属账号的名称(与账号无关的日志为 None)"""
         self.log_callbacks.append(callback)
         
     def notify_status_change(self, account_id, status, last_keepalive=None):
@@ -75,26 +131,20 @@ class ImprovedAccountManager:
             except:
                 pass
                 
-    def notify_log(self, message, level="INFO"):
-        """通知日志更新"""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_message = f"[{timestamp}] [{level}] {message}"
-
-        # 写入日志文件
-        getattr(self.logger, level.lower())(message)
-
-        # 通知回调
-        for callback in self.log_callbacks:
-            try:
-                # 确保消息能正确传递到GUI
-                callback(log_message)
-            except Exception as e:
-                # 调试：如果回调失败，输出到控制台
-                print(f"Log callback error: {e}")
-                print(f"Message: {log_message}")
+    def notify_log(self, message, level="INFO", account=None):
+        """
+        通知日志更新：只放入日志队列，写文件和界面回调由后台线程完成
+        account: 日志所属的账号，随日志记录传给回调，界面按它筛选
+        """
+        getattr(self.logger, level.lower())(message, extra={'notify': True,
+                                                            'account': account['name'] if account else None})
         
     def load_config(self):
         """加载配置文件"""
+        if self.store:
+            if self.store.is_empty():
+                return self.create_default_config()
+            return self.store.load_config()
         try:
             with open(self.config_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
@@ -112,7 +162,14 @@ class ImprovedAccountManager:
                 "browser_type": "edge",
                 "browser_path": "C:\\Program Files (x86)\\Microsoft\\Edge\\Application\\msedge.exe",
                 "headless": False,
-                "sequential_mode": True  # 顺序模式
+                "sequential_mode": True,  # 顺序模式
+                "concurrent_limit": 3,    # 并发模式下同时保活的账号数
+                "browser_reuse": True,    # 多轮之间复用浏览器
+                "browser_max_uses": 10,   # 单个浏览器最多复用次数
+                "browser_max_idle_minutes": 0,  # 空闲浏览器保留时长(分钟)，0 表示按保活间隔推算
+                "session_cache": True,    # 缓存登录会话，跳过登录表单
+                "browser_profile": "lean", # 资源配置: lean 拦截图片/字体/媒体/统计脚本, full 不限制
+                "status_flush_seconds": 2 # 状态变更合并写盘的间隔
             },
             "schedule": {
                 "enabled": True,
@@ -129,12 +186,21 @@ class ImprovedAccountManager:
         """保存配置文件"""
         if config is None:
             config = self.config
-        with open(self.config_file, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=2)
+        with self.config_lock:
+            # 在锁内序列化出快照，避免写盘时其他线程修改
+            snapshot = json.loads(json.dumps(config))
+        if self.store:
+            self.store.save_config(snapshot)
+        else:
+            atomic_write_json(self.config_file, snapshot)
+
+    def flush_config(self):
+        """立即写入延迟中的状态变更"""
+        self.config_writer.flush()
             
     def add_account(self, name, account, password):
         """添加账号"""
-        account_id = len(self.config['accounts']) + 1
+        account_id = max((acc['id'] for acc in self.config['accounts']), default=0) + 1
         new_account = {
             "id": account_id,
             "name": name,
@@ -145,29 +211,95 @@ class ImprovedAccountManager:
             "status": "未运行"
         }
         self.config['accounts'].append(new_account)
-        self.save_config()
+        if self.store:
+            self.store.add_account(new_account)
+        else:
+            self.save_config()
         self.notify_log(f"添加账号: {name} ({account})")
+        self.refresh_schedule()
         return account_id
         
     def remove_account(self, account_id):
         """删除账号"""
-        for i, account in enumerate(self.config['accounts']):
-            if account['id'] == account_id:
-                removed = self.config['accounts'].pop(i)
-                self.save_config()
-                self.notify_log(f"删除账号: {removed['name']}")
-                return True
-        return False
+        removed = self.get_account(account_id)
+        if removed is None:
+            return False
+        with self.config_lock:
+            self.config['accounts'].remove(removed)
+        if self.store:
+            self.store.remove_account(account_id)
+        else:
+            self.save_config()
+        self.notify_log(f"删除账号: {removed['name']}")
+        self.refresh_schedule()
+        return True
+
+    def get_account(self, account_id):
+        """按ID查找账号；config['accounts'] 被替换或增删后自动重建索引"""
+        accounts = self.config['accounts']
+        if self.indexed_accounts is not accounts or len(self.account_index) != len(accounts):
+            with self.config_lock:
+                self.account_index = {acc['id']: acc for acc in accounts}
+                self.indexed_accounts = accounts
+        return self.account_index.get(account_id)
         
+    def is_durable_status(self, status, last_keepalive=None):
+        """最终结果需要持久化，过程中的临时状态只保留在内存"""
+        return bool(last_keepalive) or status == "保活成功" or status.startswith("失败")
+
     def update_account_status(self, account_id, status, last_keepalive=None):
-        """更新账号状态"""
-        for account in self.config['accounts']:
-            if account['id'] == account_id:
-                account['status'] = status
-                if last_keepalive:
-                    account['last_keepalive'] = last_keepalive
-                self.save_config()
-                break
+        """更新账号状态：临时状态只记在内存，最终状态合并后延迟写盘"""
+        if not self.is_durable_status(status, last_keepalive):
+            self.live_status[account_id] = status
+            return
+        self.live_status.pop(account_id, None)
+        account = self.get_account(account_id)
+        if account is None:
+            return
+        with self.config_lock:
+            account['status'] = status
+            if last_keepalive:
+                account['last_keepalive'] = last_keepalive
+        if self.store:
+            # SQLite 只更新这一行，无需合并写盘
+            self.store.update_status(account_id, status, last_keepalive)
+        elif self.worker_queue is not None:
+            # 多个工作进程共用同一个配置文件，整体写回会互相覆盖，结果只写入队列中该账号的一行
+            self.worker_queue.update_status(account['account'], status, last_keepalive)
+        else:
+            self.config_writer.mark_dirty()
+
+    def get_account_status(self, account, worker_statuses=None):
+        """
+        账号当前显示的状态和最后保活时间，返回 (状态, 最后保活时间)
+        优先显示过程中的临时状态；worker_statuses(get_worker_statuses 的结果)中有更新的保活结果时以它为准
+        """
+        status, last_keepalive = account['status'], account['last_keepalive']
+        worker_status, worker_keepalive = (worker_statuses or {}).get(account['account'], (None, None))
+        if worker_status and (worker_keepalive or '') >= (last_keepalive or ''):
+            status, last_keepalive = worker_status, worker_keepalive or last_keepalive
+        return self.live_status.get(account['id'], status), last_keepalive
+
+    def get_worker_statuses(self):
+        """
+        工作进程写入共享队列(settings.worker_queue)的保活结果，返回 {手机号: (状态, 最后保活时间)}
+        使用 JSON 配置文件时工作进程不写回配置文件，界面和状态摘要从这里取得各进程的结果；队列不存在时为空
+        """
+        if self.worker_queue is not None:
+            return self.worker_queue.get_statuses()
+        path = self.config['settings'].get('worker_queue') or 'keepalive_queue.db'
+        if self.store or not os.path.exists(path):
+            return {}
+        from lease_queue import LeaseQueue
+        try:
+            lease_queue = LeaseQueue(path)
+        except sqlite3.Error as e:
+            self.notify_log(f"读取工作进程队列失败: {str(e)}", "WARNING")
+            return {}
+        try:
+            return lease_queue.get_statuses()
+        finally:
+            lease_queue.close()
                 
     def get_enabled_accounts(self):
         """获取启用的账号列表"""
@@ -186,6 +318,8 @@ class ImprovedAccountManager:
         options.add_argument('--disable-blink-features=AutomationControlled')
         options.add_experimental_option("excludeSwitches", ["enable-automation"])
         options.add_experimental_option('useAutomationExtension', False)
+        profile = browser_profile.get_profile(settings.get('browser_profile', 'lean'), settings.get('browser_profile_overrides'))
+        browser_profile.apply_options(options, profile)
         
         # 无头模式
         if settings['headless']:
@@ -238,251 +372,625 @@ class ImprovedAccountManager:
                 driver = webdriver.Chrome(options=options)
             
         driver.execute_script("Object.defineProperty(navigator, 'webdriver', {get: () => undefined})")
+        try:
+            browser_profile.apply_network_rules(driver, profile, self.logger.info)
+        except Exception as e:
+            self.logger.warning(f"设置资源拦截失败: {str(e)}")
+        metrics.BROWSER_LAUNCHES_TOTAL.inc()
         return driver
+
+    def acquire_driver(self):
+        """获取浏览器：启用复用时从会话池取，否则新建"""
+        if self.config['settings'].get('browser_reuse', True):
+            return self.driver_pool.acquire()
+        return self.create_driver()
+
+    def release_driver(self, driver, healthy=True):
+        """归还浏览器：启用复用时放回会话池，否则直接关闭"""
+        if self.config['settings'].get('browser_reuse', True):
+            self.driver_pool.release(driver, healthy)
+        else:
+            driver.quit()
+
+    def start_metrics_server(self):
+        """settings.metrics_port > 0 时启动 Web 服务，提供 /metrics 和验证码输入页面"""
+        port = int(self.config['settings'].get('metrics_port', 0))
+        if port <= 0:
+            return None
+        import webthread
+        self.notify_log(f"[监控] 指标地址: http://0.0.0.0:{port}/metrics，验证码输入: http://0.0.0.0:{port}/")
+        self.web_server = webthread.web_run(port=port)
+        return self.web_server
+
+    def shutdown(self):
+        """程序退出前关闭会话池中的浏览器并写入未保存的状态"""
+        self.driver_pool.close()
+        if self.http_client:
+            self.http_client.close()
+        self.screenshot_writer.close()
+        close_captcha_service()
+        self.config_writer.close()
+        if self.store:
+            self.store.close()
+        self.async_logging.stop()
         
-    def keepalive_single_account(self, account):
-        """对单个账号执行保活操作"""
+    def portal_url(self, route=""):
+        """门户地址，settings.portal_url 可指向本地模拟门户用于测试"""
+        base = self.config['settings'].get('portal_url') or PORTAL_BASE_URL
+        if not base.endswith('/'):
+            base += '/'
+        return base + route
+
+    def browser_max_idle_seconds(self):
+        """
+        空闲浏览器的最长保留时间：settings.browser_max_idle_minutes，未设置时为最长保活间隔(含账号单独设置)再加 10 分钟，
+        这样按间隔轮转的浏览器在下一轮仍能复用；每次取用时读取，修改间隔后立即生效
+        """
+        settings = self.config['settings']
+        if settings.get('browser_max_idle_minutes'):
+            return float(settings['browser_max_idle_minutes']) * 60
+        intervals = [self.config['schedule'].get('interval_minutes') or 30]
+        intervals += [account['interval_minutes'] for account in self.config['accounts']
+                      if account.get('interval_minutes')]
+        return (max(float(value) for value in intervals) + 10) * 60
+
+    def make_waiter(self, driver, account):
+        """创建条件等待器，超时时间取自 settings.wait_timeouts"""
+        return StepWaiter(driver, self.config['settings'].get('wait_timeouts'),
+                          log=lambda message: self.notify_log(f"[{account['name']}] {message}", account=account))
+
+    def get_step_plan(self):
+        """编译后的保活步骤表，settings.portal_version / step_overrides 可按门户版本覆盖"""
+        settings = self.config['settings']
+        return get_plan(settings.get('portal_version'), settings.get('step_overrides'))
+
+    def make_runner(self, driver, account, waiter):
+        """创建步骤解释器，日志和等待沿用 waiter"""
+        return StepRunner(driver, waiter, self.get_step_plan(),
+                          {'account': account['account'], 'password': account['password']}, log=waiter.log)
+
+    def login_with_form(self, driver, account, waiter):
+        """通过登录表单登录（含验证码处理），步骤生成器"""
         account_id = account['id']
         account_name = account['name']
-        
-        self.notify_log(f"开始保活账号: {account_name}")
-        self.notify_status_change(account_id, "正在初始化")
-        
-        driver = None
-        try:
-            # 创建浏览器驱动
-            self.notify_log(f"[{account_name}] 正在启动浏览器...")
-            self.notify_status_change(account_id, "启动浏览器")
-            driver = self.create_driver()
-            
-            # 访问登录页面
-            self.notify_log(f"[{account_name}] 正在访问登录页面...")
-            self.notify_status_change(account_id, "访问登录页面")
-            driver.get("https://pc.ctyun.cn/#/login")
-            time.sleep(3)
-            
-            # 登录
-            self.notify_log(f"[{account_name}] 正在登录...")
-            self.notify_status_change(account_id, "正在登录")
-            
-            # 查找并填写账号
+
+        # 访问登录页面
+        self.notify_log(f"[{account_name}] 正在访问登录页面...", account=account)
+        self.notify_status_change(account_id, "访问登录页面")
+        with metrics.STEP_SECONDS.time(step='page_load'):
+            driver.get(self.portal_url("#/login"))
+
+        # 填写账号、密码并点击登录，等待跳转到云桌面列表、出现验证码或出现错误提示
+        self.notify_log(f"[{account_name}] 正在登录...", account=account)
+        self.notify_status_change(account_id, "正在登录")
+        runner = self.make_runner(driver, account, waiter)
+        yield from runner.iter_run('login')
+
+        # 检查是否需要验证码
+        captcha_retry_count = 0
+        max_captcha_retries = 3
+
+        while True:
+            captcha_input = yield from runner.iter_find('captcha_code')
+            captcha_img = (yield from runner.iter_find('captcha_image')) if captcha_input else None
+            if captcha_input is None or captcha_img is None:
+                self.notify_log(f"[{account_name}] 无需验证码或验证码处理完成", account=account)
+                break
+            if captcha_input.get_attribute('value') != '':
+                # 验证码输入框已有内容，说明不需要输入验证码
+                break
+            if captcha_retry_count >= max_captcha_retries:
+                raise CaptchaExhaustedError(f"验证码重试次数超过限制({max_captcha_retries})")
+
+            captcha_retry_count += 1
+            self.notify_log(f"[{account_name}] 需要输入验证码 (第{captcha_retry_count}次尝试)", account=account)
+            self.notify_status_change(account_id, f"输入验证码({captcha_retry_count}/{max_captcha_retries})")
+
+            # 直接在内存中截取验证码图片，交给识别进程，这里只等待结果
+            metrics.CAPTCHA_ATTEMPTS_TOTAL.inc()
+            captcha_png = captcha_img.screenshot_as_png
+            ocr_start = time.perf_counter()
+            recognized = False
             try:
-                account_input = driver.find_element(By.CLASS_NAME, "account")
-                account_input.clear()
-                account_input.send_keys(account['account'])
-                self.notify_log(f"[{account_name}] 账号输入完成")
+                with metrics.STEP_SECONDS.time(step='captcha'):
+                    # 同一张图片重试时直接取缓存结果；已被拒绝过的答案不会再返回
+                    verify_code = yield Wait('result', self.get_captcha_service().submit(captcha_png), 30)
+                if verify_code and verify_code.strip() and verify_code.strip() != 'nofoundOCR':
+                    recognized = True
+                    metrics.OCR_TOTAL.inc(result='success')
+                    self.notify_log(f"[{account_name}] 自动识别验证码: {verify_code} "
+                                    f"(识别耗时 {time.perf_counter() - ocr_start:.2f}秒)", account=account)
+                else:
+                    metrics.OCR_TOTAL.inc(result='failure')
+                    self.notify_log(f"[{account_name}] 验证码识别失败", account=account)
             except Exception as e:
-                raise Exception(f"无法找到账号输入框: {str(e)}")
-            
-            # 查找并填写密码
+                metrics.OCR_TOTAL.inc(result='failure')
+                self.notify_log(f"[{account_name}] 验证码识别异常: {str(e)}", account=account)
+            if not recognized:
+                # 识别失败时推送到网页等待人工输入，没有输入则使用默认值
+                verify_code = yield from self.relay_captcha(account, captcha_png)
+                if verify_code:
+                    self.notify_log(f"[{account_name}] 收到网页输入的验证码: {verify_code}", account=account)
+                else:
+                    verify_code = "0000"
+                    self.notify_log(f"[{account_name}] 未取得验证码，使用默认值: {verify_code}", account=account)
+
+            # 输入验证码并再次点击登录，等待登录结果
+            yield from runner.iter_step('captcha_code', captcha=verify_code)
+            yield from runner.iter_step('captcha_submit')
+            accepted = "desktop-list" in driver.current_url
+            if recognized:
+                self.get_captcha_service().report(captcha_png, verify_code, accepted)
+            if accepted:
+                self.notify_log(f"[{account_name}] 验证码输入成功，登录完成", account=account)
+                break
+            self.notify_log(f"[{account_name}] 验证码可能错误，准备重试", account=account)
+
+    def relay_captcha(self, account, captcha_png):
+        """Web 服务已启动时把验证码推送到网页(按账号区分)，返回网页输入的验证码，超时返回 None；步骤生成器"""
+        wait_seconds = self.config['settings'].get('captcha_relay_seconds', 60)
+        if self.web_server is None or wait_seconds <= 0:
+            return None
+        import webthread
+        challenge = webthread.relay.open(f"{account['name']}({account['account']})", captcha_png)
+        self.notify_log(f"[{account['name']}] 等待网页输入验证码(最多{wait_seconds}秒)", account=account)
+        try:
+            return (yield Wait('result', challenge.future, wait_seconds))
+        except Exception:
+            return None
+        finally:
+            webthread.relay.close(challenge.id)
+
+    def get_captcha_service(self):
+        """验证码识别服务，settings.ocr_workers 为识别进程数(0 表示在本进程识别)"""
+        settings = self.config['settings']
+        return get_captcha_service(workers=settings.get('ocr_workers', 1),
+                                   batch_size=settings.get('ocr_batch_size', 4),
+                                   batch_wait=settings.get('ocr_batch_wait_ms', 20) / 1000,
+                                   logger=self.logger,
+                                   cache_size=settings.get('captcha_cache_size', 256))
+
+    def try_cached_session(self, driver, account, waiter):
+        """尝试用缓存的 cookie/localStorage 直接进入云桌面列表，步骤生成器"""
+        if not self.config['settings'].get('session_cache', True):
+            return False
+        account_name = account['name']
+
+        hit = False
+        if self.session_cache.inject(driver, account['account'], self.portal_url(), self.portal_url("#/desktop-list")):
+            # 会话失效时前端会跳回登录页，等到"进入"按钮出现才算有效
+            entry = self.get_step_plan().step('desktop_entry')
             try:
-                password_input = driver.find_element(By.CLASS_NAME, "password")
-                password_input.clear()
-                password_input.send_keys(account['password'])
-                self.notify_log(f"[{account_name}] 密码输入完成")
-            except Exception as e:
-                raise Exception(f"无法找到密码输入框: {str(e)}")
-            
-            # 点击登录
+                hit = (yield Wait('until', entry.find_condition(), "缓存会话校验", 'session_restore', None, False)) is not None
+            except Exception:
+                hit = False
+        self.session_cache.settle(account['account'], hit)
+        rate, hits, total = self.session_cache.get_hit_rate(account['account'])
+        self.notify_log(f"[{account_name}] 会话缓存{'命中' if hit else '未命中'}，"
+                        f"命中率: {rate:.0%} ({hits}/{total})", account=account)
+        return hit
+
+    def begin_keepalive(self, account):
+        """保活开始时的日志和状态"""
+        self.notify_log(f"开始保活账号: {account['name']}", account=account)
+        self.notify_status_change(account['id'], "正在初始化")
+        self.notify_log(f"[{account['name']}] 正在启动浏览器...", account=account)
+        self.notify_status_change(account['id'], "启动浏览器")
+
+    def open_desktop_list(self, driver, account, waiter, state):
+        """登录并进入云桌面列表（优先使用缓存会话），失败时抛出异常；步骤生成器"""
+        account_id = account['id']
+        account_name = account['name']
+
+        # 优先使用缓存的登录会话，失效时再走登录表单
+        step_start = time.perf_counter()
+        if (yield from self.try_cached_session(driver, account, waiter)):
+            state['used_cache'] = True
+        else:
+            yield from self.login_with_form(driver, account, waiter)
+
+            # 等待登录完成
+            self.notify_log(f"[{account_name}] 等待登录完成...", account=account)
+            yield Wait('until', EC.url_contains("desktop-list"), "登录完成", 'login_result', None, False)
+        metrics.STEP_SECONDS.observe(time.perf_counter() - step_start, step='login')
+
+        current_url = driver.current_url
+        self.notify_log(f"[{account_name}] 当前页面URL: {current_url}", account=account)
+        if "desktop-list" not in current_url:
+            raise Exception(f"登录后页面异常，当前URL: {current_url}")
+
+        self.notify_log(f"[{account_name}] 登录成功，已进入云桌面列表", account=account)
+        self.notify_status_change(account_id, "查找云桌面")
+        if not state.get('used_cache') and self.config['settings'].get('session_cache', True):
             try:
-                login_btn = driver.find_element(By.CLASS_NAME, "btn-submit")
-                login_btn.click()
-                self.notify_log(f"[{account_name}] 已点击登录按钮")
+                self.session_cache.save(driver, account['account'])
             except Exception as e:
-                raise Exception(f"无法找到登录按钮: {str(e)}")
-            
-            # 等待页面响应
-            time.sleep(3)
-            
-            # 检查是否需要验证码
-            captcha_retry_count = 0
-            max_captcha_retries = 3
-            
-            while captcha_retry_count < max_captcha_retries:
-                try:
-                    # 检查是否有验证码输入框
-                    captcha_input = driver.find_element(By.CLASS_NAME, 'code')
-                    captcha_img = driver.find_element(By.CLASS_NAME, 'code-img')
-                    
-                    if captcha_input.get_attribute('value') == '':
-                        captcha_retry_count += 1
-                        self.notify_log(f"[{account_name}] 需要输入验证码 (第{captcha_retry_count}次尝试)")
-                        self.notify_status_change(account_id, f"输入验证码({captcha_retry_count}/{max_captcha_retries})")
-                        
-                        # 保存验证码图片
-                        safe_name = "".join(c for c in account_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                        safe_phone = account['account']
-                        captcha_filename = f"{safe_name}_{safe_phone}_captcha.png"
-                        captcha_path = f"static/{captcha_filename}"
-                        
-                        if not os.path.exists('static'):
-                            os.makedirs('static')
-                        
-                        captcha_img.screenshot(captcha_path)
-                        self.notify_log(f"[{account_name}] 验证码图片已保存: {captcha_path}")
-                        
-                        # 尝试自动识别验证码
-                        try:
-                            verify_code = my_captcha.captcha_pic(captcha_path)
-                            if verify_code and verify_code.strip() and verify_code.strip() != 'nofoundOCR':
-                                self.notify_log(f"[{account_name}] 自动识别验证码: {verify_code}")
-                            else:
-                                # 如果识别失败，使用默认值或者提示用户
-                                verify_code = "0000"
-                                self.notify_log(f"[{account_name}] 验证码识别失败，使用默认值: {verify_code}")
-                        except Exception as e:
-                            verify_code = "0000"
-                            self.notify_log(f"[{account_name}] 验证码识别异常: {str(e)}, 使用默认值: {verify_code}")
-                        
-                        # 输入验证码
-                        captcha_input.clear()
-                        captcha_input.send_keys(verify_code)
-                        self.notify_log(f"[{account_name}] 已输入验证码: {verify_code}")
-                        
-                        # 再次点击登录按钮
-                        login_btn = driver.find_element(By.CLASS_NAME, "btn-submit")
-                        login_btn.click()
-                        self.notify_log(f"[{account_name}] 重新点击登录按钮")
-                        
-                        # 等待响应
-                        time.sleep(5)
-                        
-                        # 检查登录结果
-                        current_url = driver.current_url
-                        if "desktop-list" in current_url:
-                            self.notify_log(f"[{account_name}] 验证码输入成功，登录完成")
-                            break
-                        else:
-                            self.notify_log(f"[{account_name}] 验证码可能错误，准备重试")
-                            if captcha_retry_count >= max_captcha_retries:
-                                raise Exception(f"验证码重试次数超过限制({max_captcha_retries})")
-                            continue
-                    else:
-                        # 验证码输入框已有内容，说明不需要输入验证码
-                        break
-                        
-                except Exception as captcha_e:
-                    # 没有找到验证码元素，说明不需要验证码
-                    self.notify_log(f"[{account_name}] 无需验证码或验证码处理完成")
-                    break
-            
-            # 等待登录完成
-            self.notify_log(f"[{account_name}] 等待登录完成...")
-            time.sleep(5)
-            
-            current_url = driver.current_url
-            self.notify_log(f"[{account_name}] 当前页面URL: {current_url}")
-            
-            if "desktop-list" in current_url:
-                self.notify_log(f"[{account_name}] 登录成功，已进入云桌面列表")
-                self.notify_status_change(account_id, "查找云桌面")
-                
-                # 查找云桌面进入按钮
-                desktop_btn = None
-                try:
-                    self.notify_log(f"[{account_name}] 正在查找云桌面进入按钮...")
-                    desktop_btn = driver.find_element(By.XPATH, "//span[contains(text(), '进入') and contains(@class, 'desktop-main-entry-text')]")
-                    self.notify_log(f"[{account_name}] 找到云桌面进入按钮（span元素）")
-                except:
-                    try:
-                        desktop_btn = driver.find_element(By.XPATH, "//*[contains(text(), '进入')]")
-                        self.notify_log(f"[{account_name}] 找到云桌面进入按钮（通用元素）")
-                    except:
-                        try:
-                            desktop_btn = driver.find_element(By.CLASS_NAME, "desktop-main-entry-text")
-                            self.notify_log(f"[{account_name}] 找到云桌面进入按钮（class定位）")
-                        except:
-                            raise Exception("未找到云桌面进入按钮")
-                
-                if desktop_btn:
-                    self.notify_log(f"[{account_name}] 正在点击进入云桌面...")
-                    self.notify_status_change(account_id, "连接云桌面")
-                    desktop_btn.click()
-                    
-                    # 等待云桌面加载
-                    self.notify_log(f"[{account_name}] 等待云桌面加载...")
-                    wait_count = 0
-                    while wait_count < 30:
-                        time.sleep(1)
-                        wait_count += 1
-                        current_url = driver.current_url
-                        if "desktop?id=" in current_url:
-                            self.notify_log(f"[{account_name}] 云桌面加载成功，URL: {current_url}")
-                            break
-                        elif wait_count % 5 == 0:
-                            self.notify_log(f"[{account_name}] 等待云桌面加载中... ({wait_count}/30秒)")
-                    
-                    # 额外等待让云桌面完全加载，避免截图只显示加载中的画面
-                    self.notify_log(f"[{account_name}] 等待云桌面完全加载，避免截图显示加载画面...")
-                    time.sleep(20)  # 等待20秒让云桌面完全加载
-                    
-                    # 保存截图，使用账号名称和手机号作为文件名
-                    # 清理文件名中的特殊字符
-                    safe_name = "".join(c for c in account_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                    safe_phone = account['account']
-                    screenshot_filename = f"{safe_name}_{safe_phone}_screenshot.png"
-                    screenshot_path = f"static/{screenshot_filename}"
-                    
-                    try:
-                        if not os.path.exists('static'):
-                            os.makedirs('static')
-                        driver.save_screenshot(screenshot_path)
-                        self.notify_log(f"[{account_name}] 截图已保存: {screenshot_path}")
-                    except Exception as e:
-                        self.notify_log(f"[{account_name}] 保存截图失败: {str(e)}", "WARNING")
-                    
-                    # 发送保活信号
-                    try:
-                        driver.execute_script("console.log('keepalive signal');")
-                        self.notify_log(f"[{account_name}] 保活信号发送成功")
-                    except Exception as e:
-                        self.notify_log(f"[{account_name}] 发送保活信号失败: {str(e)}", "WARNING")
-                    
-                    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    self.notify_status_change(account_id, "保活成功", current_time)
-                    self.notify_log(f"[{account_name}] 保活操作成功完成")
-                    
-                    return True
-                else:
-                    raise Exception("未能获取云桌面进入按钮")
-            else:
-                raise Exception(f"登录后页面异常，当前URL: {current_url}")
-                
+                self.notify_log(f"[{account_name}] 保存会话缓存失败: {str(e)}", "WARNING", account=account)
+
+    def click_desktop_entry(self, driver, account, waiter):
+        """查找并点击云桌面"进入"按钮，步骤生成器"""
+        account_name = account['name']
+        self.notify_log(f"[{account_name}] 正在查找并点击云桌面进入按钮...", account=account)
+        self.notify_status_change(account['id'], "连接云桌面")
+        yield from self.make_runner(driver, account, waiter).iter_run('enter_desktop')
+        self.notify_log(f"[{account_name}] 等待云桌面加载...", account=account)
+
+    def wait_desktop_ready(self, driver, account, waiter):
+        """等待云桌面地址跳转、画面出现且页面稳定，避免截图只显示加载中的画面；步骤生成器"""
+        account_name = account['name']
+        self.notify_log(f"[{account_name}] 等待云桌面完全加载，避免截图显示加载画面...", account=account)
+        yield from self.make_runner(driver, account, waiter).iter_run('desktop_ready')
+        self.notify_log(f"[{account_name}] 当前URL: {driver.current_url}", account=account)
+
+    def keepalive_steps(self, driver, account, waiter, state):
+        """
+        从登录到云桌面加载完成的全部步骤，步骤生成器：
+        同步模式用 run_steps 在当前线程中执行，异步模式由 AsyncKeepaliveOrchestrator 在事件循环中 await 每次等待
+        """
+        yield from self.open_desktop_list(driver, account, waiter, state)
+        yield from self.click_desktop_entry(driver, account, waiter)
+        step_start = time.perf_counter()
+        yield from self.wait_desktop_ready(driver, account, waiter)
+        metrics.STEP_SECONDS.observe(time.perf_counter() - step_start, step='desktop_load')
+
+    def use_http_keepalive(self, account):
+        """
+        账号设置 http_keepalive 优先，否则使用 settings.http_keepalive(默认关闭)
+        还需要配置 settings.http_api(门户接口描述)，未配置时只记录一次警告并使用浏览器保活
+        """
+        if not account.get('http_keepalive', self.config['settings'].get('http_keepalive', False)):
+            return False
+        missing = validate_api(self.config['settings'].get('http_api'))
+        if missing:
+            if not self.http_api_warned:
+                self.http_api_warned = True
+                self.notify_log(f"已开启 HTTP 保活但缺少接口配置({', '.join(missing)})，使用浏览器保活", "WARNING")
+            return False
+        return True
+
+    def get_http_client(self):
+        if self.http_client is None:
+            from http_keepalive import HttpKeepaliveClient
+            settings = self.config['settings']
+            self.http_client = HttpKeepaliveClient(self.portal_url(), settings['http_api'],
+                                                   timeout=settings.get('http_timeout', 10),
+                                                   pool_size=settings.get('concurrent_limit', 3))
+        return self.http_client
+
+    def http_keepalive(self, account):
+        """HTTP 保活：重放门户接口，不启动浏览器；返回是否成功，失败时由调用方改用浏览器"""
+        account_name = account['name']
+        self.notify_status_change(account['id'], "HTTP保活")
+        start = time.perf_counter()
+        try:
+            detail = self.get_http_client().keepalive(account['account'], account['password'])
         except Exception as e:
-            error_msg = str(e)
-            self.notify_log(f"[{account_name}] 保活失败: {error_msg}", "ERROR")
-            self.notify_status_change(account_id, f"失败: {error_msg}")
-            
-            # 保存错误页面截图
-            if driver:
-                try:
-                    # 使用账号名称和手机号作为错误截图文件名
-                    safe_name = "".join(c for c in account_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-                    safe_phone = account['account']
-                    error_screenshot_filename = f"{safe_name}_{safe_phone}_error.png"
-                    error_screenshot_path = f"static/{error_screenshot_filename}"
-                    if not os.path.exists('static'):
-                        os.makedirs('static')
-                    driver.save_screenshot(error_screenshot_path)
-                    self.notify_log(f"[{account_name}] 错误截图已保存: {error_screenshot_path}")
-                except:
-                    pass
-            
+            metrics.MODE_SECONDS.observe(time.perf_counter() - start, mode='http', result='failure')
+            self.notify_log(f"[{account_name}] HTTP 保活失败: {str(e)}，改用浏览器保活", "WARNING", account=account)
             return False
+        elapsed = time.perf_counter() - start
+        metrics.MODE_SECONDS.observe(elapsed, mode='http', result='success')
+        self.notify_status_change(account['id'], "保活成功", datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        self.notify_log(f"[{account_name}] HTTP 保活成功({detail})，耗时 {elapsed:.2f}秒", account=account)
+        return True
+
+    def finish_keepalive(self, driver, account, waiter):
+        """保存截图、发送保活信号并记录成功"""
+        account_name = account['name']
+        # 保存截图，使用账号名称和手机号作为文件名
+        # 清理文件名中的特殊字符
+        safe_name = "".join(c for c in account_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        safe_phone = account['account']
+        try:
+            # 只取截图字节，缩放、去重和写盘由后台线程完成
+            screenshot_path = self.screenshot_writer.capture(driver, f"{safe_name}_{safe_phone}_screenshot")
+            self.notify_log(f"[{account_name}] 截图已提交: {screenshot_path}", account=account)
+        except Exception as e:
+            self.notify_log(f"[{account_name}] 保存截图失败: {str(e)}", "WARNING", account=account)
+
+        # 发送保活信号
+        try:
+            driver.execute_script("console.log('keepalive signal');")
+            self.notify_log(f"[{account_name}] 保活信号发送成功", account=account)
+        except Exception as e:
+            self.notify_log(f"[{account_name}] 发送保活信号失败: {str(e)}", "WARNING", account=account)
+
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.notify_status_change(account['id'], "保活成功", current_time)
+        self.notify_log(f"[{account_name}] 保活操作成功完成", account=account)
+        self.notify_log(f"[{account_name}] 各步骤等待: {waiter.summary()}", account=account)
+
+    def fail_keepalive(self, driver, account, error, used_cache=False):
+        """记录失败原因并保存错误页面截图，返回失败类别"""
+        account_name = account['name']
+        error_msg = str(error)
+        failure_class = classify_failure(error)
+        metrics.FAILURES_TOTAL.inc(reason=failure_class)
+        self.notify_log(f"[{account_name}] 保活失败({failure_class}): {error_msg}", "ERROR", account=account)
+        self.notify_status_change(account['id'], f"失败: {error_msg}")
+        if used_cache:
+            # 缓存会话进入后仍失败，下次改走登录表单
+            self.session_cache.invalidate(account['account'])
+
+        # 保存错误页面截图
+        if driver:
+            try:
+                # 使用账号名称和手机号作为错误截图文件名
+                safe_name = "".join(c for c in account_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
+                safe_phone = account['account']
+                error_screenshot_path = self.screenshot_writer.capture(driver, f"{safe_name}_{safe_phone}_error")
+                self.notify_log(f"[{account_name}] 错误截图已提交: {error_screenshot_path}", account=account)
+            except:
+                pass
+        return failure_class, error_msg
+
+    def attempt_keepalive(self, account):
+        """执行一次保活尝试，返回 (是否成功, 失败类别, 失败信息)"""
+        account_name = account['name']
+        if self.use_http_keepalive(account) and self.http_keepalive(account):
+            return True, None, ""
+        self.begin_keepalive(account)
+        browser_start = time.perf_counter()
+
+        driver = None
+        healthy = False
+        state = {'used_cache': False}
+        try:
+            # 创建浏览器驱动
+            step_start = time.perf_counter()
+            driver = self.acquire_driver()
+            metrics.STEP_SECONDS.observe(time.perf_counter() - step_start, step='browser_launch')
+            waiter = self.make_waiter(driver, account)
+
+            run_steps(self.keepalive_steps(driver, account, waiter, state), waiter)
+            self.finish_keepalive(driver, account, waiter)
+
+            healthy = True
+            return True, None, ""
+
+        except Exception as e:
+            failure_class, message = self.fail_keepalive(driver, account, e, state['used_cache'])
+            return False, failure_class, message
         finally:
+            metrics.MODE_SECONDS.observe(time.perf_counter() - browser_start, mode='browser',
+                                         result='success' if healthy else 'failure')
             if driver:
                 try:
-                    driver.quit()
-                    self.notify_log(f"[{account_name}] 浏览器已关闭")
+                    self.release_driver(driver, healthy)
+                    self.notify_log(f"[{account_name}] 浏览器已释放", account=account)
                 except:
                     pass
-                    
-    def sequential_keepalive(self, account_ids=None):
-        """顺序保活（一个接一个）"""
+
+    def select_accounts(self, account_ids=None):
+        """选出本轮需要保活的账号"""
         if account_ids is None:
-            accounts = self.get_enabled_accounts()
+            return self.get_enabled_accounts()
+        return [acc for acc in self.config['accounts'] if acc['id'] in account_ids and acc['enabled']]
+
+    def request_round(self, account_ids=None, source="手动"):
+        """
+        触发一轮保活（单飞）：没有进行中的一轮时立即开始；
+        进行中的一轮已包含这些账号则合并，否则排到下一轮（最多排队一轮，后续触发并入其中）
+        返回覆盖本次触发的那一轮的完成事件
+        """
+        ids = None if account_ids is None else set(account_ids)
+        with self.round_lock:
+            current = self.round_current
+            if current is None:
+                target = self.round_current = {'ids': ids, 'done': threading.Event()}
+                outcome = 'started'
+            elif current['ids'] is None or (ids is not None and ids <= current['ids']):
+                target = current
+                outcome = 'merged'
+            elif self.round_pending is None:
+                target = self.round_pending = {'ids': ids, 'done': threading.Event()}
+                outcome = 'queued'
+            else:
+                target = self.round_pending
+                if target['ids'] is not None:
+                    target['ids'] = None if ids is None else target['ids'] | ids
+                outcome = 'merged'
+            self.round_stats[outcome] += 1
+            stats = dict(self.round_stats)
+        metrics.ROUND_TRIGGERS_TOTAL.inc(outcome=outcome)
+        outcome_text = {'started': "开始新一轮", 'queued': "已有一轮进行中，排到下一轮", 'merged': "合并到已有的一轮"}[outcome]
+        self.notify_log(f"[保活任务] {source}触发: {outcome_text} "
+                        f"(累计 开始 {stats['started']} / 排队 {stats['queued']} / 合并 {stats['merged']})")
+        if outcome == 'started':
+            threading.Thread(target=self.run_rounds, args=(target,), daemon=True).start()
+        return target['done']
+
+    def run_rounds(self, round_info):
+        """依次执行进行中的一轮和排队的下一轮"""
+        while round_info:
+            try:
+                ids = round_info['ids']
+                self.run_keepalive(None if ids is None else sorted(ids))
+            except Exception as e:
+                self.notify_log(f"[保活任务] 本轮保活异常: {str(e)}", "ERROR")
+            finally:
+                with self.round_lock:
+                    round_info['done'].set()
+                    round_info = self.round_current = self.round_pending
+                    self.round_pending = None
+
+    def run_keepalive(self, account_ids=None):
+        """按配置的模式执行一轮保活（异步、顺序或并发）"""
+        if self.config['settings'].get('async_mode', False):
+            return self.async_keepalive(account_ids)
+        if self.config['settings'].get('sequential_mode', True):
+            return self.sequential_keepalive(account_ids)
+        return self.concurrent_keepalive(account_ids)
+
+    def timed_keepalive(self, account, attempt=1):
+        """执行一次保活尝试并计时，返回 (是否成功, 耗时秒数, 失败类别)"""
+        account_start = time.perf_counter()
+        try:
+            ok, failure_class, message = self.attempt_keepalive(account)
+        except Exception as e:
+            ok, failure_class, message = False, classify_failure(e), str(e)
+            metrics.FAILURES_TOTAL.inc(reason=failure_class)
+            self.notify_log(f"[保活任务] ✗ 账号 {account['name']} 发生异常: {message}", "ERROR", account=account)
+        duration = time.perf_counter() - account_start
+        self.record_account_result(account, ok, duration)
+        self.record_attempt(account, attempt, ok, failure_class, message, duration)
+        return ok, duration, failure_class
+
+    def record_account_result(self, account, result, duration):
+        """记录单个账号的保活结果和耗时"""
+        metrics.ACCOUNT_SECONDS.observe(duration, result='success' if result else 'failure')
+        metrics.KEEPALIVE_TOTAL.inc(result='success' if result else 'failure')
+        if result:
+            self.notify_log(f"[保活任务] ✓ 账号 {account['name']} 保活成功 - 耗时: {duration:.1f}秒", account=account)
         else:
-            accounts = [acc for acc in self.config['accounts'] if acc['id'] in account_ids and acc['enabled']]
+            self.notify_log(f"[保活任务] ✗ 账号 {account['name']} 保活失败 - 耗时: {duration:.1f}秒", account=account)
+
+    def record_attempt(self, account, attempt, ok, failure_class, message, duration):
+        """记录每一次尝试的结果"""
+        record = {
+            'account_id': account['id'],
+            'attempt': attempt,
+            'success': ok,
+            'failure_class': failure_class,
+            'message': message,
+            'duration': round(duration, 3),
+            'finished_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self.attempt_history.append(record)
+        metrics.ATTEMPTS_TOTAL.inc(result='success' if ok else 'failure', failure_class=failure_class or '')
+        if self.store:
+            try:
+                self.store.append_history(record)
+            except Exception as e:
+                self.notify_log(f"写入保活历史失败: {str(e)}", "WARNING")
+
+    def get_retry_policy(self):
+        """按当前配置生成重试策略"""
+        return RetryPolicy.from_settings(self.config['settings'])
+
+    def plan_retry(self, policy, account, attempt, failure_class):
+        """失败后决定是否重试，返回重试前的等待秒数；不再重试时返回 None"""
+        if not policy.should_retry(failure_class, attempt):
+            if attempt > 1:
+                self.notify_log(f"[重试] 账号 {account['name']} 已尝试 {attempt} 次({failure_class})，本轮放弃", account=account)
+            return None
+        delay = policy.delay(failure_class, attempt)
+        self.notify_log(f"[重试] 账号 {account['name']} 第 {attempt} 次失败({failure_class})，"
+                        f"{delay:.1f}秒后重试，期间继续处理其他账号", account=account)
+        return delay
+
+    def concurrent_keepalive(self, account_ids=None):
+        """并发保活（最多 concurrent_limit 个账号同时进行），失败账号按重试策略延后重新提交"""
+        accounts = self.select_accounts(account_ids)
+        if not accounts:
+            self.notify_log("没有可保活的账号", "WARNING")
+            return
+
+        limit = max(1, int(self.config['settings'].get('concurrent_limit', 3)))
+        workers = min(limit, len(accounts))
+        start_time = datetime.now()
+        round_start = time.perf_counter()
+        self.notify_log(f"[保活任务] 开始并发保活，共 {len(accounts)} 个账号，并发数 {workers} - {start_time.strftime('%H:%M:%S')}")
+
+        policy = self.get_retry_policy()
+        durations = {}
+        failed_accounts = []
+        retry_heap = []  # (可以重试的时间, 序号, 账号, 第几次尝试)
+        sequence = itertools.count()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="keepalive") as executor:
+            pending = {executor.submit(self.timed_keepalive, account, 1): (account, 1) for account in accounts}
+            while pending or retry_heap:
+                now = time.monotonic()
+                while retry_heap and retry_heap[0][0] <= now:
+                    _, _, account, attempt = heapq.heappop(retry_heap)
+                    pending[executor.submit(self.timed_keepalive, account, attempt)] = (account, attempt)
+                timeout = max(0.0, retry_heap[0][0] - now) if retry_heap else None
+                if not pending:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    account, attempt = pending.pop(future)
+                    ok, duration, failure_class = future.result()
+                    durations[account['name']] = durations.get(account['name'], 0.0) + duration
+                    if ok:
+                        continue
+                    delay = self.plan_retry(policy, account, attempt, failure_class)
+                    if delay is None:
+                        failed_accounts.append(account['name'])
+                    else:
+                        heapq.heappush(retry_heap, (time.monotonic() + delay, next(sequence), account, attempt + 1))
+
+        total_duration = time.perf_counter() - round_start
+        return self.finish_round('concurrent', "并发保活", accounts, durations, failed_accounts, total_duration)
+
+    def async_keepalive(self, account_ids=None):
+        """异步保活：一个事件循环驱动多个浏览器会话，等待期间不占用线程"""
+        from async_orchestrator import AsyncKeepaliveOrchestrator
+        accounts = self.select_accounts(account_ids)
+        if not accounts:
+            self.notify_log("没有可保活的账号", "WARNING")
+            return
+
+        settings = self.config['settings']
+        orchestrator = AsyncKeepaliveOrchestrator(self,
+                                                  max_sessions=settings.get('async_max_sessions', 20),
+                                                  io_threads=settings.get('async_io_threads', 4))
+        round_start = time.perf_counter()
+        self.notify_log(f"[保活任务] 开始异步保活，共 {len(accounts)} 个账号，"
+                        f"会话上限 {orchestrator.max_sessions}，线程数 {orchestrator.io_threads} - {datetime.now().strftime('%H:%M:%S')}")
+
+        results = orchestrator.run(accounts, self.get_retry_policy())
+        durations = {}
+        failed_accounts = []
+        for account in accounts:
+            ok, duration = results[account['name']]
+            durations[account['name']] = duration
+            if not ok:
+                failed_accounts.append(account['name'])
+
+        total_duration = time.perf_counter() - round_start
+        return self.finish_round('async', "异步保活", accounts, durations, failed_accounts, total_duration)
+
+    def finish_round(self, mode, mode_text, accounts, durations, failed_accounts, total_duration):
+        """一轮保活结束：记录指标并输出汇总"""
+        metrics.ROUND_SECONDS.observe(total_duration, mode=mode)
+        metrics.LAST_ROUND_SECONDS.set(total_duration)
+        success_count = len(accounts) - len(failed_accounts)
+        self.notify_log(f"[保活任务] {mode_text}完成 - 成功: {success_count}/{len(accounts)}, "
+                       f"总耗时: {total_duration:.1f}秒, 完成时间: {datetime.now().strftime('%H:%M:%S')}")
+        self.notify_log("[保活任务] 各账号耗时: " +
+                        ", ".join(f"{name} {duration:.1f}秒" for name, duration in durations.items()))
+        if failed_accounts:
+            self.notify_log(f"[保活任务] 失败账号: {', '.join(failed_accounts)}")
+        self.log_pool_stats()
+        return total_duration, durations
+
+    def log_pool_stats(self):
+        """输出浏览器会话池的启动/复用统计、截图写盘统计和日志队列统计"""
+        if self.config['settings'].get('browser_reuse', True):
+            stats = self.driver_pool.get_stats()
+            self.notify_log(f"[会话池] 新启动: {stats['launches']}, 复用: {stats['reuses']}, "
+                            f"退役: {stats['retired']}, 空闲: {stats['idle']}, "
+                            f"复用率: {stats['reuse_rate']:.0%}, 启动总耗时: {stats['launch_seconds']:.1f}秒")
+        ocr = get_service_stats()
+        if ocr and ocr['images']:
+            self.notify_log(f"[验证码服务] 识别: {ocr['images']}, 平均批量: {ocr['avg_batch']:.1f}, "
+                            f"排队: {ocr['queue_depth']}, 平均等待: {ocr['avg_wait_seconds']:.2f}秒, "
+                            f"平均识别: {ocr['avg_inference_seconds']:.2f}秒, 缓存命中率: {ocr['cache_hit_rate']:.0%}, "
+                            f"识别准确率: {ocr['accuracy']:.0%}")
+        shots = self.screenshot_writer.get_stats()
+        if shots['submitted']:
+            self.notify_log(f"[截图] 写入: {shots['written']}, 去重: {shots['deduped']}, 丢弃: {shots['dropped']}, "
+                            f"清理: {shots['pruned']}, 待写: {shots['pending']}")
+        logs = self.async_logging.get_stats()
+        if logs['dropped'] or logs['pending']:
+            self.notify_log(f"[日志] 已写: {logs['handled']}, 丢弃: {logs['dropped']}, 待写: {logs['pending']}, "
+                            f"平均处理: {logs['avg_handle_ms']:.2f}毫秒")
+
+    def sequential_keepalive(self, account_ids=None):
+        """顺序保活（一个接一个）"""
+        accounts = self.select_accounts(account_ids)
         
         if not accounts:
             self.notify_log("没有可保活的账号", "WARNING")
@@ -493,45 +1001,142 @@ class ImprovedAccountManager:
 
         success_count = 0
         failed_accounts = []
+        durations = {}
+        policy = self.get_retry_policy()
+        # 按可执行时间排序：首次尝试立即执行，失败的账号延后重试，不阻塞后面的账号
+        queue_heap = [(0.0, i, account, 1) for i, account in enumerate(accounts, 1)]
+        sequence = itertools.count(len(accounts) + 1)
 
-        for i, account in enumerate(accounts, 1):
-            account_start_time = datetime.now()
-            self.notify_log(f"[保活任务] 处理第 {i}/{len(accounts)} 个账号: {account['name']} ({account['account']}) - {account_start_time.strftime('%H:%M:%S')}")
+        while queue_heap:
+            ready_at, _, account, attempt = heapq.heappop(queue_heap)
+            wait_seconds = ready_at - time.monotonic()
+            if wait_seconds > 0:
+                self.notify_log(f"[保活任务] 等待 {wait_seconds:.1f} 秒后重试账号 {account['name']}...", account=account)
+                time.sleep(wait_seconds)
 
-            try:
-                result = self.keepalive_single_account(account)
-                account_end_time = datetime.now()
-                duration = (account_end_time - account_start_time).total_seconds()
+            account_start_time = datetime.now()
+            self.notify_log(f"[保活任务] 处理账号: {account['name']} ({account['account']}) 第 {attempt} 次尝试 - {account_start_time.strftime('%H:%M:%S')}", account=account)
 
-                if result:
-                    success_count += 1
-                    self.notify_log(f"[保活任务] ✓ 账号 {account['name']} 保活成功 - 耗时: {duration:.1f}秒")
-                else:
+            ok, duration, failure_class = self.timed_keepalive(account, attempt)
+            durations[account['name']] = durations.get(account['name'], 0.0) + duration
+            if ok:
+                success_count += 1
+            else:
+                delay = self.plan_retry(policy, account, attempt, failure_class)
+                if delay is None:
                     failed_accounts.append(account['name'])
-                    self.notify_log(f"[保活任务] ✗ 账号 {account['name']} 保活失败 - 耗时: {duration:.1f}秒")
-
-            except Exception as e:
-                failed_accounts.append(account['name'])
-                account_end_time = datetime.now()
-                duration = (account_end_time - account_start_time).total_seconds()
-                self.notify_log(f"[保活任务] ✗ 账号 {account['name']} 发生异常: {str(e)} - 耗时: {duration:.1f}秒", "ERROR")
+                else:
+                    heapq.heappush(queue_heap, (time.monotonic() + delay, next(sequence), account, attempt + 1))
 
             # 账号之间的间隔
-            if i < len(accounts):
+            if queue_heap:
                 self.notify_log(f"[保活任务] 等待 5 秒后处理下一个账号...")
                 time.sleep(5)
 
         end_time = datetime.now()
         total_duration = (end_time - start_time).total_seconds()
+        metrics.ROUND_SECONDS.observe(total_duration, mode='sequential')
+        metrics.LAST_ROUND_SECONDS.set(total_duration)
 
         self.notify_log(f"[保活任务] 顺序保活完成 - 成功: {success_count}/{len(accounts)}, "
                        f"总耗时: {total_duration:.1f}秒, 完成时间: {end_time.strftime('%H:%M:%S')}")
+        self.notify_log("[保活任务] 各账号耗时: " +
+                        ", ".join(f"{name} {duration:.1f}秒" for name, duration in durations.items()))
 
         if failed_accounts:
             self.notify_log(f"[保活任务] 失败账号: {', '.join(failed_accounts)}")
+        self.log_pool_stats()
+        return total_duration, durations
         
+    def run_worker(self, stop_event=None, poll=5.0):
+        """
+        工作进程模式：从共享租约队列(settings.worker_queue)领取到期账号并保活
+        多个进程/多台机器可同时运行，每个账号每个调度间隔只由一个进程处理，
+        崩溃进程的租约过期后由其他进程接管；stop_event 置位后处理完手上的账号再退出
+        使用 JSON 配置文件时，各账号的保活结果写入队列(leases 表的 status/last_keepalive)，不写回配置文件
+        """
+        from lease_queue import LeaseQueue
+        settings = self.config['settings']
+        lease_queue = LeaseQueue(settings.get('worker_queue') or 'keepalive_queue.db',
+                                 lease_seconds=settings.get('worker_lease_seconds', 180),
+                                 worker_id=settings.get('worker_id'))
+        self.worker_queue = lease_queue
+        stop_event = stop_event or threading.Event()
+        limit = max(1, int(settings.get('concurrent_limit', 3)))
+        policy = self.get_retry_policy()
+        renew_every = lease_queue.lease_seconds / 3
+        last_renew = time.monotonic()
+        self.notify_log(f"[工作进程] {lease_queue.worker_id} 已启动，队列: {lease_queue.path}，并发数 {limit}")
+
+        running = {}  # future -> (账号, 第几次尝试)
+
+        def finish(future):
+            """把已完成账号的结果写入队列；写入失败时留在 running 中，下一轮再写"""
+            account, attempt = running[future]
+            ok, duration, failure_class = future.result()
+            interval = self.config['schedule']['interval_minutes'] * 60
+            delay = None if ok else self.plan_retry(policy, account, attempt, failure_class)
+            if delay is None:
+                kept = lease_queue.complete(account['account'], time.time() + interval,
+                                            'success' if ok else failure_class)
+            else:
+                kept = lease_queue.complete(account['account'], time.time() + delay,
+                                            failure_class, attempt + 1)
+            del running[future]
+            if not kept:
+                self.notify_log(f"[工作进程] 账号 {account['name']} 的租约已过期并被其他进程接管", "WARNING", account=account)
+
+        executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix="worker")
+        try:
+            while not stop_event.is_set() or running:
+                try:
+                    accounts = {acc['account']: acc for acc in self.get_enabled_accounts()}
+                    if not stop_event.is_set() and len(running) < limit and \
+                            self.check_schedule_window(datetime.now(), verbose=False):
+                        lease_queue.sync(list(accounts))
+                        for key, attempt in lease_queue.claim(list(accounts), limit - len(running)):
+                            account = accounts[key]
+                            self.notify_log(f"[工作进程] 领取账号 {account['name']} 第 {attempt} 次尝试", account=account)
+                            running[executor.submit(self.timed_keepalive, account, attempt)] = (account, attempt)
+
+                    if running and time.monotonic() - last_renew >= renew_every:
+                        lease_queue.renew([account['account'] for account, _ in running.values()])
+                        last_renew = time.monotonic()
+
+                    if not running:
+                        stop_event.wait(poll)
+                        continue
+                    done, _ = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finish(future)
+                except KeyboardInterrupt:
+                    self.notify_log("[工作进程] 收到中断，处理完手上的账号后退出")
+                    stop_event.set()
+                except Exception as e:
+                    # 队列被锁(sqlite3.OperationalError)、共享目录暂时不可用等：记录后下一轮重试，租约到期前会再续约
+                    self.notify_log(f"[工作进程] 处理队列出错: {type(e).__name__}: {str(e)}", "ERROR")
+                    stop_event.wait(poll)
+        finally:
+            # 异常退出时先写入已完成账号的结果，再放弃未完成账号的租约，其他进程无需等租约过期即可领取
+            for future in [future for future in running if future.done()]:
+                try:
+                    finish(future)
+                except sqlite3.Error as e:
+                    self.notify_log(f"[工作进程] 写入保活结果失败: {str(e)}", "ERROR")
+            try:
+                if running:
+                    lease_queue.release([account['account'] for account, _ in running.values()])
+            except sqlite3.Error as e:
+                self.notify_log(f"[工作进程] 放弃租约失败，等待租约过期: {str(e)}", "ERROR")
+            executor.shutdown(wait=True)
+            self.worker_queue = None
+            stats = lease_queue.get_stats()
+            lease_queue.close()
+        self.notify_log(f"[工作进程] 已停止 - 队列账号: {stats['total']}, 接管过期租约: {stats['reclaimed']}")
+
     def start_scheduler(self):
-        """启动定时调度器"""
+        """启动定时调度器：按每个账号的到期时间派发，只处理已到期的账号"""
+        from due_scheduler import DueScheduler
         if self.is_scheduler_running:
             return
             
@@ -540,54 +1145,38 @@ class ImprovedAccountManager:
             self.notify_log("定时调度已禁用")
             return
             
-        # 设置定时任务
         interval = schedule_config['interval_minutes']
-        schedule.every(interval).minutes.do(self.scheduled_keepalive)
+        metrics.SCHEDULE_INTERVAL_SECONDS.set(interval * 60)
+        self.scheduler = DueScheduler(self, lambda account_ids: self.request_round(account_ids, "调度器").wait(),
+                                      batch_seconds=schedule_config.get('batch_seconds', 5))
+        self.scheduler.start()
         
         self.is_scheduler_running = True
-        schedule_config = self.config['schedule']
         self.notify_log(f"[调度器] 定时调度器已启动")
         self.notify_log(f"[调度器] 配置详情 - 间隔: {interval}分钟, "
                        f"时间范围: {schedule_config['start_time']}-{schedule_config['end_time']}, "
                        f"周末保活: {'启用' if schedule_config['weekend_enabled'] else '禁用'}")
-
-        # 立即执行第一次保活任务
-        self.notify_log(f"[调度器] 立即执行首次保活任务")
-        threading.Thread(target=self.scheduled_keepalive, daemon=True).start()
-
-        self.notify_log(f"[调度器] 下次执行时间: {datetime.now() + timedelta(minutes=interval)}")
-        
-        def run_scheduler():
-            last_check_time = time.time()
-            while self.is_scheduler_running:
-                current_time = time.time()
-                # 每10分钟输出一次调度器状态
-                if current_time - last_check_time >= 600:  # 10分钟
-                    current_dt = datetime.now()
-                    schedule_config = self.config['schedule']
-                    self.notify_log(f"[调度器] 运行中 - 当前时间: {current_dt.strftime('%H:%M:%S')}, "
-                                  f"间隔: {schedule_config['interval_minutes']}分钟, "
-                                  f"时间范围: {schedule_config['start_time']}-{schedule_config['end_time']}")
-                    last_check_time = current_time
-
-                schedule.run_pending()
-                time.sleep(60)  # 每分钟检查一次
-                
-        scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
-        scheduler_thread.start()
+        upcoming = self.scheduler.next_due_time()
+        if upcoming:
+            self.notify_log(f"[调度器] 最早到期时间: {upcoming.strftime('%Y-%m-%d %H:%M:%S')}")
         
     def stop_scheduler(self):
         """停止定时调度器"""
         self.is_scheduler_running = False
-        schedule.clear()
+        if self.scheduler:
+            self.scheduler.stop()
+            self.scheduler = None
         self.notify_log(f"[调度器] 定时调度器已停止 - {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    def refresh_schedule(self):
+        """账号增删或修改后重新计算到期时间"""
+        if self.scheduler:
+            self.scheduler.refresh()
         
-    def scheduled_keepalive(self):
-        """定时保活任务"""
+    def check_schedule_window(self, current_time, verbose=True):
+        """检查当前时间是否在保活时间范围内（含周末设置）"""
         schedule_config = self.config['schedule']
-        current_time = datetime.now()
-
-        self.notify_log(f"[调度器] 触发定时保活任务 - {current_time.strftime('%Y-%m-%d %H:%M:%S')}")
+        log = self.notify_log if verbose else (lambda message: None)
 
         # 检查时间范围 (支持24小时模式)
         start_time = datetime.strptime(schedule_config['start_time'], "%H:%M").time()
@@ -597,70 +1186,94 @@ class ImprovedAccountManager:
         is_24hour_mode = (start_time.hour == 0 and start_time.minute == 0 and
                          end_time.hour == 23 and end_time.minute == 59)
 
-        self.notify_log(f"[调度器] 时间检查 - 当前: {current_time.strftime('%H:%M')}, "
-                       f"范围: {schedule_config['start_time']}-{schedule_config['end_time']}, "
-                       f"24小时模式: {'是' if is_24hour_mode else '否'}")
+        log(f"[调度器] 时间检查 - 当前: {current_time.strftime('%H:%M')}, "
+            f"范围: {schedule_config['start_time']}-{schedule_config['end_time']}, "
+            f"24小时模式: {'是' if is_24hour_mode else '否'}")
 
         if not is_24hour_mode:
             if not (start_time <= current_time.time() <= end_time):
-                self.notify_log(f"[调度器] 跳过执行 - 当前时间不在保活时间范围内")
-                return
+                log(f"[调度器] 跳过执行 - 当前时间不在保活时间范围内")
+                return False
 
             # 检查是否启用周末
             weekday_names = ['周一', '周二', '周三', '周四', '周五', '周六', '周日']
             current_weekday = weekday_names[current_time.weekday()]
             is_weekend = current_time.weekday() >= 5
 
-            self.notify_log(f"[调度器] 周末检查 - 今天: {current_weekday}, "
-                           f"是否周末: {'是' if is_weekend else '否'}, "
-                           f"周末保活: {'启用' if schedule_config['weekend_enabled'] else '禁用'}")
+            log(f"[调度器] 周末检查 - 今天: {current_weekday}, "
+                f"是否周末: {'是' if is_weekend else '否'}, "
+                f"周末保活: {'启用' if schedule_config['weekend_enabled'] else '禁用'}")
 
             if not schedule_config['weekend_enabled'] and is_weekend:
-                self.notify_log(f"[调度器] 跳过执行 - 周末保活已禁用")
-                return
+                log(f"[调度器] 跳过执行 - 周末保活已禁用")
+                return False
+        return True
 
-        # 获取启用的账号数量
-        enabled_accounts = self.get_enabled_accounts()
-        self.notify_log(f"[调度器] 准备执行保活 - 启用账号数: {len(enabled_accounts)}")
-
-        if not enabled_accounts:
-            self.notify_log(f"[调度器] 跳过执行 - 没有启用的账号")
-            return
-
-        self.notify_log(f"[调度器] 开始执行定时保活任务")
-        threading.Thread(target=self.sequential_keepalive, daemon=True).start()
-        
     def get_status_summary(self):
         """获取状态摘要"""
         accounts = self.config['accounts']
         enabled_count = len([acc for acc in accounts if acc['enabled']])
+        worker_statuses = self.get_worker_statuses()
         
         status_counts = {}
         for account in accounts:
-            status = account['status']
+            status, _ = self.get_account_status(account, worker_statuses)
             status_counts[status] = status_counts.get(status, 0) + 1
             
         return {
             'total_accounts': len(accounts),
             'enabled_accounts': enabled_count,
             'status_counts': status_counts,
-            'scheduler_running': self.is_scheduler_running
+            'scheduler_running': self.is_scheduler_running,
+            'round_in_progress': self.round_current is not None,
+            'round_triggers': dict(self.round_stats)
         }
 
 # 示例使用
 if __name__ == "__main__":
-    manager = ImprovedAccountManager()
+    # 命令行参数 --config accounts.db 使用 SQLite 账号库
+    config_file = "accounts_config.json"
+    if '--config' in sys.argv and sys.argv.index('--config') + 1 < len(sys.argv):
+        config_file = sys.argv[sys.argv.index('--config') + 1]
+    manager = ImprovedAccountManager(config_file)
     
     # 添加日志回调
-    def log_callback(message):
+    def log_callback(message, account=None):
         print(message)
     manager.add_log_callback(log_callback)
     
+    # 命令行参数 --worker-status 显示各工作进程写入队列的保活结果后退出
+    if '--worker-status' in sys.argv:
+        worker_statuses = manager.get_worker_statuses()
+        for account in manager.config['accounts']:
+            status, last_keepalive = manager.get_account_status(account, worker_statuses)
+            print(f"{account['name']}({account['account']}): {status}, 最后保活: {last_keepalive or '从未运行'}")
+        manager.shutdown()
+        sys.exit(0)
+
+    # 启动指标服务
+    manager.start_metrics_server()
+
+    # 命令行参数 --worker 以工作进程模式从共享队列领取账号
+    if '--worker' in sys.argv:
+        try:
+            manager.run_worker()
+        finally:
+            manager.shutdown()
+        sys.exit(0)
+
+    # 命令行参数 --concurrent 启用并发模式(在启动调度器之前设置，第一轮即生效)
+    if '--concurrent' in sys.argv:
+        manager.config['settings']['sequential_mode'] = False
+    # 命令行参数 --async 启用异步模式
+    if '--async' in sys.argv:
+        manager.config['settings']['async_mode'] = True
+
     # 启动定时调度器
     manager.start_scheduler()
-    
-    # 手动执行一次保活
-    manager.sequential_keepalive()
+
+    # 手动执行一次保活（与调度器触发的一轮合并）
+    manager.request_round(source="手动")
     
     # 保持程序运行
     try:
@@ -668,4 +1281,5 @@ if __name__ == "__main__":
             time.sleep(60)
     except KeyboardInterrupt:
         manager.stop_scheduler()
+        manager.shutdown()
         print("程序已停止")
\ No newline at end of file
@@ -1,18 +1,26 @@
 # -*- coding: utf-8 -*-
+import sys
+import multiprocessing
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import threading
-import time
+from collections import deque
 from improved_account_manager import ImprovedAccountManager
-from datetime import datetime
 
 class ImprovedGUI:
-    def __init__(self, root):
+    def __init__(self, root, config_file="accounts_config.json"):
         self.root = root
         self.root.title("天翼云多账号保活管理器 - 优化版")
         self.root.geometry("1000x700")
         
-        self.manager = ImprovedAccountManager()
+        self.manager = ImprovedAccountManager(config_file)
+
+        # 日志先放入待显示队列，由定时器合并写入日志区域；日志区域最多保留 gui_log_lines 条
+        settings = self.manager.config['settings']
+        self.log_max_lines = settings.get('gui_log_lines', 500)
+        self.log_flush_ms = settings.get('gui_log_flush_ms', 100)
+        self.log_pending = deque(maxlen=self.log_max_lines)   # 后台线程写入，界面线程取出
+        self.log_buffer = deque()       # 日志区域中的 (账号, 消息)，与日志区域逐条对应
+        self.log_tags = {}              # 账号 -> 文本标签，按账号筛选时只切换标签是否隐藏
         
         # 设置回调
         self.manager.add_status_callback(self.on_status_change)
@@ -20,6 +28,8 @@ class ImprovedGUI:
         
         self.create_widgets()
         self.refresh_accounts()
+        self.manager.start_metrics_server()
+        self.root.after(self.log_flush_ms, self.flush_logs)
         
         
     def create_widgets(self):
@@ -109,6 +119,18 @@ class ImprovedGUI:
         interval_spinbox.pack(side=tk.LEFT, padx=(5, 5))
         ttk.Label(interval_frame, text="分钟").pack(side=tk.LEFT)
 
+        # 并发保活设置
+        concurrent_frame = ttk.Frame(config_frame)
+        concurrent_frame.pack(fill=tk.X, pady=5)
+
+        settings = self.manager.config['settings']
+        self.concurrent_mode_var = tk.BooleanVar(value=not settings.get('sequential_mode', True))
+        ttk.Checkbutton(concurrent_frame, text="并发保活", variable=self.concurrent_mode_var).pack(side=tk.LEFT)
+        ttk.Label(concurrent_frame, text="并发数:").pack(side=tk.LEFT, padx=(15, 0))
+        self.concurrent_limit_var = tk.StringVar(value=str(settings.get('concurrent_limit', 3)))
+        concurrent_spinbox = ttk.Spinbox(concurrent_frame, from_=1, to=20, width=10, textvariable=self.concurrent_limit_var)
+        concurrent_spinbox.pack(side=tk.LEFT, padx=(5, 5))
+
         # 应用设置按钮
         apply_frame = ttk.Frame(config_frame)
         apply_frame.pack(fill=tk.X, pady=(10, 0))
@@ -129,6 +151,15 @@ class ImprovedGUI:
         self.auto_scroll_var = tk.BooleanVar(value=True)
         ttk.Checkbutton(log_control, text="自动滚动", variable=self.auto_scroll_var).pack(side=tk.RIGHT)
 
+        # 按账号筛选
+        self.log_filter_var = tk.StringVar(value="全部")
+        self.log_filter_box = ttk.Combobox(log_control, textvariable=self.log_filter_var,
+                                           values=["全部"] + [acc['name'] for acc in self.manager.config['accounts']],
+                                           state="readonly", width=16)
+        self.log_filter_box.pack(side=tk.RIGHT, padx=(0, 10))
+        self.log_filter_box.bind("<<ComboboxSelected>>", lambda e: self.apply_log_filter())
+        ttk.Label(log_control, text="账号:").pack(side=tk.RIGHT)
+
         # 日志显示区域
         self.log_text = scrolledtext.ScrolledText(log_frame, height=15, font=("Consolas", 9))
         self.log_text.pack(fill=tk.BOTH, expand=True)
@@ -231,6 +262,7 @@ class ImprovedGUI:
                 return
                 
             self.manager.save_config()
+            self.manager.refresh_schedule()
             self.refresh_accounts()
             dialog.destroy()
             messagebox.showinfo("成功", "账号更新成功!")
@@ -263,24 +295,29 @@ class ImprovedGUI:
         for item in self.accounts_tree.get_children():
             self.accounts_tree.delete(item)
             
+        # 先写入延迟中的状态变更，再从文件重新加载
+        self.manager.flush_config()
         self.manager.config = self.manager.load_config()
         
+        # 工作进程的保活结果写在共享队列中，与配置文件中的结果合并显示
+        worker_statuses = self.manager.get_worker_statuses()
         for account in self.manager.config['accounts']:
             enabled_text = "是" if account['enabled'] else "否"
+            status, last_keepalive = self.manager.get_account_status(account, worker_statuses)
             self.accounts_tree.insert("", tk.END, values=(
                 account['id'],
                 account['name'],
                 account['account'],
-                account['status'],
-                account['last_keepalive'] or "从未运行",
+                status,
+                last_keepalive or "从未运行",
                 enabled_text
             ))
             
             
     def start_keepalive(self):
         """开始保活"""
-        if messagebox.askyesno("确认", "确定要开始保活所有启用的账号吗?\n\n账号将按顺序逐个保活。"):
-            threading.Thread(target=self.manager.sequential_keepalive, daemon=True).start()
+        if messagebox.askyesno("确认", f"确定要开始保活所有启用的账号吗?\n\n{self.keepalive_mode_text()}"):
+            self.manager.request_round(source="界面")
             
     def keepalive_selected(self):
         """保活选中的账号"""
@@ -294,8 +331,15 @@ class ImprovedGUI:
             account_id = int(self.accounts_tree.item(item)['values'][0])
             account_ids.append(account_id)
             
-        if messagebox.askyesno("确认", f"确定要保活选中的 {len(account_ids)} 个账号吗?\n\n账号将按顺序逐个保活。"):
-            threading.Thread(target=self.manager.sequential_keepalive, args=(account_ids,), daemon=True).start()
+        if messagebox.askyesno("确认", f"确定要保活选中的 {len(account_ids)} 个账号吗?\n\n{self.keepalive_mode_text()}"):
+            self.manager.request_round(account_ids, source="界面")
+
+    def keepalive_mode_text(self):
+        """当前保活模式的说明文字"""
+        settings = self.manager.config['settings']
+        if settings.get('sequential_mode', True):
+            return "账号将按顺序逐个保活。"
+        return f"账号将并发保活（同时最多 {settings.get('concurrent_limit', 3)} 个）。"
             
     def manual_keepalive(self):
         """手动保活"""
@@ -323,6 +367,10 @@ class ImprovedGUI:
             if interval > 480:
                 messagebox.showwarning("警告", "保活间隔不能超过8小时(480分钟)!")
                 return
+            concurrent_limit = int(self.concurrent_limit_var.get())
+            if concurrent_limit < 1:
+                messagebox.showwarning("警告", "并发数不能少于1!")
+                return
 
             # 更新配置
             self.manager.config['schedule']['interval_minutes'] = interval
@@ -330,6 +378,9 @@ class ImprovedGUI:
             self.manager.config['schedule']['start_time'] = "00:00"
             self.manager.config['schedule']['end_time'] = "23:59"
             self.manager.config['schedule']['weekend_enabled'] = True
+            # 保活模式
+            self.manager.config['settings']['sequential_mode'] = not self.concurrent_mode_var.get()
+            self.manager.config['settings']['concurrent_limit'] = concurrent_limit
 
             # 保存配置
             self.manager.save_config()
@@ -340,7 +391,7 @@ class ImprovedGUI:
                 self.manager.start_scheduler()
                 self.scheduler_status_label.config(text=f"调度器: 运行中 (每{interval}分钟)", foreground="green")
 
-            messagebox.showinfo("成功", f"调度器配置已更新!\n保活间隔: {interval}分钟\n运行模式: 24小时")
+            messagebox.showinfo("成功", f"调度器配置已更新!\n保活间隔: {interval}分钟\n运行模式: 24小时\n{self.keepalive_mode_text()}")
 
         except ValueError:
             messagebox.showerror("错误", "请输入有效的数字!")
@@ -367,31 +418,58 @@ class ImprovedGUI:
             
         self.root.after(0, update_ui)
         
-    def on_log_message(self, message):
-        """日志消息回调"""
-        def update_ui():
-            self.log_text.insert(tk.END, message + "\n")
-            if self.auto_scroll_var.get():
-                self.log_text.see(tk.END)
-
-            # 优化内存管理：保持日志行数在合理范围内
-            current_lines = int(self.log_text.index('end-1c').split('.')[0])
-
-            # 当超过500行时，删除前200行，保留最新的300行
-            if current_lines > 500:
-                self.log_text.delete("1.0", "201.0")
-                # 添加内存清理提示
-                timestamp = time.strftime("%H:%M:%S")
-                self.log_text.insert("1.0", f"[{timestamp}] === 日志已清理，保留最新300行 ===\n")
+    def on_log_message(self, message, account=None):
+        """日志消息回调(在日志线程中调用)：只放入待显示队列，不直接操作界面；account 为日志所属账号的名称"""
+        self.log_pending.append((account or "", message))
+
+    def log_tag(self, account):
+        """账号对应的文本标签，新账号出现时加入筛选列表"""
+        tag = self.log_tags.get(account)
+        if tag is None:
+            tag = self.log_tags[account] = f"account{len(self.log_tags)}"
+            selected = self.log_filter_var.get()
+            self.log_text.tag_configure(tag, elide=selected != "全部" and selected != account)
+            values = list(self.log_filter_box['values'])
+            if account and account not in values:
+                self.log_filter_box['values'] = values + [account]
+        return tag
+
+    def flush_logs(self):
+        """定时把待显示的日志一次写入日志区域，超过上限时删除最早的日志"""
+        try:
+            batch = []
+            while self.log_pending:
+                batch.append(self.log_pending.popleft())
+            if batch:
+                args = []
+                for account, message in batch:
+                    args += [message + "\n", (self.log_tag(account),)]
+                    self.log_buffer.append((account, message))
+                self.log_text.insert(tk.END, *args)
+
+                removed_lines = 0
+                while len(self.log_buffer) > self.log_max_lines:
+                    removed_lines += self.log_buffer.popleft()[1].count("\n") + 1
+                if removed_lines:
+                    self.log_text.delete("1.0", f"{removed_lines + 1}.0")
                 if self.auto_scroll_var.get():
                     self.log_text.see(tk.END)
+        finally:
+            self.root.after(self.log_flush_ms, self.flush_logs)
 
-        self.root.after(0, update_ui)
-        
+    def apply_log_filter(self):
+        """按账号筛选：只切换各账号标签是否隐藏，不重新写入日志"""
+        selected = self.log_filter_var.get()
+        for account, tag in self.log_tags.items():
+            self.log_text.tag_configure(tag, elide=selected != "全部" and selected != account)
+        if self.auto_scroll_var.get():
+            self.log_text.see(tk.END)
             
     def clear_logs(self):
         """清空日志"""
         if messagebox.askyesno("确认", "确定要清空所有日志吗?"):
+            self.log_pending.clear()
+            self.log_buffer.clear()
             self.log_text.delete("1.0", tk.END)
             
     def save_logs(self):
@@ -405,25 +483,35 @@ class ImprovedGUI:
         if filename:
             try:
                 with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(self.log_text.get("1.0", tk.END))
+                    # 保存当前筛选的账号的日志
+                    selected = self.log_filter_var.get()
+                    f.writelines(message + "\n" for account, message in self.log_buffer
+                                 if selected == "全部" or account == selected)
                 messagebox.showinfo("成功", "日志保存成功!")
             except Exception as e:
                 messagebox.showerror("错误", f"保存日志失败: {str(e)}")
 
 def main():
     root = tk.Tk()
-    app = ImprovedGUI(root)
+    # --config accounts.db 使用 SQLite 账号库
+    config_file = "accounts_config.json"
+    if '--config' in sys.argv and sys.argv.index('--config') + 1 < len(sys.argv):
+        config_file = sys.argv[sys.argv.index('--config') + 1]
+    app = ImprovedGUI(root, config_file)
     
     def on_closing():
         if app.manager.is_scheduler_running:
             if messagebox.askokcancel("退出", "调度器正在运行，确定要退出吗?"):
                 app.manager.stop_scheduler()
+                app.manager.shutdown()
                 root.destroy()
         else:
+            app.manager.shutdown()
             root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
     root.mainloop()
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包后验证码识别进程需要
     main()
\ No newline at end of file
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+基于 SQLite 的租约工作队列：多个工作进程（同一台机器或共享目录的多台机器）从同一个库领取到期账号
+
+每个账号一行：next_due 为下次到期时间，owner/expires 为当前租约。
+领取时在 BEGIN IMMEDIATE 事务中挑选到期且无人持有（或租约已过期）的账号并写入租约，
+因此同一账号同一时刻只会被一个工作进程处理；工作进程崩溃后租约过期，由其他进程接管。
+各进程的保活结果(status/last_keepalive)也按行写在这里，多个进程不再整体重写同一个配置文件。
+各机器按墙上时间比较租约，需要保持时间同步。
+"""
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+import metrics
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    account     TEXT PRIMARY KEY,
+    next_due    REAL NOT NULL DEFAULT 0,
+    attempt     INTEGER NOT NULL DEFAULT 1,
+    owner       TEXT,
+    expires     REAL NOT NULL DEFAULT 0,
+    last_result TEXT,
+    last_worker TEXT,
+    finished_at REAL,
+    status      TEXT,
+    last_keepalive TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_leases_due ON leases(next_due);
+"""
+
+
+class LeaseQueue:
+    def __init__(self, path, lease_seconds=180, worker_id=None):
+        """
+        path: SQLite 文件路径，多台机器时放在共享目录
+        lease_seconds: 租约有效期，工作进程需在到期前续约
+        worker_id: 工作进程标识，默认 主机名-进程号
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lock = threading.Lock()
+        self.reclaimed = 0  # 从过期租约接管的次数
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA busy_timeout=30000")
+        self.conn.executescript(SCHEMA)
+        # 旧版本创建的队列没有状态列
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(leases)")}
+        for column in ('status', 'last_keepalive'):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE leases ADD COLUMN {column} TEXT")
+
+    @contextmanager
+    def transaction(self):
+        """写事务：BEGIN IMMEDIATE 立即取得写锁，避免两个进程同时选中同一行"""
+        with self.lock:
+            cur = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                yield cur
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+
+    def sync(self, accounts):
+        """登记账号，已有的账号保持原有到期时间"""
+        with self.transaction() as cur:
+            cur.executemany("INSERT OR IGNORE INTO leases (account) VALUES (?)", [(a,) for a in accounts])
+
+    def claim(self, accounts, limit):
+        """领取最多 limit 个到期账号（只在 accounts 范围内），返回 [(账号, 第几次尝试)]"""
+        if limit <= 0 or not accounts:
+            return []
+        now = time.time()
+        placeholders = ",".join("?" * len(accounts))
+        with self.transaction() as cur:
+            rows = cur.execute(
+                f"SELECT account, attempt, owner FROM leases "
+                f"WHERE next_due <= ? AND (owner IS NULL OR expires < ?) AND account IN ({placeholders}) "
+                f"ORDER BY next_due LIMIT ?", (now, now, *accounts, limit)).fetchall()
+            for account, attempt, owner in rows:
+                cur.execute("UPDATE leases SET owner = ?, expires = ? WHERE account = ?",
+                            (self.worker_id, now + self.lease_seconds, account))
+                if owner is not None and owner != self.worker_id:
+                    self.reclaimed += 1
+                    metrics.LEASES_RECLAIMED_TOTAL.inc()
+        return [(account, attempt) for account, attempt, owner in rows]
+
+    def renew(self, accounts):
+        """为仍在处理的账号续约"""
+        if not accounts:
+            return
+        placeholders = ",".join("?" * len(accounts))
+        with self.transaction() as cur:
+            cur.execute(f"UPDATE leases SET expires = ? WHERE owner = ? AND account IN ({placeholders})",
+                        (time.time() + self.lease_seconds, self.worker_id, *accounts))
+
+    def complete(self, account, next_due, result, attempt=1):
+        """释放租约并设置下次到期时间；返回 False 表示租约已过期并被其他进程接管"""
+        with self.transaction() as cur:
+            cur.execute("UPDATE leases SET owner = NULL, expires = 0, next_due = ?, attempt = ?, "
+                        "last_result = ?, last_worker = ?, finished_at = ? WHERE account = ? AND owner = ?",
+                        (next_due, attempt, result, self.worker_id, time.time(), account, self.worker_id))
+            return cur.rowcount == 1
+
+    def update_status(self, account, status, last_keepalive=None):
+        """只更新该账号一行的状态，last_keepalive 为空时保留原值"""
+        with self.transaction() as cur:
+            cur.execute("UPDATE leases SET status = ?, last_keepalive = COALESCE(?, last_keepalive) WHERE account = ?",
+                        (status, last_keepalive or None, account))
+
+    def get_statuses(self):
+        """各账号最近的状态，返回 {账号: (状态, 最后保活时间)}"""
+        with self.lock:
+            rows = self.conn.execute("SELECT account, status, last_keepalive FROM leases").fetchall()
+        return {account: (status, last_keepalive) for account, status, last_keepalive in rows}
+
+    def release(self, accounts):
+        """放弃租约，不改变到期时间（工作进程异常退出时使用，其他进程可立即领取）"""
+        if not accounts:
+            return
+        placeholders = ",".join("?" * len(accounts))
+        with self.transaction() as cur:
+            cur.execute(f"UPDATE leases SET owner = NULL, expires = 0 WHERE owner = ? AND account IN ({placeholders})",
+                        (self.worker_id, *accounts))
+
+    def get_stats(self):
+        now = time.time()
+        with self.lock:
+            total, due, leased = self.conn.execute(
+                "SELECT COUNT(*), SUM(next_due <= ? AND (owner IS NULL OR expires < ?)), "
+                "SUM(owner IS NOT NULL AND expires >= ?) FROM leases", (now, now, now)).fetchone()
+        return {'total': total, 'due': due or 0, 'leased': leased or 0, 'reclaimed': self.reclaimed}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -3,6 +3,7 @@
 
 import logging
 import sys,os
+import async_logging
 try:
     import inspect
     _b_pkg_inspect=True
@@ -31,13 +32,14 @@ class Logger:
             fh = logging.FileHandler(path)
             fh.setFormatter(fmt)
             fh.setLevel(Flevel)
-            self.logger.addHandler(sh)
-            self.logger.addHandler(fh)
+            # 控制台和文件日志由后台线程写入，保活流程不等待磁盘
+            self.async_logging = async_logging.install(self.logger, [sh, fh])
             self.modulename=""
             g_LOGGER__= self
         else:
             self.logger= g_LOGGER__.logger
             self.modulename=g_LOGGER__.modulename
+            self.async_logging=g_LOGGER__.async_logging
 
     def debug(self, message):
         self.logger.debug(self.modulename+message)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""保活运行指标：计数器/直方图/仪表，按 Prometheus 文本格式输出到 /metrics"""
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+
+
+def _label_text(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self._key(labels), 0)
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_label_text(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    def get(self, **labels):
+        """返回 (次数, 总和)"""
+        with self.lock:
+            state = self.values.get(self._key(labels))
+            return (state['count'], state['sum']) if state else (0, 0.0)
+
+    @contextmanager
+    def time(self, **labels):
+        """用 with 语句统计一段代码的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = self.header()
+        with self.lock:
+            for key, state in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, state['counts']):
+                    lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, ('le', bound))} {count}")
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, ('le', '+Inf'))} {state['count']}")
+                lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {state['sum']:.6f}")
+                lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """输出 Prometheus 文本格式"""
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics)
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+ROUND_SECONDS = REGISTRY.register(Histogram(
+    "ctyun_round_duration_seconds", "一轮保活的总耗时", ["mode"]))
+ROUND_TRIGGERS_TOTAL = REGISTRY.register(Counter(
+    "ctyun_round_triggers_total", "保活触发次数(started/queued/merged)", ["outcome"]))
+LAST_ROUND_SECONDS = REGISTRY.register(Gauge(
+    "ctyun_last_round_duration_seconds", "最近一轮保活的总耗时"))
+SCHEDULE_INTERVAL_SECONDS = REGISTRY.register(Gauge(
+    "ctyun_schedule_interval_seconds", "调度间隔，轮次耗时超过该值时需要告警"))
+SCHEDULE_LAG_SECONDS = REGISTRY.register(Histogram(
+    "ctyun_schedule_lag_seconds", "账号到期到实际派发的延迟"))
+ACCOUNT_SECONDS = REGISTRY.register(Histogram(
+    "ctyun_account_keepalive_duration_seconds", "单个账号保活耗时", ["result"]))
+MODE_SECONDS = REGISTRY.register(Histogram(
+    "ctyun_keepalive_mode_duration_seconds", "按保活方式(http/browser)统计的耗时", ["mode", "result"]))
+STEP_SECONDS = REGISTRY.register(Histogram(
+    "ctyun_step_duration_seconds", "各步骤耗时", ["step"]))
+KEEPALIVE_TOTAL = REGISTRY.register(Counter(
+    "ctyun_keepalive_total", "保活次数", ["result"]))
+FAILURES_TOTAL = REGISTRY.register(Counter(
+    "ctyun_keepalive_failures_total", "保活失败次数", ["reason"]))
+ATTEMPTS_TOTAL = REGISTRY.register(Counter(
+    "ctyun_keepalive_attempts_total", "保活尝试次数(含重试)", ["result", "failure_class"]))
+CAPTCHA_ATTEMPTS_TOTAL = REGISTRY.register(Counter(
+    "ctyun_captcha_attempts_total", "验证码尝试次数"))
+OCR_TOTAL = REGISTRY.register(Counter(
+    "ctyun_ocr_recognitions_total", "验证码识别次数", ["result"]))
+BROWSER_LAUNCHES_TOTAL = REGISTRY.register(Counter(
+    "ctyun_browser_launches_total", "浏览器启动次数"))
+BROWSER_REUSES_TOTAL = REGISTRY.register(Counter(
+    "ctyun_browser_reuses_total", "浏览器复用次数"))
+LEASES_RECLAIMED_TOTAL = REGISTRY.register(Counter(
+    "ctyun_leases_reclaimed_total", "接管其他工作进程过期租约的次数"))
+DISPLAY_START_SECONDS = REGISTRY.register(Histogram(
+    "ctyun_display_start_seconds", "Xvfb 虚拟显示启动耗时", buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10)))
+DISPLAY_SESSIONS = REGISTRY.register(Gauge(
+    "ctyun_display_sessions", "正在使用虚拟显示的会话数"))
+DISPLAY_LEAKS_TOTAL = REGISTRY.register(Counter(
+    "ctyun_display_leaks_total", "进程退出时未归还的虚拟显示会话数"))
+OCR_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "ctyun_ocr_queue_depth", "等待识别的验证码数"))
+OCR_INFERENCE_SECONDS = REGISTRY.register(Histogram(
+    "ctyun_ocr_inference_seconds", "单张验证码识别耗时(工作进程内)", buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5)))
+OCR_BATCH_SIZE = REGISTRY.register(Histogram(
+    "ctyun_ocr_batch_size", "每批合并识别的验证码数", buckets=(1, 2, 4, 8, 16)))
+CAPTCHA_CACHE_TOTAL = REGISTRY.register(Counter(
+    "ctyun_captcha_cache_total", "验证码缓存查询次数", ["result"]))
+CAPTCHA_ANSWERS_TOTAL = REGISTRY.register(Counter(
+    "ctyun_captcha_answers_total", "提交的验证码答案被接受/拒绝的次数", ["outcome"]))
+OCR_ACCURACY = REGISTRY.register(Gauge(
+    "ctyun_ocr_accuracy", "已判定的验证码答案中被接受的比例"))
+CAPTCHA_RELAY_SECONDS = REGISTRY.register(Histogram(
+    "ctyun_captcha_relay_seconds", "验证码推送到网页至收到输入的耗时"))
+HTTP_REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "ctyun_http_request_seconds", "Web 服务请求耗时(不含 SSE 长连接)", ["route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)))
+HTTP_REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "ctyun_http_requests_total", "Web 服务请求数", ["route", "status"]))
+LOG_DROPPED_TOTAL = REGISTRY.register(Counter(
+    "ctyun_log_dropped_total", "日志队列已满时丢弃的日志条数"))
+LOG_HANDLER_SECONDS = REGISTRY.register(Histogram(
+    "ctyun_log_handler_seconds", "后台线程处理一条日志(写文件/控制台/界面回调)的耗时",
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)))
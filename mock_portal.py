@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+本地模拟的天翼云电脑门户，用于离线测试和性能基准
+
+复现保活代码依赖的页面约定：
+  #/login         .account / .password / .btn-submit，按概率出现 .code / .code-img 验证码
+  #/desktop-list  .desktop-main-entry-text "进入" 按钮
+  #/desktop?id=1  canvas.screenContainer 云桌面画面(先空白，paint_latency 秒后绘制)，.close-ai 提示框
+各阶段延迟和验证码概率可配置。
+
+用法: python mock_portal.py [--port 8765] [--login-latency 0.5] [--captcha-prob 0.2] ...
+"""
+import argparse
+import json
+import random
+import struct
+import threading
+import time
+import uuid
+import zlib
+from flask import Flask, Response, jsonify, request
+
+# 各阶段延迟(秒)和验证码概率
+DEFAULT_OPTIONS = {
+    'page_latency': 0.3,      # 登录页渲染
+    'login_latency': 0.5,     # 登录接口
+    'list_latency': 0.3,      # 云桌面列表渲染
+    'connect_latency': 1.0,   # 点击"进入"到地址跳转
+    'desktop_latency': 2.0,   # 云桌面画面出现
+    'paint_latency': 1.0,     # 画面出现后到远程画面绘制完成
+    'captcha_prob': 0.0,      # 登录时要求验证码的概率
+}
+
+# 模拟门户接口的 settings.http_api 描述(HTTP 保活的测试和基准使用；真实门户的接口需要另行记录)
+HTTP_API = {
+    'login': {'method': 'POST', 'path': 'api/auth/login',
+              'json': {'account': '{account}', 'password': '{password}'}},
+    'list': {'method': 'GET', 'path': 'api/desktop/list'},
+    'connect': {'method': 'POST', 'path': 'api/desktop/connect'},
+    'token_field': 'token',
+    'token_header': 'X-Token',
+    'ok_field': 'ok',
+    'captcha_field': 'need_captcha',
+    'desktops_field': 'desktops',
+}
+
+PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>天翼云电脑(模拟)</title></head>
+<body><div id="app"></div>
+<script>
+var OPT = __OPTIONS__;
+var app = document.getElementById('app');
+function later(sec, fn) { setTimeout(fn, sec * 1000); }
+function token() { return localStorage.getItem('mock_token'); }
+function render() {
+  var route = location.hash || '#/login';
+  app.innerHTML = '';
+  if (route.indexOf('#/desktop-list') === 0) {
+    if (!token()) { location.hash = '#/login'; return; }
+    later(OPT.list_latency, function () {
+      app.innerHTML = '<div class="desktop-main"><span class="desktop-main-entry-text">进入</span></div>';
+      app.querySelector('.desktop-main-entry-text').onclick = function () {
+        fetch('/api/desktop/connect', {method: 'POST', headers: {'X-Token': token()}}).then(function () {
+          later(OPT.connect_latency, function () { location.hash = '#/desktop?id=1'; });
+        });
+      };
+    });
+  } else if (route.indexOf('#/desktop?id=') === 0) {
+    if (!token()) { location.hash = '#/login'; return; }
+    app.innerHTML = '<div class="loading">连接中...</div>';
+    later(OPT.desktop_latency, function () {
+      app.innerHTML = '<button class="close-ai">关闭</button>' +
+        '<canvas class="screenContainer" tabindex="0" width="800" height="600"></canvas>';
+      app.querySelector('.close-ai').onclick = function () { this.remove(); };
+      later(OPT.paint_latency, function () {
+        var ctx = app.querySelector('canvas').getContext('2d');
+        ctx.fillStyle = '#1e5aa0'; ctx.fillRect(0, 0, 800, 600);
+        ctx.fillStyle = '#ffffff'; ctx.fillRect(40, 40, 200, 120);
+      });
+    });
+  } else {
+    later(OPT.page_latency, function () {
+      app.innerHTML = '<input class="account"><input class="password" type="password">' +
+        '<div class="captcha" style="display:none"><input class="code"><img class="code-img"></div>' +
+        '<button class="btn-submit">登录</button><div class="el-message__content"></div>';
+      app.querySelector('.btn-submit').onclick = submit;
+    });
+  }
+}
+function submit() {
+  var code = app.querySelector('.code');
+  var body = {account: app.querySelector('.account').value,
+              password: app.querySelector('.password').value,
+              code: code.value};
+  fetch('/api/auth/login', {method: 'POST', headers: {'Content-Type': 'application/json'},
+                            body: JSON.stringify(body)})
+    .then(function (r) { return r.json(); })
+    .then(function (data) {
+      if (data.ok) { localStorage.setItem('mock_token', data.token); location.hash = '#/desktop-list'; return; }
+      if (data.need_captcha) {
+        app.querySelector('.captcha').style.display = '';
+        app.querySelector('.code-img').src = '/captcha.png?t=' + Date.now();
+        code.value = '';
+      }
+      app.querySelector('.el-message__content').textContent = data.message || '';
+    });
+}
+window.addEventListener('hashchange', render);
+render();
+</script></body></html>
+'''
+
+
+def make_png(width=80, height=30, seed=0):
+    """生成一张纯色 PNG，用作验证码图片"""
+    rnd = random.Random(seed)
+    color = bytes([rnd.randrange(256), rnd.randrange(256), rnd.randrange(256)])
+    raw = b''.join(b'\x00' + color * width for _ in range(height))
+
+    def chunk(kind, data):
+        return (struct.pack('>I', len(data)) + kind + data +
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff))
+
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(raw)) +
+            chunk(b'IEND', b''))
+
+
+def create_app(options=None):
+    """创建模拟门户应用，options 覆盖 DEFAULT_OPTIONS"""
+    opts = dict(DEFAULT_OPTIONS)
+    if options:
+        opts.update(options)
+    app = Flask(__name__)
+    app.config['MOCK_OPTIONS'] = opts
+    state = {'lock': threading.Lock(), 'pending_captcha': set(), 'tokens': set(),
+             'stats': {'logins': 0, 'captchas': 0, 'connects': 0}}
+    app.config['MOCK_STATE'] = state
+
+    @app.route('/')
+    def index():
+        return Response(PAGE.replace('__OPTIONS__', json.dumps(opts)), mimetype='text/html')
+
+    @app.route('/captcha.png')
+    def captcha():
+        return Response(make_png(seed=random.random()), mimetype='image/png')
+
+    @app.route('/api/auth/login', methods=['POST'])
+    def login():
+        data = request.get_json(silent=True) or request.form.to_dict()
+        account = data.get('account', '')
+        time.sleep(opts['login_latency'])
+        with state['lock']:
+            state['stats']['logins'] += 1
+            if not account or not data.get('password'):
+                return jsonify(ok=False, message='请输入账号和密码')
+            if account in state['pending_captcha']:
+                if not data.get('code'):
+                    return jsonify(ok=False, need_captcha=True, message='请输入验证码')
+                state['pending_captcha'].discard(account)
+            elif random.random() < opts['captcha_prob']:
+                state['pending_captcha'].add(account)
+                state['stats']['captchas'] += 1
+                return jsonify(ok=False, need_captcha=True, message='请输入验证码')
+            token = uuid.uuid4().hex
+            state['tokens'].add(token)
+        resp = jsonify(ok=True, token=token)
+        resp.set_cookie('mock_session', token)
+        return resp
+
+    @app.route('/api/desktop/list')
+    def desktop_list():
+        token = request.headers.get('X-Token') or request.cookies.get('mock_session')
+        if token not in state['tokens']:
+            return jsonify(ok=False, message='未登录'), 401
+        return jsonify(ok=True, desktops=[{'id': 1, 'name': '云电脑'}])
+
+    @app.route('/api/desktop/connect', methods=['POST'])
+    def desktop_connect():
+        token = request.headers.get('X-Token') or request.cookies.get('mock_session')
+        if token not in state['tokens']:
+            return jsonify(ok=False, message='未登录'), 401
+        with state['lock']:
+            state['stats']['connects'] += 1
+        return jsonify(ok=True, id=1)
+
+    @app.route('/api/mock/stats')
+    def mock_stats():
+        with state['lock']:
+            return jsonify(state['stats'])
+
+    return app
+
+
+class MockPortalServer:
+    """在后台线程中运行模拟门户"""
+    def __init__(self, port=8765, options=None, host='127.0.0.1'):
+        from werkzeug.serving import make_server
+        self.app = create_app(options)
+        self.server = make_server(host, port, self.app, threaded=True)
+        self.url = f"http://{host}:{self.server.server_port}/"
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def add_option_arguments(parser):
+    """把延迟/验证码概率选项加到命令行参数中"""
+    for key, value in DEFAULT_OPTIONS.items():
+        parser.add_argument('--' + key.replace('_', '-'), type=float, default=value)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本地模拟天翼云电脑门户')
+    parser.add_argument('--port', type=int, default=8765)
+    add_option_arguments(parser)
+    args = parser.parse_args()
+    options = {key: getattr(args, key) for key in DEFAULT_OPTIONS}
+    print(f"模拟门户: http://127.0.0.1:{args.port}/  {options}")
+    create_app(options).run('127.0.0.1', args.port, threaded=True)
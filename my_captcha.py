@@ -1,3 +1,5 @@
+import io
+import threading
 import time
 try:
     import pytesseract
@@ -35,35 +37,115 @@ except ImportError:
             return "nofoundOCR"
     muggle_ocr=Muggle_OCR()
 
-def captcha_pic(fname,model_type=None,loops=1):
-    if USE_MUGGLE_OCR:
-        # 使用muggle_ocr
-        sdk = muggle_ocr.SDK(model_type=model_type)
-        try:
-            with open(fname, "rb") as f:
-                b = f.read()
-                for i in range(loops):
-                    st = time.time()
-                    capt_text = sdk.predict(image_bytes=b)
-                    print(capt_text, time.time() - st)
-        except FileNotFoundError as e:
-            capt_text=None
-    elif USE_PYTESSERACT and USE_PIL:
-        # 使用pytesseract
+class CaptchaRecognizer:
+    """常驻内存的验证码识别器：模型每个进程只加载一次，可被多个账号线程共用"""
+    def __init__(self, engine=None, model_type=None):
+        """
+        engine: muggle / ddddocr / tesseract，默认按已安装的库自动选择
+        model_type: muggle_ocr 的模型类型，默认 Captcha
+        """
+        self.engine = engine or self.detect_engine()
+        self.model_type = model_type
+        self.model = None
+        self.load_lock = threading.Lock()
+        self.predict_lock = threading.Lock()   # 模型本身不保证线程安全，识别时串行
+        self.stats = {'load_seconds': 0.0, 'count': 0, 'total_seconds': 0.0, 'last_seconds': 0.0, 'failures': 0}
+
+    @staticmethod
+    def detect_engine():
+        if USE_MUGGLE_OCR:
+            return 'muggle'
+        if USE_DDDDOCR:
+            return 'ddddocr'
+        if USE_PYTESSERACT and USE_PIL:
+            return 'tesseract'
+        return None
+
+    def load(self):
+        """加载模型（只在第一次调用时真正加载）"""
+        if self.model is not None or self.engine is None:
+            return self.model
+        with self.load_lock:
+            if self.model is None:
+                st = time.time()
+                if self.engine == 'muggle':
+                    model_type = self.model_type or muggle_ocr.ModelType.Captcha
+                    self.model = muggle_ocr.SDK(model_type=model_type)
+                elif self.engine == 'ddddocr':
+                    self.model = ddddocr.DdddOcr(show_ad=False)
+                else:
+                    self.model = pytesseract
+                self.stats['load_seconds'] = time.time() - st
+                print(f"OCR模型加载完成({self.engine}): {self.stats['load_seconds']:.2f}秒")
+        return self.model
+
+    def recognize(self, image_bytes):
+        """识别 PNG/JPG 图片字节，失败返回 None"""
+        if self.engine is None:
+            print("没有可用的OCR识别库，请手动输入验证码")
+            return None
+        model = self.load()
+        st = time.time()
         try:
-            image = Image.open(fname)
-            # 预处理图像以提高识别率
-            image = image.convert('L')  # 转换为灰度
-            capt_text = pytesseract.image_to_string(image, config='--psm 8 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')
-            capt_text = capt_text.strip()
-            print(f"OCR识别结果: {capt_text}")
+            with self.predict_lock:
+                if self.engine == 'muggle':
+                    capt_text = model.predict(image_bytes=image_bytes)
+                elif self.engine == 'ddddocr':
+                    capt_text = model.classification(image_bytes)
+                else:
+                    # 预处理图像以提高识别率
+                    image = Image.open(io.BytesIO(image_bytes)).convert('L')  # 转换为灰度
+                    capt_text = model.image_to_string(image, config='--psm 8 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz')
+            capt_text = capt_text.strip() if capt_text else None
         except Exception as e:
             print(f"OCR识别失败: {e}")
             capt_text = None
-    else:
-        # 没有可用的OCR库
-        print("没有可用的OCR识别库，请手动输入验证码")
-        capt_text = None
+        elapsed = time.time() - st
+        with self.load_lock:
+            self.stats['count'] += 1
+            self.stats['total_seconds'] += elapsed
+            self.stats['last_seconds'] = elapsed
+            if not capt_text:
+                self.stats['failures'] += 1
+        print(f"OCR识别结果: {capt_text}", elapsed)
+        return capt_text
+
+    def get_stats(self):
+        """模型加载耗时与识别耗时统计"""
+        with self.load_lock:
+            stats = dict(self.stats)
+        stats['engine'] = self.engine
+        stats['avg_seconds'] = stats['total_seconds'] / stats['count'] if stats['count'] else 0.0
+        return stats
+
+
+_recognizers = {}
+_recognizer_lock = threading.Lock()
+
+def get_recognizer(model_type=None):
+    """获取进程内共享的识别器（每种模型类型一个）"""
+    recognizer = _recognizers.get(model_type)
+    if recognizer is None:
+        with _recognizer_lock:
+            recognizer = _recognizers.get(model_type)
+            if recognizer is None:
+                recognizer = _recognizers[model_type] = CaptchaRecognizer(model_type=model_type)
+    return recognizer
+
+def captcha_bytes(image_bytes):
+    """识别图片字节，例如 element.screenshot_as_png"""
+    return get_recognizer().recognize(image_bytes)
+
+def captcha_pic(fname,model_type=None,loops=1):
+    try:
+        with open(fname, "rb") as f:
+            b = f.read()
+    except FileNotFoundError as e:
+        return None
+    recognizer = get_recognizer(model_type)
+    capt_text = None
+    for i in range(loops):
+        capt_text = recognizer.recognize(b)
     return capt_text
 
 
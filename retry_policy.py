@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""失败分类与重试策略：按 settings.retry_times / retry_delay 做指数退避加随机抖动"""
+import random
+
+# 失败类别
+ELEMENT_NOT_FOUND = 'element_not_found'    # 页面元素未找到/等待超时
+CAPTCHA_EXHAUSTED = 'captcha_exhausted'    # 验证码重试次数用尽
+BROWSER_CRASH = 'browser_crash'            # 浏览器或驱动崩溃、会话失效
+NETWORK_TIMEOUT = 'network_timeout'        # 网络错误或页面加载超时
+UNKNOWN = 'unknown'
+
+# 各类别的重试参数：max_retries 为 None 时使用 settings.retry_times；multiplier 调整基础延迟
+DEFAULT_CLASS_POLICIES = {
+    ELEMENT_NOT_FOUND: {'max_retries': None, 'multiplier': 1.0},
+    CAPTCHA_EXHAUSTED: {'max_retries': 1, 'multiplier': 3.0},   # 换一张验证码前多等一会
+    BROWSER_CRASH: {'max_retries': None, 'multiplier': 0.5},     # 换一个浏览器即可，尽快重试
+    NETWORK_TIMEOUT: {'max_retries': None, 'multiplier': 2.0},
+    UNKNOWN: {'max_retries': 1, 'multiplier': 1.0},
+}
+
+_BROWSER_CRASH_HINTS = ('chrome not reachable', 'session deleted', 'invalid session id', 'disconnected',
+                        'no such window', 'target window already closed', 'crash', 'connection refused',
+                        'max retries exceeded')
+_NETWORK_HINTS = ('net::err_', 'timed out receiving message from renderer', 'read timed out',
+                  'err_connection', 'err_name_not_resolved', 'err_internet_disconnected')
+
+
+class KeepaliveError(Exception):
+    """带失败类别的保活异常"""
+    failure_class = UNKNOWN
+
+
+class ElementNotFoundError(KeepaliveError):
+    failure_class = ELEMENT_NOT_FOUND
+
+
+class CaptchaExhaustedError(KeepaliveError):
+    failure_class = CAPTCHA_EXHAUSTED
+
+
+def classify_failure(error):
+    """根据异常判断失败类别"""
+    if isinstance(error, KeepaliveError):
+        # 元素找不到的根因可能是浏览器崩溃或网络中断
+        if error.__cause__ is not None:
+            cause_class = classify_failure(error.__cause__)
+            if cause_class in (BROWSER_CRASH, NETWORK_TIMEOUT):
+                return cause_class
+        return error.failure_class
+    message = str(error).lower()
+    if any(hint in message for hint in _NETWORK_HINTS):
+        return NETWORK_TIMEOUT
+    if any(hint in message for hint in _BROWSER_CRASH_HINTS):
+        return BROWSER_CRASH
+    name = type(error).__name__
+    if name in ('NoSuchElementException', 'ElementNotInteractableException',
+                'StaleElementReferenceException', 'TimeoutException'):
+        return ELEMENT_NOT_FOUND
+    if name in ('InvalidSessionIdException', 'NoSuchWindowException', 'SessionNotCreatedException',
+                'MaxRetryError', 'ConnectionRefusedError', 'ProtocolError'):
+        return BROWSER_CRASH
+    if name in ('ReadTimeout', 'ConnectTimeout', 'ConnectionError', 'socket.timeout'):
+        return NETWORK_TIMEOUT
+    return UNKNOWN
+
+
+class RetryPolicy:
+    def __init__(self, retry_times=3, retry_delay=10, class_policies=None, max_delay=300, jitter=0.2):
+        """
+        retry_times: 每个账号每轮最多重试次数
+        retry_delay: 第一次重试前的基础延迟(秒)，之后按 2 的幂增长
+        class_policies: 覆盖 DEFAULT_CLASS_POLICIES
+        jitter: 随机抖动比例，避免多个账号同时重试
+        """
+        self.retry_times = retry_times
+        self.retry_delay = retry_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.class_policies = {k: dict(v) for k, v in DEFAULT_CLASS_POLICIES.items()}
+        for failure_class, policy in (class_policies or {}).items():
+            self.class_policies.setdefault(failure_class, {}).update(policy)
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(retry_times=int(settings.get('retry_times', 3)),
+                   retry_delay=float(settings.get('retry_delay', 10)),
+                   class_policies=settings.get('retry_policies'))
+
+    def max_retries(self, failure_class):
+        policy = self.class_policies.get(failure_class, self.class_policies[UNKNOWN])
+        limit = policy.get('max_retries')
+        if limit is None:
+            return self.retry_times
+        return min(limit, self.retry_times)
+
+    def should_retry(self, failure_class, attempt):
+        """attempt 为已经完成的尝试次数（从1开始）"""
+        return attempt <= self.max_retries(failure_class)
+
+    def delay(self, failure_class, attempt):
+        """第 attempt 次失败后，到下一次重试前的等待秒数"""
+        policy = self.class_policies.get(failure_class, self.class_policies[UNKNOWN])
+        base = self.retry_delay * policy.get('multiplier', 1.0) * (2 ** (attempt - 1))
+        base = min(base, self.max_delay)
+        return max(0.0, base * random.uniform(1 - self.jitter, 1 + self.jitter))
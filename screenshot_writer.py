@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+截图后台写盘：工作线程只取得截图字节并放入队列，由单独的线程缩放/转码、去重、写文件并清理历史
+
+- 每个截图名只保留最新一张(static/<名称>.<格式>)，与上一张感知哈希(dHash)相近时不重写；
+- history 开启时另存一份带时间戳的副本到 static/history/，按数量、总大小和天数清理；
+- 未安装 Pillow 时不缩放、不转码，只按内容完全相同去重。
+"""
+import hashlib
+import io
+import os
+import queue
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+try:
+    from PIL import Image
+    USE_PIL = True
+except ImportError:
+    USE_PIL = False
+
+DEFAULT_SETTINGS = {
+    'format': 'png',        # png 或 webp(需要 Pillow)
+    'max_width': 0,         # >0 时等比缩小到该宽度(需要 Pillow)
+    'quality': 80,          # webp 质量
+    'dedup_distance': 4,    # 与上一张的 dHash 距离不超过该值时视为重复
+    'history': True,        # 是否保留带时间戳的历史截图
+    'max_files': 200,       # 历史截图最多保留张数
+    'max_mb': 100,          # 历史截图最多占用空间
+    'max_days': 7,          # 历史截图最多保留天数
+    'queue_size': 50,       # 待写截图上限，队列满时丢弃新截图
+}
+
+
+def image_hash(image_bytes):
+    """有 Pillow 时返回 64 位 dHash(整数)，否则返回内容摘要(字符串)"""
+    if USE_PIL:
+        image = Image.open(io.BytesIO(image_bytes)).convert('L').resize((9, 8))
+        pixels = list(image.getdata())
+        bits = 0
+        for row in range(8):
+            for col in range(8):
+                bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+        return bits
+    return hashlib.sha1(image_bytes).hexdigest()
+
+
+def hash_distance(a, b):
+    if isinstance(a, int) and isinstance(b, int):
+        return bin(a ^ b).count('1')
+    return 0 if a == b else 64
+
+
+def write_bytes(path, data):
+    """先写临时文件再改名，网页端不会读到写了一半的图片"""
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class ScreenshotWriter:
+    def __init__(self, directory='static', settings=None, logger=None):
+        """
+        directory: 最新截图目录，历史截图放在其下的 history/
+        settings: 覆盖 DEFAULT_SETTINGS 中的项
+        """
+        self.directory = directory
+        self.history_dir = os.path.join(directory, 'history')
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        if self.settings['format'] != 'png' and not USE_PIL:
+            self.settings['format'] = 'png'
+        self.logger = logger
+        self.queue = queue.Queue(maxsize=self.settings['queue_size'])
+        self.lock = threading.Lock()
+        self.last_hash = {}     # 截图名 -> 上一张的哈希
+        self.last_sweep = 0.0
+        self.thread = None
+        self.stats = {'submitted': 0, 'written': 0, 'deduped': 0, 'dropped': 0, 'pruned': 0,
+                      'bytes_in': 0, 'bytes_out': 0, 'write_seconds': 0.0}
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.info(f"[截图] {message}")
+
+    def _ensure_thread(self):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="screenshot-writer", daemon=True)
+                self.thread.start()
+
+    def path_for(self, name):
+        """最新截图的文件路径"""
+        return os.path.join(self.directory, f"{name}.{self.settings['format']}")
+
+    def submit(self, name, image_bytes):
+        """放入写盘队列，不等待；队列满时丢弃并返回 False"""
+        self._ensure_thread()
+        try:
+            self.queue.put_nowait((name, image_bytes, datetime.now()))
+        except queue.Full:
+            with self.lock:
+                self.stats['dropped'] += 1
+            return False
+        with self.lock:
+            self.stats['submitted'] += 1
+        return True
+
+    def capture(self, driver, name):
+        """截取浏览器当前画面并放入写盘队列，返回最新截图的路径"""
+        self.submit(name, driver.get_screenshot_as_png())
+        return self.path_for(name)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except Exception as e:
+                self._log(f"写入截图失败: {str(e)}")
+            finally:
+                self.queue.task_done()
+
+    def encode(self, image_bytes):
+        """按配置缩放/转码，返回写入的字节"""
+        if not USE_PIL or (self.settings['format'] == 'png' and not self.settings['max_width']):
+            return image_bytes
+        image = Image.open(io.BytesIO(image_bytes))
+        max_width = self.settings['max_width']
+        if max_width and image.width > max_width:
+            image = image.resize((max_width, max(1, image.height * max_width // image.width)))
+        output = io.BytesIO()
+        if self.settings['format'] == 'webp':
+            image.save(output, 'WEBP', quality=self.settings['quality'])
+        else:
+            image.save(output, 'PNG', optimize=True)
+        return output.getvalue()
+
+    def _write(self, name, image_bytes, taken_at):
+        start = time.perf_counter()
+        digest = image_hash(image_bytes)
+        previous = self.last_hash.get(name)
+        if previous is not None and hash_distance(previous, digest) <= self.settings['dedup_distance'] \
+                and os.path.exists(self.path_for(name)):
+            with self.lock:
+                self.stats['deduped'] += 1
+            return
+        self.last_hash[name] = digest
+
+        data = self.encode(image_bytes)
+        os.makedirs(self.directory, exist_ok=True)
+        write_bytes(self.path_for(name), data)
+        if self.settings['history']:
+            os.makedirs(self.history_dir, exist_ok=True)
+            stamp = taken_at.strftime('%Y%m%d_%H%M%S')
+            write_bytes(os.path.join(self.history_dir, f"{name}_{stamp}.{self.settings['format']}"), data)
+        with self.lock:
+            self.stats['written'] += 1
+            self.stats['bytes_in'] += len(image_bytes)
+            self.stats['bytes_out'] += len(data)
+            self.stats['write_seconds'] += time.perf_counter() - start
+        if self.settings['history'] and time.time() - self.last_sweep > 60:
+            self.sweep()
+
+    def sweep(self):
+        """按天数、张数和总大小清理历史截图，返回删除的文件数"""
+        self.last_sweep = time.time()
+        if not os.path.isdir(self.history_dir):
+            return 0
+        files = []
+        for entry in os.scandir(self.history_dir):
+            if entry.is_file() and not entry.name.startswith('.tmp_'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()  # 最旧的在前
+        cutoff = time.time() - self.settings['max_days'] * 86400
+        max_bytes = self.settings['max_mb'] * 1024 * 1024
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        while files and (files[0][0] < cutoff or len(files) > self.settings['max_files'] or total > max_bytes):
+            _, size, path = files.pop(0)
+            try:
+                os.remove(path)
+                removed += 1
+                total -= size
+            except OSError:
+                pass
+        if removed:
+            with self.lock:
+                self.stats['pruned'] += removed
+            self._log(f"清理历史截图 {removed} 张")
+        return removed
+
+    def flush(self, timeout=10):
+        """等待队列中的截图写完(最多 timeout 秒)"""
+        deadline = time.time() + timeout
+        while self.queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.05)
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, pending=self.queue.qsize())
+
+    def close(self, timeout=10):
+        self.flush(timeout)
+        if self.thread is not None:
+            try:
+                self.queue.put_nowait(None)
+            except queue.Full:
+                pass
+            self.thread.join(timeout)
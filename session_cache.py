@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""账号会话缓存：保存登录后的 cookie / localStorage 快照，下次保活时跳过登录表单"""
+import json
+import os
+import threading
+import time
+
+
+class SessionCache:
+    def __init__(self, cache_dir="sessions", max_age_hours=72):
+        """
+        cache_dir: 快照保存目录，每个账号一个文件
+        max_age_hours: 快照最长有效期，超过后不再尝试
+        """
+        self.cache_dir = cache_dir
+        self.max_age_seconds = max_age_hours * 3600
+        self.lock = threading.Lock()
+        self.stats = {}  # account -> {'hits': n, 'misses': n}
+
+    def _path(self, account):
+        safe = "".join(c for c in str(account) if c.isalnum() or c in ('-', '_'))
+        return os.path.join(self.cache_dir, f"{safe}.json")
+
+    def _record(self, account, hit):
+        with self.lock:
+            stat = self.stats.setdefault(account, {'hits': 0, 'misses': 0})
+            stat['hits' if hit else 'misses'] += 1
+
+    def get_hit_rate(self, account):
+        """获取某个账号的缓存命中率"""
+        with self.lock:
+            stat = self.stats.get(account, {'hits': 0, 'misses': 0})
+        total = stat['hits'] + stat['misses']
+        return (stat['hits'] / total if total else 0.0), stat['hits'], total
+
+    def load(self, account):
+        """读取快照，不存在或已过期返回 None"""
+        path = self._path(account)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - snapshot.get('saved_at', 0) > self.max_age_seconds:
+            self.invalidate(account)
+            return None
+        return snapshot
+
+    def save(self, driver, account):
+        """保存当前浏览器中的登录状态"""
+        snapshot = {
+            'saved_at': time.time(),
+            'url': driver.current_url,
+            'cookies': driver.get_cookies(),
+            'local_storage': driver.execute_script(
+                "var s = {}; for (var i = 0; i < localStorage.length; i++) {"
+                " var k = localStorage.key(i); s[k] = localStorage.getItem(k); } return s;"),
+            'session_storage': driver.execute_script(
+                "var s = {}; for (var i = 0; i < sessionStorage.length; i++) {"
+                " var k = sessionStorage.key(i); s[k] = sessionStorage.getItem(k); } return s;"),
+        }
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        path = self._path(account)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def invalidate(self, account):
+        """删除失效的快照"""
+        try:
+            os.remove(self._path(account))
+        except FileNotFoundError:
+            pass
+
+    def inject(self, driver, account, base_url, target_url):
+        """
+        把快照注入浏览器并打开 target_url，返回 False 表示没有可用快照或注入失败
+        注入后由调用方校验会话是否仍然有效，再调用 settle 记录结果
+        """
+        snapshot = self.load(account)
+        if snapshot is None:
+            return False
+        try:
+            # 必须先打开同源页面才能写入 cookie 和 storage
+            driver.get(base_url)
+            for cookie in snapshot.get('cookies', []):
+                cookie = {k: v for k, v in cookie.items() if k in ('name', 'value', 'path', 'domain', 'secure', 'httpOnly', 'expiry')}
+                if 'expiry' in cookie:
+                    cookie['expiry'] = int(cookie['expiry'])
+                try:
+                    driver.add_cookie(cookie)
+                except Exception:
+                    pass
+            driver.execute_script(
+                "var l = arguments[0], s = arguments[1];"
+                "for (var k in l) { localStorage.setItem(k, l[k]); }"
+                "for (var k in s) { sessionStorage.setItem(k, s[k]); }",
+                snapshot.get('local_storage') or {}, snapshot.get('session_storage') or {})
+            driver.get(target_url)
+            return True
+        except Exception:
+            return False
+
+    def settle(self, account, hit):
+        """记录命中结果，会话已失效时删除快照"""
+        if not hit:
+            self.invalidate(account)
+        self._record(account, hit)
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+声明式保活步骤：步骤表只描述"找什么、做什么、等什么"，编译一次后由 StepRunner 解释执行
+
+命令行版本(ctyun-alive.py)和多账号管理器共用同一份步骤表和解释器；
+门户改版时在 PORTAL_OVERRIDES 或 settings.step_overrides 中按步骤 id 覆盖字段即可。
+"""
+import copy
+import json
+import threading
+import time
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.common.action_chains import ActionChains
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support import expected_conditions as EC
+import metrics
+from retry_policy import ElementNotFoundError
+from wait_engine import Wait, dom_settled_condition, canvas_painted_condition, run_steps
+
+# 步骤表: 阶段 -> [步骤]
+# 步骤字段:
+#   id          步骤标识，用于覆盖和计时
+#   name        日志中显示的名称
+#   find        元素定位 [[by, value], ...]，按顺序优先，任意一个出现即可
+#   find_state  present / visible / clickable，默认 click 用 clickable，其余用 present
+#   action      click / send_keys / active_keys(向当前焦点元素输入并回车)，省略表示只等待
+#   value       输入内容，{account} {password} 等占位符在执行时替换
+#   then        动作之后等待的条件 [[类型, 参数...], ...]，任意一个满足即继续
+#   timeout_key / then_timeout_key  wait_engine 中的超时配置项；timeout / then_timeout 直接指定秒数
+#   dwell       步骤完成后再停留的秒数(保持云桌面连接)
+#   required    False 时找不到元素只记录日志；只等待的步骤超时时抛出异常
+DEFAULT_PLAN = {
+    'login': [
+        {'id': 'account', 'name': '账号输入框', 'find': [['class name', 'account']],
+         'action': 'send_keys', 'value': '{account}', 'timeout_key': 'page_load'},
+        {'id': 'password', 'name': '密码输入框', 'find': [['class name', 'password']],
+         'action': 'send_keys', 'value': '{password}'},
+        {'id': 'submit', 'name': '登录按钮', 'find': [['class name', 'btn-submit']], 'action': 'click',
+         'then': [['url_contains', 'desktop-list'], ['visible', 'class name', 'code'],
+                  ['visible', 'class name', 'el-message__content']],
+         'then_timeout_key': 'login_result'},
+    ],
+    'captcha': [
+        {'id': 'captcha_image', 'name': '验证码图片', 'find': [['class name', 'code-img']],
+         'find_state': 'visible', 'timeout': 0, 'required': False},
+        {'id': 'captcha_code', 'name': '验证码输入框', 'find': [['class name', 'code']],
+         'find_state': 'visible', 'action': 'send_keys', 'value': '{captcha}', 'timeout': 0, 'required': False},
+        {'id': 'captcha_submit', 'name': '验证码登录', 'find': [['class name', 'btn-submit']], 'action': 'click',
+         'then': [['url_contains', 'desktop-list']], 'then_timeout_key': 'captcha_result'},
+    ],
+    'enter_desktop': [
+        {'id': 'desktop_entry', 'name': '云桌面进入按钮',
+         'find': [['xpath', "//span[contains(text(), '进入') and contains(@class, 'desktop-main-entry-text')]"],
+                  ['class name', 'desktop-main-entry'],
+                  ['class name', 'desktop-main-entry-text'],
+                  ['xpath', "//*[contains(text(), '进入')]"]],
+         'action': 'click', 'timeout_key': 'desktop_button'},
+    ],
+    'desktop_ready': [
+        {'id': 'desktop_url', 'name': '云桌面地址跳转', 'then': [['url_contains', 'desktop?id=']],
+         'then_timeout_key': 'desktop_url', 'required': False},
+        {'id': 'desktop_canvas', 'name': '云桌面画面', 'then': [['present', 'tag name', 'canvas']],
+         'then_timeout_key': 'desktop_ready', 'required': False},
+        # canvas 出现时远程画面还没有到达，绘制也不改变 DOM：等到 canvas 有画面后再停留一段时间
+        {'id': 'desktop_painted', 'name': '云桌面画面绘制', 'then': [['canvas_painted']],
+         'then_timeout_key': 'desktop_ready', 'dwell': 10, 'required': False},
+    ],
+    'windows_login': [
+        {'id': 'close_ai', 'name': '关闭提示框', 'find': [['class name', 'close-ai']], 'action': 'click',
+         'timeout': 3, 'then': [['dom_settled', 1.0]], 'then_timeout': 3, 'required': False},
+        {'id': 'screen', 'name': '云桌面画面', 'find': [['class name', 'screenContainer']], 'action': 'click',
+         'then': [['dom_settled', 1.0]], 'then_timeout': 15, 'required': False},
+        {'id': 'winpassword', 'name': 'Windows 密码', 'action': 'active_keys', 'value': '{winpassword}',
+         'required': False},
+    ],
+}
+
+# 门户版本 -> {步骤 id: 覆盖字段}，settings.portal_version 选择版本，settings.step_overrides 可追加
+PORTAL_OVERRIDES = {}
+
+_LOCATOR_TYPES = {getattr(By, name) for name in dir(By) if not name.startswith('_')}
+_ACTIONS = (None, 'click', 'send_keys', 'active_keys')
+_FIND_STATES = {
+    'present': EC.presence_of_element_located,
+    'visible': EC.visibility_of_element_located,
+    'clickable': EC.element_to_be_clickable,
+}
+
+
+def _locator(spec, where):
+    by, value = spec
+    if by not in _LOCATOR_TYPES:
+        raise ValueError(f"{where}: 未知的定位方式 {by}")
+    return (by, value)
+
+
+def _condition_factory(spec, where):
+    """把条件描述编译为工厂函数；dom_settled 有状态，每次等待都要新建"""
+    kind, args = spec[0], spec[1:]
+    if kind == 'url_contains':
+        return lambda: EC.url_contains(args[0])
+    if kind in _FIND_STATES:
+        locator = _locator(args, where)
+        return lambda: _FIND_STATES[kind](locator)
+    if kind == 'canvas_painted':
+        return canvas_painted_condition
+    if kind == 'dom_settled':
+        quiet = float(args[0]) if args else 1.0
+        return lambda: dom_settled_condition(quiet)
+    raise ValueError(f"{where}: 未知的等待条件 {kind}")
+
+
+def _any_of(factories):
+    if len(factories) == 1:
+        return factories[0]()
+    return EC.any_of(*(factory() for factory in factories))
+
+
+class PlanStep:
+    """编译后的单个步骤"""
+    def __init__(self, spec, phase):
+        self.id = spec['id']
+        where = f"{phase}.{self.id}"
+        self.name = spec.get('name', self.id)
+        self.action = spec.get('action')
+        if self.action not in _ACTIONS:
+            raise ValueError(f"{where}: 未知的动作 {self.action}")
+        self.value = spec.get('value', '')
+        self.locators = tuple(_locator(loc, where) for loc in spec.get('find', ()))
+        if self.action in ('click', 'send_keys') and not self.locators:
+            raise ValueError(f"{where}: {self.action} 需要 find")
+        find_state = spec.get('find_state', 'clickable' if self.action == 'click' else 'present')
+        if find_state not in _FIND_STATES:
+            raise ValueError(f"{where}: 未知的 find_state {find_state}")
+        self.find_condition_type = _FIND_STATES[find_state]
+        self.timeout_key = spec.get('timeout_key', 'element')
+        self.timeout = spec.get('timeout')
+        self.then = tuple(_condition_factory(cond, where) for cond in spec.get('then', ()))
+        self.then_timeout_key = spec.get('then_timeout_key', 'element')
+        self.then_timeout = spec.get('then_timeout')
+        self.dwell = float(spec.get('dwell', 0))
+        self.required = spec.get('required', True)
+
+    def find_condition(self):
+        """任意一个定位命中即返回该元素，排在前面的定位优先"""
+        conditions = [self.find_condition_type(locator) for locator in self.locators]
+        return conditions[0] if len(conditions) == 1 else EC.any_of(*conditions)
+
+    def then_condition(self):
+        return _any_of(self.then) if self.then else None
+
+    def render(self, params):
+        return self.value.format_map(params)
+
+
+class StepPlan:
+    """编译后的步骤表"""
+    def __init__(self, spec, version='default'):
+        self.version = version
+        self.phases = {}
+        self.steps = {}
+        for phase, steps in spec.items():
+            compiled = tuple(PlanStep(step, phase) for step in steps)
+            self.phases[phase] = compiled
+            for step in compiled:
+                if step.id in self.steps:
+                    raise ValueError(f"步骤 id 重复: {step.id}")
+                self.steps[step.id] = step
+
+    def phase(self, name):
+        return self.phases.get(name, ())
+
+    def step(self, step_id):
+        return self.steps[step_id]
+
+
+def build_spec(version=None, overrides=None):
+    """在默认步骤表上应用门户版本覆盖和用户覆盖，返回新的步骤表描述"""
+    spec = copy.deepcopy(DEFAULT_PLAN)
+    patches = {}
+    for source in (PORTAL_OVERRIDES.get(version or 'default', {}), (overrides or {}).get(version or 'default', {})):
+        for step_id, fields in source.items():
+            patches.setdefault(step_id, {}).update(fields)
+    for steps in spec.values():
+        for step in steps:
+            step.update(patches.pop(step['id'], {}))
+    if patches:
+        raise ValueError(f"覆盖了不存在的步骤: {', '.join(patches)}")
+    return spec
+
+
+_plans = {}
+_plans_lock = threading.Lock()
+
+
+def get_plan(version=None, overrides=None):
+    """取得编译后的步骤表，相同版本和覆盖只编译一次"""
+    key = (version or 'default', json.dumps(overrides or {}, sort_keys=True, ensure_ascii=False))
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is None:
+            plan = StepPlan(build_spec(version, overrides), key[0])
+            _plans[key] = plan
+        return plan
+
+
+class StepRunner:
+    """
+    find/run/run_step 在当前线程中阻塞执行；iter_find/iter_run/iter_step 是对应的步骤生成器，
+    遇到等待时 yield wait_engine.Wait，可以交给异步等待器 await
+    """
+    def __init__(self, driver, waiter, plan, params, log=None):
+        """
+        waiter: wait_engine.StepWaiter，等待超时配置和等待记录都沿用它
+        params: 占位符取值，如 {'account': ..., 'password': ...}
+        """
+        self.driver = driver
+        self.waiter = waiter
+        self.plan = plan
+        self.params = params
+        self.log = log
+        self.timings = []  # [(步骤 id, 秒数, 是否完成)]
+
+    def find(self, step_id, timeout=None):
+        """按步骤的定位查找元素，找不到返回 None"""
+        return run_steps(self.iter_find(step_id, timeout), self.waiter)
+
+    def run(self, phase, **extra):
+        """依次执行一个阶段的全部步骤"""
+        run_steps(self.iter_run(phase, **extra), self.waiter)
+
+    def run_step(self, step_id, **extra):
+        """执行单个步骤，返回找到的元素（只等待的步骤返回等待结果）"""
+        return run_steps(self.iter_step(step_id, **extra), self.waiter)
+
+    def iter_find(self, step_id, timeout=None):
+        step = self.plan.step(step_id)
+        if timeout is None:
+            timeout = step.timeout
+        return (yield Wait('until', step.find_condition(), step.name, step.timeout_key, timeout, False))
+
+    def iter_run(self, phase, **extra):
+        for step in self.plan.phase(phase):
+            yield from self.iter_step(step.id, **extra)
+
+    def iter_step(self, step_id, **extra):
+        step = self.plan.step(step_id)
+        start = time.perf_counter()
+        ok = False
+        try:
+            element = None
+            if step.locators:
+                element = yield from self.iter_find(step_id)
+                if element is None:
+                    self.report_missing(step)
+                    if step.required:
+                        raise ElementNotFoundError(f"无法找到{step.name}")
+                    return None
+            if step.action:
+                self.perform(step, element, dict(self.params, **extra))
+            if step.then:
+                result = yield Wait('until', step.then_condition(), step.name + "后", step.then_timeout_key,
+                                    step.then_timeout, False)
+                if not step.locators and not step.action:
+                    if result is None and step.required:
+                        raise TimeoutException(f"等待超时: {step.name}")
+                    element = result
+            if step.dwell:
+                yield Wait('dwell', step.name + "停留", step.dwell)
+            ok = True
+            return element
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings.append((step.id, elapsed, ok))
+            metrics.STEP_SECONDS.observe(elapsed, step='plan_' + step.id)
+
+    def perform(self, step, element, params):
+        if step.action == 'send_keys':
+            element.clear()
+            element.send_keys(step.render(params))
+        elif step.action == 'click':
+            self.click(step, element)
+        elif step.action == 'active_keys':
+            active = self.driver.switch_to.active_element
+            active.send_keys(step.render(params))
+            active.send_keys(Keys.ENTER)
+        if self.log:
+            self.log(f"{step.name}: {step.action} 完成")
+
+    def click(self, step, element):
+        """依次尝试直接点击、JavaScript 点击、ActionChains 点击"""
+        try:
+            element.click()
+            return
+        except Exception as e1:
+            first_error = e1
+        try:
+            self.driver.execute_script("arguments[0].click();", element)
+            return
+        except Exception:
+            pass
+        try:
+            ActionChains(self.driver).move_to_element(element).click().perform()
+        except Exception as e3:
+            if step.required:
+                raise ElementNotFoundError(f"无法点击{step.name}: {first_error}; {e3}") from e3
+            if self.log:
+                self.log(f"所有点击方法都失败: {step.name}, 错误: {first_error}; {e3}")
+
+    def report_missing(self, step):
+        """元素找不到时记录页面上的提示信息"""
+        if not self.log:
+            return
+        tips = ""
+        try:
+            tips = self.driver.find_element(By.CLASS_NAME, 'el-message__content').text
+        except Exception:
+            pass
+        self.log(f"未找到{step.name}" + (f"，页面提示: {tips}" if tips else ""))
+
+    def summary(self):
+        """各步骤耗时汇总"""
+        return ", ".join(f"{step_id} {elapsed:.1f}秒{'' if ok else '(未完成)'}" for step_id, elapsed, ok in self.timings)
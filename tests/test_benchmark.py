@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""冒烟测试：在本地模拟门户上用管理器跑通一轮保活，日志和截图只写入工作目录"""
+import os
+import shutil
+import sys
+
+import pytest
+
+pytest.importorskip('selenium')
+pytest.importorskip('flask')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if not any(shutil.which(name) for name in ('google-chrome', 'chromium', 'chromium-browser', 'chrome')):
+    pytest.skip('没有可用的 Chrome/Chromium', allow_module_level=True)
+
+import benchmark  # noqa: E402
+
+FAST = ['--page-latency', '0.05', '--login-latency', '0.05', '--list-latency', '0.05',
+        '--connect-latency', '0.1', '--desktop-latency', '0.2', '--paint-latency', '0.2', '--dwell', '0']
+
+
+def test_manager_round_on_mock_portal(tmp_path):
+    workdir = tmp_path / 'bench'
+    result = benchmark.main(['--accounts', '2', '--mode', 'concurrent', '--concurrency', '2',
+                             '--workdir', str(workdir)] + FAST)
+
+    assert result['accounts'] == 2
+    assert result['failures'] == 0
+    assert (workdir / 'logs' / 'improved_account.log').exists()
+    assert os.path.exists(workdir / 'static' / 'bench1_13800000001_screenshot.png')
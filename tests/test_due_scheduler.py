@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""到期时间计算：上次保活 + 间隔，并对齐到时间范围和工作日"""
+import os
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from due_scheduler import account_window, align_to_window, next_due  # noqa: E402
+
+# 2026-10-16 是星期五
+SCHEDULE = {'interval_minutes': 30, 'start_time': '08:00', 'end_time': '18:00', 'weekend_enabled': False}
+
+
+def test_due_after_interval_inside_window():
+    account = {'last_keepalive': '2026-10-16 10:00:00'}
+    assert next_due(account, SCHEDULE, datetime(2026, 10, 16, 10, 5)) == datetime(2026, 10, 16, 10, 30)
+
+
+def test_never_kept_alive_is_due_now():
+    now = datetime(2026, 10, 16, 10, 5)
+    assert next_due({'last_keepalive': None}, SCHEDULE, now) == now
+
+
+def test_before_window_waits_for_start():
+    account = {'last_keepalive': '2026-10-15 17:50:00'}
+    assert next_due(account, SCHEDULE, datetime(2026, 10, 16, 6, 0)) == datetime(2026, 10, 16, 8, 0)
+
+
+def test_after_friday_window_skips_weekend():
+    account = {'last_keepalive': '2026-10-16 17:45:00'}
+    assert next_due(account, SCHEDULE, datetime(2026, 10, 16, 17, 50)) == datetime(2026, 10, 19, 8, 0)
+
+
+def test_weekend_enabled_runs_on_saturday():
+    schedule = dict(SCHEDULE, weekend_enabled=True)
+    account = {'last_keepalive': '2026-10-16 17:45:00'}
+    assert next_due(account, schedule, datetime(2026, 10, 16, 17, 50)) == datetime(2026, 10, 17, 8, 0)
+
+
+def test_all_day_window_ignores_weekend():
+    schedule = dict(SCHEDULE, start_time='00:00', end_time='23:59')
+    saturday = datetime(2026, 10, 17, 3, 0)
+    assert align_to_window(saturday, account_window({}, schedule)) == saturday
+
+
+def test_account_overrides_interval_and_window():
+    account = {'last_keepalive': '2026-10-16 10:00:00', 'interval_minutes': 120, 'end_time': '11:00'}
+    assert next_due(account, SCHEDULE, datetime(2026, 10, 16, 10, 5)) == datetime(2026, 10, 19, 8, 0)
+    account['end_time'] = '20:00'
+    assert next_due(account, SCHEDULE, datetime(2026, 10, 16, 10, 5)) == datetime(2026, 10, 16, 12, 0)
+
+
+def test_failure_waits_at_least_one_interval():
+    account = {'last_keepalive': None}
+    started = datetime(2026, 10, 16, 10, 0)
+    due = next_due(account, SCHEDULE, datetime(2026, 10, 16, 10, 2), not_before=started)
+    assert due == datetime(2026, 10, 16, 10, 30)
+
+
+def test_window_end_is_inclusive():
+    window = account_window({}, SCHEDULE)
+    assert align_to_window(datetime(2026, 10, 16, 18, 0), window) == datetime(2026, 10, 16, 18, 0)
+    assert align_to_window(datetime(2026, 10, 16, 18, 0, 1), window) == datetime(2026, 10, 19, 8, 0)
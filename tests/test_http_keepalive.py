@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""HTTP 保活：在本地模拟门户上重放登录/云桌面列表/连接接口，接口描述取自 settings.http_api"""
+import json
+import os
+import sys
+
+import pytest
+
+pytest.importorskip('flask')
+pytest.importorskip('requests')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from http_keepalive import HttpKeepaliveClient, HttpKeepaliveError  # noqa: E402
+from mock_portal import HTTP_API, MockPortalServer  # noqa: E402
+
+FAST = {'login_latency': 0.01}
+
+
+@pytest.fixture
+def portal():
+    server = MockPortalServer(0, FAST).start()
+    yield server
+    server.stop()
+
+
+def mock_stats(server):
+    with server.app.config['MOCK_STATE']['lock']:
+        return dict(server.app.config['MOCK_STATE']['stats'])
+
+
+def test_endpoints_must_be_configured(portal):
+    with pytest.raises(ValueError):
+        HttpKeepaliveClient(portal.url, None)
+    api = dict(HTTP_API, connect={'method': 'POST'})
+    with pytest.raises(ValueError, match='connect'):
+        HttpKeepaliveClient(portal.url, api)
+
+
+def test_session_is_reused_between_rounds(portal):
+    client = HttpKeepaliveClient(portal.url, HTTP_API)
+    try:
+        assert client.keepalive('13800000001', 'pw').startswith('重新登录')
+        assert client.keepalive('13800000001', 'pw').startswith('复用会话')
+        assert mock_stats(portal)['logins'] == 1
+        assert mock_stats(portal)['connects'] == 2
+        # 服务端会话失效后重新登录
+        portal.app.config['MOCK_STATE']['tokens'].clear()
+        assert client.keepalive('13800000001', 'pw').startswith('重新登录')
+        assert client.get_stats()['logins'] == 2
+    finally:
+        client.close()
+
+
+def test_captcha_falls_back_to_browser(portal):
+    portal.app.config['MOCK_OPTIONS']['captcha_prob'] = 1.0
+    client = HttpKeepaliveClient(portal.url, HTTP_API)
+    try:
+        with pytest.raises(HttpKeepaliveError, match='验证码'):
+            client.keepalive('13800000002', 'pw')
+    finally:
+        client.close()
+
+
+def test_manager_uses_http_only_when_api_is_configured(portal, tmp_path, monkeypatch):
+    pytest.importorskip('selenium')
+    pytest.importorskip('webdriver_manager')
+    from improved_account_manager import ImprovedAccountManager
+    monkeypatch.chdir(tmp_path)
+    config = {
+        "accounts": [{"id": 1, "name": "http1", "account": "13800000003", "password": "pw",
+                      "enabled": True, "last_keepalive": "", "status": "未运行"}],
+        "settings": {"portal_url": portal.url, "http_keepalive": True, "ocr_workers": 0},
+        "schedule": {"enabled": False, "interval_minutes": 30, "start_time": "00:00",
+                     "end_time": "23:59", "weekend_enabled": True},
+    }
+    (tmp_path / 'accounts.json').write_text(json.dumps(config), encoding='utf-8')
+    manager = ImprovedAccountManager(str(tmp_path / 'accounts.json'))
+    try:
+        account = manager.config['accounts'][0]
+        # 只打开开关、没有接口配置时不发出任何请求
+        assert manager.use_http_keepalive(account) is False
+        manager.config['settings']['http_api'] = HTTP_API
+        assert manager.use_http_keepalive(account) is True
+        assert manager.attempt_keepalive(account) == (True, None, "")
+        assert account['status'] == "保活成功"
+        assert mock_stats(portal)['connects'] == 1
+    finally:
+        manager.shutdown()
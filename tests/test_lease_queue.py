@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""共享租约队列：同一账号同一时刻只由一个工作进程持有，租约过期后由其他进程接管"""
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lease_queue import LeaseQueue  # noqa: E402
+
+ACCOUNTS = ['13800000001', '13800000002', '13800000003', '13800000004']
+
+
+def open_queue(tmp_path, worker_id, lease_seconds=180):
+    queue = LeaseQueue(str(tmp_path / 'queue.db'), lease_seconds=lease_seconds, worker_id=worker_id)
+    queue.sync(ACCOUNTS)
+    return queue
+
+
+def test_claim_is_exclusive_across_workers(tmp_path):
+    first, second = open_queue(tmp_path, 'a'), open_queue(tmp_path, 'b')
+    try:
+        claimed_a = first.claim(ACCOUNTS, 3)
+        claimed_b = second.claim(ACCOUNTS, 3)
+        assert len(claimed_a) == 3
+        assert [account for account, _ in claimed_b] == sorted(set(ACCOUNTS) - {account for account, _ in claimed_a})
+        assert first.claim(ACCOUNTS, 3) == [] and second.claim(ACCOUNTS, 3) == []
+    finally:
+        first.close()
+        second.close()
+
+
+def test_concurrent_claims_never_overlap(tmp_path):
+    queues = [open_queue(tmp_path, f"w{i}") for i in range(4)]
+    claimed = []
+    lock = threading.Lock()
+
+    def worker(queue):
+        for _ in range(len(ACCOUNTS)):
+            for account, _ in queue.claim(ACCOUNTS, 1):
+                with lock:
+                    claimed.append(account)
+
+    threads = [threading.Thread(target=worker, args=(queue,)) for queue in queues]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(claimed) == ACCOUNTS
+    finally:
+        for queue in queues:
+            queue.close()
+
+
+def test_expired_lease_is_taken_over(tmp_path):
+    crashed, survivor = open_queue(tmp_path, 'crashed', lease_seconds=0.2), open_queue(tmp_path, 'survivor')
+    try:
+        assert crashed.claim(ACCOUNTS[:1], 1) == [(ACCOUNTS[0], 1)]
+        assert survivor.claim(ACCOUNTS[:1], 1) == []
+        time.sleep(0.3)
+        assert survivor.claim(ACCOUNTS[:1], 1) == [(ACCOUNTS[0], 1)]
+        assert survivor.reclaimed == 1
+        # 原持有者的结果不再写入，下次到期时间以接管者为准
+        assert crashed.complete(ACCOUNTS[0], time.time() + 600, 'success') is False
+        assert survivor.complete(ACCOUNTS[0], time.time() + 600, 'success') is True
+        assert crashed.claim(ACCOUNTS[:1], 1) == []
+    finally:
+        crashed.close()
+        survivor.close()
+
+
+def test_renew_keeps_lease_and_release_frees_it(tmp_path):
+    holder, other = open_queue(tmp_path, 'holder', lease_seconds=0.3), open_queue(tmp_path, 'other')
+    try:
+        holder.claim(ACCOUNTS[:1], 1)
+        time.sleep(0.2)
+        holder.renew(ACCOUNTS[:1])
+        time.sleep(0.2)
+        assert other.claim(ACCOUNTS[:1], 1) == []
+        holder.release(ACCOUNTS[:1])
+        assert other.claim(ACCOUNTS[:1], 1) == [(ACCOUNTS[0], 1)]
+        assert other.reclaimed == 0
+    finally:
+        holder.close()
+        other.close()
+
+
+def test_failed_attempt_is_retried_with_next_attempt_number(tmp_path):
+    queue = open_queue(tmp_path, 'a')
+    try:
+        queue.claim(ACCOUNTS[:1], 1)
+        assert queue.complete(ACCOUNTS[0], time.time() - 1, 'timeout', attempt=2)
+        assert queue.claim(ACCOUNTS[:1], 1) == [(ACCOUNTS[0], 2)]
+        queue.update_status(ACCOUNTS[0], '保活成功', '2026-10-16 09:00:00')
+        queue.update_status(ACCOUNTS[0], '失败: timeout')
+        assert queue.get_statuses()[ACCOUNTS[0]] == ('失败: timeout', '2026-10-16 09:00:00')
+    finally:
+        queue.close()
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+条件等待：用显式条件代替固定 sleep，页面就绪即继续，并记录每一步实际等待的时间
+
+步骤(step_plan.StepRunner 和管理器的登录流程)写成生成器，需要等待时 yield 一个 Wait，
+由执行它的等待器决定怎样等：run_steps 配合 StepWaiter 在当前线程中阻塞等待，
+async_orchestrator 配合 AsyncStepWaiter 在事件循环中 await，等待期间不占用线程。
+"""
+import time
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+# 各步骤默认超时时间(秒)，可通过 settings.wait_timeouts 覆盖
+DEFAULT_TIMEOUTS = {
+    'page_load': 10,        # 登录页加载
+    'login_result': 10,     # 点击登录后的跳转/验证码出现
+    'captcha_result': 8,    # 提交验证码后的跳转
+    'session_restore': 5,   # 缓存会话是否有效
+    'desktop_button': 10,   # 云桌面"进入"按钮出现
+    'desktop_url': 30,      # 进入云桌面后的地址跳转
+    'desktop_ready': 20,    # 云桌面画面加载完成
+    'element': 5,           # 其他元素
+}
+
+
+def dom_settled_condition(quiet=1.0):
+    """条件：页面加载完成且 DOM 节点数在 quiet 秒内不再变化"""
+    state = {'snapshot': None, 'since': 0.0}
+
+    def settled(driver):
+        snapshot = driver.execute_script(
+            "return document.readyState + ':' + document.getElementsByTagName('*').length;")
+        now = time.perf_counter()
+        if snapshot != state['snapshot'] or not snapshot.startswith('complete'):
+            state['snapshot'] = snapshot
+            state['since'] = now
+            return False
+        return now - state['since'] >= quiet
+
+    return settled
+
+
+# 取页面上最大的 canvas 缩小到 16x16 采样，像素不全相同即认为远程画面已开始绘制
+# (canvas 元素在画面到达前就已存在，绘制也不会改变 DOM，只能看像素)
+_CANVAS_PAINTED_JS = """
+var best = null;
+var canvases = document.getElementsByTagName('canvas');
+for (var i = 0; i < canvases.length; i++) {
+    var c = canvases[i];
+    if (c.width > 0 && c.height > 0 && (!best || c.width * c.height > best.width * best.height)) best = c;
+}
+if (!best) return false;
+try {
+    var sample = document.createElement('canvas');
+    sample.width = 16; sample.height = 16;
+    var ctx = sample.getContext('2d');
+    ctx.drawImage(best, 0, 0, 16, 16);
+    var data = ctx.getImageData(0, 0, 16, 16).data;
+    for (var j = 4; j < data.length; j += 4) {
+        if (data[j] != data[0] || data[j + 1] != data[1] || data[j + 2] != data[2] || data[j + 3] != data[3]) return true;
+    }
+} catch (e) {}
+return false;
+"""
+
+
+def canvas_painted_condition():
+    """条件：页面上最大的 canvas 已绘制出非单色的画面"""
+    def painted(driver):
+        return bool(driver.execute_script(_CANVAS_PAINTED_JS))
+
+    return painted
+
+
+class Wait:
+    """步骤生成器 yield 的一次等待，由等待器上名为 method 的方法完成，方法的返回值送回生成器"""
+    __slots__ = ('method', 'args')
+
+    def __init__(self, method, *args):
+        self.method = method
+        self.args = args
+
+
+def advance_steps(send, value):
+    """推进一次步骤生成器，返回 (是否结束, 下一个 Wait 或生成器的返回值)"""
+    try:
+        return False, send(value)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+def run_steps(steps, waiter):
+    """在当前线程中执行步骤生成器，返回生成器的返回值；等待抛出的异常会抛回生成器"""
+    send, value = steps.send, None
+    while True:
+        done, wait = advance_steps(send, value)
+        if done:
+            return wait
+        try:
+            send, value = steps.send, getattr(waiter, wait.method)(*wait.args)
+        except Exception as e:
+            send, value = steps.throw, e
+
+
+class StepWaiter:
+    def __init__(self, driver, timeouts=None, log=None, poll=0.25):
+        """
+        timeouts: 覆盖 DEFAULT_TIMEOUTS 中的超时时间
+        log: 日志函数，接收一条字符串
+        poll: 条件轮询间隔(秒)
+        """
+        self.driver = driver
+        self.timeouts = dict(DEFAULT_TIMEOUTS)
+        if timeouts:
+            self.timeouts.update(timeouts)
+        self.log = log
+        self.poll = poll
+        self.timings = []  # [(步骤, 等待秒数, 是否就绪)]
+
+    def get_timeout(self, key, timeout=None):
+        if timeout is not None:
+            return timeout
+        return self.timeouts.get(key, self.timeouts['element'])
+
+    def until(self, condition, step, timeout_key='element', timeout=None, required=True):
+        """
+        等待 condition(driver) 返回真值，记录耗时
+        required=True 时超时抛出 TimeoutException，否则返回 None
+        """
+        timeout = self.get_timeout(timeout_key, timeout)
+        start = time.perf_counter()
+        try:
+            result = WebDriverWait(self.driver, timeout, poll_frequency=self.poll).until(condition)
+            ok = True
+        except TimeoutException:
+            result = None
+            ok = False
+        self.record(step, time.perf_counter() - start, ok, timeout)
+        if not ok and required:
+            raise TimeoutException(f"等待超时: {step} ({timeout}秒)")
+        return result
+
+    def present(self, locator, step, timeout_key='element', timeout=None, required=True):
+        """等待元素出现"""
+        return self.until(EC.presence_of_element_located(locator), step, timeout_key, timeout, required)
+
+    def clickable(self, locator, step, timeout_key='element', timeout=None, required=True):
+        """等待元素可点击"""
+        return self.until(EC.element_to_be_clickable(locator), step, timeout_key, timeout, required)
+
+    def url_contains(self, fragment, step, timeout_key='element', timeout=None):
+        """等待地址包含 fragment，返回是否等到"""
+        return bool(self.until(EC.url_contains(fragment), step, timeout_key, timeout, required=False))
+
+    def any_of(self, conditions, step, timeout_key='element', timeout=None, required=True):
+        """等待多个条件中任意一个满足"""
+        return self.until(EC.any_of(*conditions), step, timeout_key, timeout, required)
+
+    def dom_settled(self, step, timeout_key='element', timeout=None, quiet=1.0):
+        """等待页面加载完成且 DOM 节点数在 quiet 秒内不再变化，返回是否等到"""
+        return bool(self.until(dom_settled_condition(quiet), step, timeout_key, timeout, required=False))
+
+    def dwell(self, step, seconds):
+        """固定停留 seconds 秒(保持云桌面连接)，同样记录在等待汇总中"""
+        if seconds > 0:
+            time.sleep(seconds)
+            self.record(step, seconds, True, seconds)
+
+    def result(self, future, timeout):
+        """等待 concurrent.futures.Future 的结果(验证码识别、网页输入)，超时抛出 TimeoutError"""
+        return future.result(timeout)
+
+    def record(self, step, elapsed, ok, timeout):
+        """记录一次等待（供异步等待复用）"""
+        self.timings.append((step, elapsed, ok))
+        if self.log:
+            self.log(f"等待[{step}] {elapsed:.2f}秒 ({'就绪' if ok else f'超时{timeout}秒'})")
+
+    def summary(self):
+        """各步骤等待时间汇总"""
+        return ", ".join(f"{step} {elapsed:.1f}秒{'' if ok else '(超时)'}" for step, elapsed, ok in self.timings)
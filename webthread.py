@@ -1,47 +1,170 @@
-from flask import Flask,render_template,request
-from queue import Queue
+from flask import Flask,Response,render_template,request,jsonify,abort,g
+from queue import Queue, Empty
+from concurrent.futures import Future
+import json
 import threading
+import time
+import uuid
+import metrics
 
 app = Flask(__name__)
 global __g_verifyCodeQueue
+__g_verifyCodeQueue=None
+
+#每个进程只启动一个 Web 服务，所有保活会话共用(验证码转发、/metrics、/healthz)
+_server=None
+_server_stop=None
+_server_thread=None
+_server_lock=threading.Lock()
+_server_info={}
+
+#每个 SSE 连接在整个连接期间占用一个服务线程：waitress 的线程数固定，限制同时打开的连接数，
+#避免打开的验证码页面占满线程、/metrics 和 /healthz 无法响应(werkzeug 每个连接一个新线程，不限制，_sse_slots 为 None)；
+#两种服务都在 SSE_MAX_SECONDS 后结束连接(浏览器的 EventSource 会自动重连)
+SSE_MAX_SECONDS=300
+_sse_slots=None
+
+
+class Challenge:
+    """一次待输入的验证码：图片只保存在内存中，输入的验证码通过 future 交给等待的会话"""
+    def __init__(self, account, image_bytes):
+        self.id = uuid.uuid4().hex[:12]
+        self.account = account
+        self.image_bytes = image_bytes
+        self.created = time.time()
+        self.future = Future()
+
+    def to_dict(self):
+        return {'id': self.id, 'account': self.account, 'created': self.created}
+
+
+class CaptchaRelay:
+    """按账号和验证码编号转发网页输入的验证码，新验证码通过 SSE 推送到网页"""
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.challenges = {}    # 编号 -> Challenge
+        self.subscribers = []   # 每个 SSE 连接一个 Queue
+        self.stats = {'opened': 0, 'resolved': 0, 'expired': 0, 'wait_seconds': 0.0}
+
+    def _publish(self, event, data):
+        message = f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            q.put(message)
+
+    def open(self, account, image_bytes):
+        """登记一张待输入的验证码，返回 Challenge，等待 challenge.future 取得输入"""
+        challenge = Challenge(account, image_bytes)
+        with self.lock:
+            self._expire()
+            self.challenges[challenge.id] = challenge
+            self.stats['opened'] += 1
+        self._publish('challenge', challenge.to_dict())
+        return challenge
+
+    def resolve(self, challenge_id, code):
+        """网页提交验证码，等待中的会话立即收到；编号不存在或已处理时返回 False"""
+        with self.lock:
+            challenge = self.challenges.pop(challenge_id, None)
+            if challenge is None or challenge.future.done():
+                return False
+            waited = time.time() - challenge.created
+            self.stats['resolved'] += 1
+            self.stats['wait_seconds'] += waited
+        metrics.CAPTCHA_RELAY_SECONDS.observe(waited)
+        challenge.future.set_result(code)
+        self._publish('resolved', {'id': challenge_id})
+        return True
+
+    def close(self, challenge_id):
+        """会话不再需要该验证码(已自动识别或超时)，从网页上移除"""
+        with self.lock:
+            challenge = self.challenges.pop(challenge_id, None)
+        if challenge is not None:
+            challenge.future.cancel()
+            self._publish('resolved', {'id': challenge_id})
+
+    def _expire(self):
+        now = time.time()
+        for challenge_id in [cid for cid, c in self.challenges.items() if now - c.created > self.ttl]:
+            self.challenges.pop(challenge_id).future.cancel()
+            self.stats['expired'] += 1
+
+    def get(self, challenge_id):
+        with self.lock:
+            return self.challenges.get(challenge_id)
+
+    def pending(self):
+        with self.lock:
+            self._expire()
+            return [c.to_dict() for c in sorted(self.challenges.values(), key=lambda c: c.created)]
+
+    def subscribe(self):
+        q = Queue()
+        with self.lock:
+            self.subscribers.append(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            if q in self.subscribers:
+                self.subscribers.remove(q)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats, pending=len(self.challenges), subscribers=len(self.subscribers))
+        stats['avg_wait_seconds'] = stats['wait_seconds'] / stats['resolved'] if stats['resolved'] else 0.0
+        return stats
+
+
+relay = CaptchaRelay()
+
+
+@app.before_request
+def start_timer():
+    g.request_start=time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    #按路由规则统计，验证码编号等路径参数不会产生新的标签
+    rule=request.url_rule.rule if request.url_rule else 'unmatched'
+    if response.mimetype!='text/event-stream':
+        metrics.HTTP_REQUEST_SECONDS.observe(time.perf_counter()-g.get('request_start',time.perf_counter()),route=rule)
+    metrics.HTTP_REQUESTS_TOTAL.inc(route=rule,status=str(response.status_code))
+    return response
+
 
 @app.route('/')
 @app.route('/ctyun')
 def index(name=None):
-    page='''
-    <html><head><title>天翼云电脑登录验证码获取</title></head>
-    <meta name="viewport" content="width=device-width" initial-scale="1"/>
-    <style>
-     .box{
-        display:-webkit-flex;
-        display:flex;
-        }
-    </style>
-    <body>
-    <h2>天翼云电脑登录验证码获取</h2>
-    <form action='/ctyuncode' method='POST'>
-      <div class="box">请输入验证码:<input type=text name='code' maxlength=8 size=8></div>
-      <input type=submit name=submit value='提交'>
-      <img src='ctyun.png' border=0/>
-    </form>
-    </body></html>
-'''
-    return render_template('index.html')
+    return render_template('index.html', challenges=relay.pending())
 
 @app.route('/ctyuncode',methods=['POST'])
 def get_ctyuncode(name=None):
-    #global __g_verifyCodeQueue
     code=request.form.get('code')
-    __g_verifyCodeQueue.put(code)
-    print(code)
+    challenge_id=request.form.get('challenge')
+    pending=relay.pending()
+    if not challenge_id and len(pending)==1:
+        challenge_id=pending[0]['id']   #只有一个待输入的验证码时可以不带编号
+    if challenge_id:
+        ok=relay.resolve(challenge_id,code)
+    elif __g_verifyCodeQueue is not None:
+        __g_verifyCodeQueue.put(code)   #兼容旧的单队列调用方式
+        ok=True
+    else:
+        ok=False
+    if request.headers.get('Accept','').startswith('application/json'):
+        return jsonify({'ok':ok})
 
     page='''
     <html><head><title>天翼云电脑登录验证码获取结果</title></head>
     <meta name="viewport" content="width=device-width" initial-scale="1"/>
     <style>
     div{
-        text-align:center;    
-    >
+        text-align:center;
+    }
     </style>
     <body>
     <h2>天翼云电脑登录验证码获取结果：</h2>
@@ -49,19 +172,102 @@ def get_ctyuncode(name=None):
     <div><a href="/">返 回</a></div>
     </body></html>
     '''
-    page=page%(code)
+    page=page%(code if ok else '验证码已过期或已处理')
     return page
 
-def web_run(q:Queue,port=8000):
-    global __g_verifyCodeQueue
-    __g_verifyCodeQueue=q
-    server_thread = threading.Thread(target=app.run,args=('0.0.0.0',port,False,))
-    server_thread.daemon = True
-    server_thread.start()
-    return server_thread
+@app.route('/captcha/<challenge_id>.png')
+def get_captcha_image(challenge_id):
+    #验证码图片直接从内存返回，不写入 static/
+    challenge=relay.get(challenge_id)
+    if challenge is None:
+        abort(404)
+    return Response(challenge.image_bytes, mimetype='image/png', headers={'Cache-Control':'no-store'})
+
+@app.route('/captcha/events')
+def captcha_events():
+    #SSE：连接后先推送当前待输入的验证码，之后有新验证码或已处理时推送
+    slots=_sse_slots
+    if slots is not None and not slots.acquire(blocking=False):
+        #连接数已满，页面稍后重试
+        return Response('too many event streams', status=503, headers={'Retry-After':'30'})
+    q=relay.subscribe()
+    def stream():
+        deadline=time.monotonic()+SSE_MAX_SECONDS
+        yield "retry: 3000\n\n"
+        for challenge in relay.pending():
+            yield f"event: challenge\ndata: {json.dumps(challenge, ensure_ascii=False)}\n\n"
+        while time.monotonic()<deadline:
+            try:
+                yield q.get(timeout=15)
+            except Empty:
+                yield ": keepalive\n\n"
+    def release():
+        relay.unsubscribe(q)
+        if slots is not None:
+            slots.release()
+    response=Response(stream(), mimetype='text/event-stream', headers={'Cache-Control':'no-cache','X-Accel-Buffering':'no'})
+    #连接关闭(包括客户端断开)时归还名额；生成器未开始执行时 finally 不会运行，因此不放在生成器里
+    response.call_on_close(release)
+    return response
+
+@app.route('/healthz')
+def healthz():
+    return jsonify(dict(_server_info,status='ok',uptime_seconds=round(time.time()-_server_info.get('started',time.time()),1),
+                        captcha=relay.get_stats()))
+
+@app.route('/metrics')
+def get_metrics():
+    #Prometheus 抓取接口
+    return Response(metrics.REGISTRY.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+def _make_server(host,port,threads):
+    """安装了 waitress 时使用 waitress，否则使用 werkzeug 的多线程服务"""
+    try:
+        from waitress import create_server
+        server=create_server(app,host=host,port=port,threads=threads)
+        return server,server.run,server.close,'waitress'
+    except ImportError:
+        from werkzeug.serving import make_server
+        server=make_server(host,port,app,threaded=True)
+        return server,server.serve_forever,server.shutdown,'werkzeug'
+
+def web_run(q:Queue=None,port=8000,host='0.0.0.0',threads=16):
+    """
+    启动 Web 服务并返回服务线程；同一进程内重复调用直接返回已启动的服务
+    threads: waitress 的工作线程数，每个打开的验证码页面(SSE)占用一个，最多 threads/4 个 SSE 连接；
+             werkzeug 按连接创建线程，不使用该参数，也不限制 SSE 连接数
+    """
+    global __g_verifyCodeQueue,_server,_server_stop,_server_thread,_sse_slots
+    if q is not None:
+        __g_verifyCodeQueue=q
+    with _server_lock:
+        if _server_thread is not None and _server_thread.is_alive():
+            if port!=_server_info.get('port'):
+                print(f"Web服务已在端口{_server_info.get('port')}运行，忽略端口{port}")
+            return _server_thread
+        try:
+            _server,serve,_server_stop,kind=_make_server(host,port,threads)
+        except OSError as e:
+            print(f"Web服务启动失败(端口{port}): {e}")
+            return None
+        _sse_slots=threading.BoundedSemaphore(max(1,threads//4)) if kind=='waitress' else None
+        _server_info.clear()
+        _server_info.update(server=kind,port=port,started=time.time())
+        _server_thread=threading.Thread(target=serve,name='webthread',daemon=True)
+        _server_thread.start()
+        return _server_thread
+
+def web_stop():
+    """停止 Web 服务(测试或程序退出时使用)"""
+    global _server,_server_stop,_server_thread
+    with _server_lock:
+        if _server_stop is not None:
+            _server_stop()
+        if _server_thread is not None:
+            _server_thread.join(5)
+        _server,_server_stop,_server_thread=None,None,None
 
 
 if __name__ == '__main__':
     __g_verifyCodeQueue=Queue()
-    app.run(debug = True,host='0.0.0.0',port=8000)
-    __g_verifyCodeQueue.task_done()
\ No newline at end of file
+    app.run(debug = True,host='0.0.0.0',port=8000,threaded=True)
@@ -6,7 +6,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[('accounts_config.json', '.'), ('my.json', '.'), ('msedgedriver.exe', '.'), ('static', 'static'), ('logs', 'logs')],
-    hiddenimports=['tkinter', 'tkinter.ttk', 'tkinter.scrolledtext', 'tkinter.filedialog', 'tkinter.messagebox', 'selenium', 'selenium.webdriver', 'selenium.webdriver.edge', 'selenium.webdriver.common', 'requests', 'muggle_ocr', 'PIL', 'logging', 'json', 'threading', 'schedule'],
+    hiddenimports=['tkinter', 'tkinter.ttk', 'tkinter.scrolledtext', 'tkinter.filedialog', 'tkinter.messagebox', 'selenium', 'selenium.webdriver', 'selenium.webdriver.edge', 'selenium.webdriver.common', 'requests', 'waitress', 'muggle_ocr', 'PIL', 'logging', 'json', 'threading', 'schedule'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],